@@ -1,8 +1,11 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, send_file, abort
+from flask import (Flask, render_template, request, redirect, url_for, flash, jsonify, abort,
+                   send_from_directory)
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm import joinedload
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 from flask_wtf import FlaskForm
 from flask_wtf.file import FileField, FileAllowed, FileRequired
+from flask_wtf.csrf import generate_csrf
 from wtforms import StringField, TextAreaField, PasswordField, SelectField, BooleanField, SubmitField
 from wtforms.validators import DataRequired, Length, Email, EqualTo, Optional
 from werkzeug.security import generate_password_hash, check_password_hash
@@ -10,17 +13,42 @@ from werkzeug.utils import secure_filename
 from datetime import datetime, timedelta
 import os
 import uuid
+import json
+import zlib
+import atexit
+from urllib.parse import quote
+from types import SimpleNamespace
+from collections import Counter
 from mutagen import File as MutagenFile
 from PIL import Image
 import pymysql
 import logging
+import numpy as np
 from config import config
 from utils import (
-    setup_logging, validate_audio_file, validate_image_file,
-    compress_and_resize_image, generate_unique_filename,
-    get_audio_metadata_safe, create_audio_placeholder_files,
+    setup_logging, validate_image_file, generate_unique_filename,
+    create_audio_placeholder_files, save_audio_upload, save_audio_file,
+    process_image_task, image_derivative_name, IMAGE_DERIVATIVES_DIR, IMAGE_SIZES,
     allowed_file, format_duration, AudioProcessingError, ImageProcessingError
 )
+from streaming import build_range_response, build_stream_response, stat_stream_file
+from cache import LRUCache, SnapshotCache
+from playback import PlaybackBuffer
+from search import create_search_backend
+from pagination import keyset_paginate
+from ordering import rank_between, spaced_ranks
+from recommend import cooccurrence_delta, sum_pairs, top_k_similar
+from zipstream import (ZipLayout, build_crc_task, build_m3u, data_member, file_member, read_crc32,
+                       remove_crc32, safe_member_name, stored_crc32)
+from jobs import JobQueue
+from storage import blob_abspath, blob_lock, blob_releasable, blob_sha256, is_blob_path, remove_blob
+from resumable import ResumableUploadStore, UploadError
+from transcode import build_renditions_task, choose_quality, find_encoder
+from segments import (build_segments_task, build_m3u8, is_segment_name, load_segments_index,
+                      remove_segments, segment_name, segments_dir, segments_key, SEGMENT_MIMETYPE)
+from seekindex import (build_seek_index_task, load_seek_index, remove_seek_index,
+                       seek_format, seek_index_path, seek_position)
+from peaks import build_peaks_task, can_decode, peaks_path, read_peaks, remove_peaks
 
 # Configuración de la aplicación
 app = Flask(__name__)
@@ -34,6 +62,15 @@ login_manager.login_view = 'login'
 login_manager.login_message = 'Por favor inicia sesión para acceder a esta página.'
 login_manager.login_message_category = 'info'
 
+# Token CSRF disponible en plantillas (playlists.html lo usa en su formulario)
+app.jinja_env.globals['csrf_token'] = generate_csrf
+
+def imagen_url(tipo, key, tamano, formato='jpg'):
+    """URL de un derivado de imagen (ej: imagen_url('covers', key, 'card', 'webp'))"""
+    return url_for('imagen_derivada', tipo=tipo, nombre=image_derivative_name(key, tamano, formato))
+
+app.jinja_env.globals['imagen_url'] = imagen_url
+
 # Configurar logging
 setup_logging(app)
 
@@ -43,12 +80,55 @@ os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'music'), exist_ok=True)
 os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'covers'), exist_ok=True)
 os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'avatars'), exist_ok=True)
 
+# Caché de archivos servibles por canción (evita BD y stat en cada /stream)
+stream_cache = LRUCache(maxsize=app.config['STREAM_CACHE_SIZE'],
+                        ttl=app.config['STREAM_CACHE_TTL'])
+
+# Índices de búsqueda tiempo→byte por archivo (False = el archivo no tiene índice)
+seek_cache = LRUCache(maxsize=app.config['STREAM_CACHE_SIZE'],
+                      ttl=app.config['STREAM_CACHE_TTL'])
+
+# Colas de /api/radio por canción semilla: id -> [ids en orden]
+radio_cache = LRUCache(maxsize=app.config['RADIO_CACHE_SIZE'], ttl=app.config['RADIO_CACHE_TTL'])
+
+# Caché de identidades para Flask-Login (evita una consulta por petición)
+user_cache = LRUCache(maxsize=app.config['USER_CACHE_SIZE'],
+                      ttl=app.config['USER_CACHE_TTL'])
+
+# JSON precalculado de cada canción para /api/canciones: id -> (versión, fragmento)
+catalogo_cache = LRUCache(maxsize=app.config['CATALOG_JSON_CACHE_SIZE'])
+
+# Caché de totales para la paginación por cursor
+count_cache = LRUCache(maxsize=256, ttl=app.config['PAGINATION_COUNT_TTL'])
+
+# Subidas reanudables en curso (estado en disco, compartido entre workers)
+subidas = ResumableUploadStore(app.config['RESUMABLE_UPLOAD_DIR'],
+                               max_size=app.config['RESUMABLE_UPLOAD_MAX_SIZE'],
+                               chunk_max=app.config['RESUMABLE_CHUNK_SIZE'] * 2,
+                               ttl=app.config['RESUMABLE_UPLOAD_TTL'])
+
 # Crear archivos placeholder para desarrollo
 if app.config['DEBUG']:
-    create_audio_placeholder_files()
+    create_audio_placeholder_files(app.config['UPLOAD_FOLDER'])
 
 # Modelos de la base de datos
-class Usuario(UserMixin, db.Model):
+class PermisosUsuarioMixin:
+    """Métodos de rol compartidos por Usuario y su versión cacheada para la sesión"""
+    
+    @property
+    def nombre_completo(self):
+        return f"{self.nombre} {self.apellidos}"
+    
+    def es_docente(self):
+        return self.rol == 'docente'
+    
+    def es_admin(self):
+        return self.rol == 'admin'
+    
+    def puede_subir_musica(self):
+        return self.rol in ['admin', 'docente']
+
+class Usuario(PermisosUsuarioMixin, UserMixin, db.Model):
     __tablename__ = 'usuarios'
     
     id = db.Column(db.Integer, primary_key=True)
@@ -61,6 +141,9 @@ class Usuario(UserMixin, db.Model):
     seccion = db.Column(db.String(10), nullable=True)  # Solo para estudiantes
     especialidad = db.Column(db.String(100), nullable=True)  # Solo para docentes
     avatar = db.Column(db.String(255), nullable=True)
+    avatar_key = db.Column(db.String(32), nullable=True)  # Derivados en uploads/avatars/d
+    avatar_placeholder = db.Column(db.Text, nullable=True)
+    calidad_audio = db.Column(db.String(20), nullable=True)  # Nivel de AUDIO_QUALITY, 'original' o None (automática)
     activo = db.Column(db.Boolean, default=True)
     fecha_registro = db.Column(db.DateTime, default=datetime.utcnow)
     ultimo_acceso = db.Column(db.DateTime, default=datetime.utcnow)
@@ -75,19 +158,23 @@ class Usuario(UserMixin, db.Model):
     
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
+
+class UsuarioSesion(PermisosUsuarioMixin, UserMixin):
+    """
+    Copia ligera de Usuario, desligada de la sesión de SQLAlchemy, que
+    Flask-Login usa como current_user (se guarda en la caché de identidades)
+    """
     
-    @property
-    def nombre_completo(self):
-        return f"{self.nombre} {self.apellidos}"
-    
-    def es_docente(self):
-        return self.rol == 'docente'
+    CAMPOS = ('id', 'email', 'nombre', 'apellidos', 'rol', 'grado', 'seccion',
+              'especialidad', 'avatar', 'avatar_key', 'avatar_placeholder', 'calidad_audio', 'activo')
     
-    def es_admin(self):
-        return self.rol == 'admin'
+    def __init__(self, usuario):
+        for campo in self.CAMPOS:
+            setattr(self, campo, getattr(usuario, campo))
     
-    def puede_subir_musica(self):
-        return self.rol in ['admin', 'docente']
+    @property
+    def is_active(self):
+        return bool(self.activo)
 
 class Cancion(db.Model):
     __tablename__ = 'canciones'
@@ -98,9 +185,12 @@ class Cancion(db.Model):
     album = db.Column(db.String(200), nullable=True)
     genero = db.Column(db.String(50), nullable=True)
     año = db.Column(db.Integer, nullable=True)
-    duracion = db.Column(db.Integer, nullable=True)  # en segundos
-    archivo_audio = db.Column(db.String(255), nullable=False)
+    # active_history: conservar la duración anterior para ajustar los agregados de playlists
+    duracion = db.column_property(db.Column(db.Integer, nullable=True), active_history=True)  # en segundos
+    archivo_audio = db.Column(db.String(255), nullable=False, index=True)  # ab/cd/<sha256>.ext
     cover_image = db.Column(db.String(255), nullable=True)
+    cover_key = db.Column(db.String(32), nullable=True)  # Derivados en uploads/covers/d
+    cover_placeholder = db.Column(db.Text, nullable=True)  # Data URI borroso de ~200 bytes
     descripcion = db.Column(db.Text, nullable=True)
     materia = db.Column(db.String(100), nullable=True)  # Matemáticas, Ciencias, etc.
     grado_objetivo = db.Column(db.String(20), nullable=True)  # Para qué grado es la canción
@@ -108,9 +198,22 @@ class Cancion(db.Model):
     fecha_subida = db.Column(db.DateTime, default=datetime.utcnow)
     activo = db.Column(db.Boolean, default=True)
     reproducciones_totales = db.Column(db.Integer, default=0)
+    # Estado del procesamiento en segundo plano (portada, derivados)
+    estado = db.Column(db.Enum('procesando', 'listo', 'error'),
+                       default='listo', nullable=False, server_default='listo')
+    segmentos = db.Column(db.Integer, nullable=True)  # Segmentos generados (None = sin segmentar)
+    # Versión del catálogo en la última modificación (deltas de /api/canciones?since=)
+    version_catalogo = db.Column(db.Integer, nullable=False, default=0, server_default='0', index=True)
+    
+    # Índice para la paginación por cursor (activo, fecha_subida, id)
+    __table_args__ = (
+        db.Index('ix_canciones_activo_fecha', 'activo', 'fecha_subida', 'id'),
+    )
     
     # Relaciones
     reproducciones = db.relationship('Reproduccion', backref='cancion', lazy='dynamic')
+    versiones = db.relationship('VersionAudio', backref='cancion', lazy='select',
+                                cascade='all, delete-orphan')
     
     @property
     def duracion_formato(self):
@@ -120,6 +223,193 @@ class Cancion(db.Model):
             return f"{minutos}:{segundos:02d}"
         return "0:00"
 
+class VersionAudio(db.Model):
+    """Versión transcodificada de una canción para un nivel de AUDIO_QUALITY"""
+    __tablename__ = 'versiones_audio'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    cancion_id = db.Column(db.Integer, db.ForeignKey('canciones.id'), nullable=False)
+    calidad = db.Column(db.String(20), nullable=False)  # high, medium, low...
+    archivo = db.Column(db.String(255), nullable=False, index=True)  # Blob en uploads/music
+    formato = db.Column(db.String(10), nullable=False)
+    bitrate = db.Column(db.Integer, nullable=False)  # kbps
+    tamano = db.Column(db.BigInteger, nullable=False)  # bytes
+    fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('cancion_id', 'calidad', name='uq_version_cancion_calidad'),
+    )
+
+@db.event.listens_for(Cancion, 'after_insert')
+@db.event.listens_for(Cancion, 'after_update')
+@db.event.listens_for(Cancion, 'after_delete')
+def invalidar_stream_cache(mapper, connection, target):
+    """Invalidar la caché de streaming al subir, desactivar o reemplazar una canción"""
+    stream_cache.pop(target.id)
+
+@db.event.listens_for(VersionAudio, 'after_insert')
+@db.event.listens_for(VersionAudio, 'after_update')
+@db.event.listens_for(VersionAudio, 'after_delete')
+def invalidar_stream_cache_por_version(mapper, connection, target):
+    stream_cache.pop(target.cancion_id)
+
+class Contador(db.Model):
+    """Contadores atómicos (versión del catálogo)"""
+    __tablename__ = 'contadores'
+    
+    nombre = db.Column(db.String(50), primary_key=True)
+    valor = db.Column(db.BigInteger, nullable=False, default=0)
+
+# Versión del catálogo: contador creciente que se asigna a cada canción modificada
+def reservar_versiones_catalogo(session, cantidad=1):
+    """
+    Reservar `cantidad` versiones consecutivas del catálogo
+    
+    El UPDATE ... SET valor = valor + n bloquea la fila del contador hasta el
+    fin de la transacción: dos escritores nunca obtienen la misma versión y
+    las versiones se confirman en orden, así que un cliente de ?since= no se
+    salta cambios que otra transacción confirme más tarde.
+    
+    Returns:
+        int: Primera versión reservada (las siguientes cantidad - 1 también)
+    """
+    contador = Contador.__table__
+    with session.no_autoflush:
+        resultado = session.execute(
+            contador.update().where(contador.c.nombre == 'catalogo')
+                    .values(valor=contador.c.valor + cantidad))
+        if not resultado.rowcount:
+            # Primera vez: continuar desde la versión más alta ya asignada
+            # (la clave primaria impide que dos procesos creen la fila a la vez)
+            inicial = session.scalar(db.select(db.func.max(Cancion.version_catalogo))) or 0
+            session.execute(contador.insert().values(nombre='catalogo', valor=inicial + cantidad))
+        valor = session.scalar(db.select(contador.c.valor).where(contador.c.nombre == 'catalogo'))
+    return valor - cantidad + 1
+
+def version_catalogo_actual(session):
+    """Última versión reservada (cambia con cada alta, modificación o baja)"""
+    return session.scalar(db.select(Contador.valor).where(Contador.nombre == 'catalogo')) or 0
+
+@db.event.listens_for(db.session, 'before_flush')
+def versionar_catalogo(session, flush_context, instances):
+    """Dar una versión nueva a las canciones creadas o con columnas modificadas"""
+    cambiadas = [obj for obj in session.new if isinstance(obj, Cancion)]
+    cambiadas += [obj for obj in session.dirty
+                  if isinstance(obj, Cancion) and session.is_modified(obj, include_collections=False)]
+    eliminadas = any(isinstance(obj, Cancion) for obj in session.deleted)
+    if not cambiadas and not eliminadas:
+        return
+    # Las bajas también consumen una versión para que cambie la ETag del catálogo
+    version = reservar_versiones_catalogo(session, max(len(cambiadas), 1))
+    for cancion in cambiadas:
+        cancion.version_catalogo = version
+        version += 1
+
+@db.event.listens_for(Cancion, 'after_insert')
+@db.event.listens_for(Cancion, 'after_update')
+@db.event.listens_for(Cancion, 'after_delete')
+def invalidar_catalogo_cache(mapper, connection, target):
+    catalogo_cache.pop(target.id)
+
+# Conteo de referencias de los audios (varias canciones pueden compartir un blob)
+def liberar_audio_si_huerfano(archivo, reserva=None):
+    """
+    Eliminar un blob de audio si ninguna canción ni versión lo referencia
+    
+    Args:
+        archivo: Ruta relativa del blob
+        reserva: La de reserve_blob al deshacer una subida fallida; sin ella
+            se conservan los blobs reutilizados hace menos de AUDIO_BLOB_GRACE
+    """
+    if not is_blob_path(archivo):
+        return False
+    music_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'music')
+    ruta = blob_abspath(music_dir, archivo)
+    # Con el bloqueo tomado ninguna subida puede reutilizar el blob mientras se decide
+    with blob_lock(music_dir, blob_sha256(archivo)):
+        if not blob_releasable(music_dir, archivo, reserva, app.config['AUDIO_BLOB_GRACE']):
+            return False
+        with db.engine.connect() as connection:
+            referencias = sum(
+                connection.scalar(
+                    db.select(db.func.count()).select_from(tabla).where(columna == archivo)
+                )
+                for tabla, columna in ((Cancion.__table__, Cancion.__table__.c.archivo_audio),
+                                       (VersionAudio.__table__, VersionAudio.__table__.c.archivo))
+            )
+        if referencias:
+            return False
+        remove_segments(music_dir, segments_key(archivo))
+        remove_seek_index(ruta)
+        remove_peaks(ruta)
+        remove_crc32(ruta)
+        return remove_blob(music_dir, archivo)
+
+def _marcar_audios_liberados(target, archivos):
+    """Recordar audios que pueden quedar sin referencias (se revisan tras el commit)"""
+    session = db.object_session(target)
+    if session is not None:
+        session.info.setdefault('audios_liberados', set()).update(a for a in archivos if a)
+
+@db.event.listens_for(Cancion, 'after_delete')
+def audio_liberado_al_eliminar(mapper, connection, target):
+    _marcar_audios_liberados(target, [target.archivo_audio])
+
+@db.event.listens_for(Cancion, 'after_update')
+def audio_liberado_al_reemplazar(mapper, connection, target):
+    _marcar_audios_liberados(target, db.inspect(target).attrs.archivo_audio.history.deleted)
+
+@db.event.listens_for(VersionAudio, 'after_delete')
+def version_liberada_al_eliminar(mapper, connection, target):
+    _marcar_audios_liberados(target, [target.archivo])
+
+@db.event.listens_for(VersionAudio, 'after_update')
+def version_liberada_al_reemplazar(mapper, connection, target):
+    _marcar_audios_liberados(target, db.inspect(target).attrs.archivo.history.deleted)
+
+@db.event.listens_for(db.session, 'after_commit')
+def eliminar_audios_huerfanos(session):
+    for archivo in session.info.pop('audios_liberados', ()):
+        try:
+            liberar_audio_si_huerfano(archivo)
+        except Exception as e:
+            app.logger.error(f'Error al liberar audio {archivo}: {str(e)}')
+
+@db.event.listens_for(db.session, 'after_soft_rollback')
+def descartar_audios_liberados(session, previous_transaction):
+    session.info.pop('audios_liberados', None)
+
+# Índice de búsqueda de canciones (FULLTEXT / FTS5 / memoria)
+def _cargar_indice_busqueda():
+    with app.app_context():
+        return db.session.execute(
+            db.select(Cancion.id, Cancion.titulo, Cancion.artista, Cancion.album)
+              .where(Cancion.activo == True)
+        ).all()
+
+search_backend = create_search_backend(app.config['SQLALCHEMY_DATABASE_URI'], Cancion,
+                                       backend=app.config['SEARCH_BACKEND'],
+                                       loader=_cargar_indice_busqueda)
+
+@db.event.listens_for(Cancion.__table__, 'after_create')
+def crear_indice_busqueda(target, connection, **kw):
+    search_backend.create_index(connection)
+
+@db.event.listens_for(Cancion.__table__, 'before_drop')
+def eliminar_indice_busqueda(target, connection, **kw):
+    if hasattr(search_backend, 'drop_index'):
+        search_backend.drop_index(connection)
+
+@db.event.listens_for(Cancion, 'after_insert')
+@db.event.listens_for(Cancion, 'after_update')
+def actualizar_indice_busqueda(mapper, connection, target):
+    """Mantener el índice sincronizado al subir, editar o desactivar canciones"""
+    search_backend.on_change(connection, target)
+
+@db.event.listens_for(Cancion, 'after_delete')
+def quitar_de_indice_busqueda(mapper, connection, target):
+    search_backend.on_delete(connection, target)
+
 class Playlist(db.Model):
     __tablename__ = 'playlists'
     
@@ -127,25 +417,24 @@ class Playlist(db.Model):
     nombre = db.Column(db.String(200), nullable=False)
     descripcion = db.Column(db.Text, nullable=True)
     cover_image = db.Column(db.String(255), nullable=True)
+    cover_key = db.Column(db.String(32), nullable=True)
+    cover_placeholder = db.Column(db.Text, nullable=True)
     publica = db.Column(db.Boolean, default=False)
     creado_por = db.Column(db.Integer, db.ForeignKey('usuarios.id'), nullable=False)
     fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow)
     activa = db.Column(db.Boolean, default=True)
     
-    # Relaciones
-    canciones = db.relationship('PlaylistCancion', backref='playlist', lazy='dynamic', cascade='all, delete-orphan')
+    # Índice para la paginación por cursor de playlists públicas
+    __table_args__ = (
+        db.Index('ix_playlists_publica_fecha', 'publica', 'activa', 'fecha_creacion', 'id'),
+    )
     
-    @property
-    def total_canciones(self):
-        return self.canciones.count()
+    # Agregados desnormalizados (mantenidos por eventos de PlaylistCancion y Cancion)
+    total_canciones = db.Column(db.Integer, default=0, nullable=False, server_default='0')
+    duracion_total = db.Column(db.Integer, default=0, nullable=False, server_default='0')  # en segundos
     
-    @property
-    def duracion_total(self):
-        total = 0
-        for pc in self.canciones:
-            if pc.cancion.duracion:
-                total += pc.cancion.duracion
-        return total
+    # Relaciones
+    canciones = db.relationship('PlaylistCancion', backref='playlist', lazy='dynamic', cascade='all, delete-orphan')
 
 class PlaylistCancion(db.Model):
     __tablename__ = 'playlist_canciones'
@@ -153,9 +442,14 @@ class PlaylistCancion(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     playlist_id = db.Column(db.Integer, db.ForeignKey('playlists.id'), nullable=False)
     cancion_id = db.Column(db.Integer, db.ForeignKey('canciones.id'), nullable=False)
-    orden = db.Column(db.Integer, nullable=False)
+    orden = db.Column(db.Integer, nullable=False)  # Posición dispersa (ver ordering.py)
     fecha_agregada = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Lecturas en orden y búsqueda de vecinos directamente sobre el índice
+    __table_args__ = (
+        db.Index('ix_playlist_canciones_playlist_orden', 'playlist_id', 'orden'),
+    )
+    
     # Relaciones
     cancion = db.relationship('Cancion', backref='en_playlists')
 
@@ -168,6 +462,369 @@ class Reproduccion(db.Model):
     fecha_reproduccion = db.Column(db.DateTime, default=datetime.utcnow)
     duracion_reproducida = db.Column(db.Integer, default=0)  # en segundos
     completada = db.Column(db.Boolean, default=False)
+    
+    # Canciones distintas de cada usuario (actualización de la radio)
+    __table_args__ = (
+        db.Index('ix_reproducciones_usuario_cancion', 'usuario_id', 'cancion_id'),
+    )
+
+class CoocurrenciaCancion(db.Model):
+    """Matriz dispersa de la radio: usuarios que escucharon ambas canciones"""
+    __tablename__ = 'coocurrencias_canciones'
+    
+    # cancion_a < cancion_b; en la diagonal (a == b) el total de usuarios de la canción
+    cancion_a = db.Column(db.Integer, db.ForeignKey('canciones.id'), primary_key=True)
+    cancion_b = db.Column(db.Integer, db.ForeignKey('canciones.id'), primary_key=True)
+    usuarios = db.Column(db.Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        db.Index('ix_coocurrencias_cancion_b', 'cancion_b'),
+    )
+
+class CancionSimilar(db.Model):
+    """Canciones más parecidas a cada canción, precalculadas para /api/radio"""
+    __tablename__ = 'canciones_similares'
+    
+    cancion_id = db.Column(db.Integer, db.ForeignKey('canciones.id'), primary_key=True)
+    posicion = db.Column(db.SmallInteger, primary_key=True)
+    similar_id = db.Column(db.Integer, db.ForeignKey('canciones.id'), nullable=False)
+    puntaje = db.Column(db.Float, nullable=False)
+
+class EstadoRadio(db.Model):
+    """Última reproducción incorporada a la matriz de la radio (una sola fila)"""
+    __tablename__ = 'estado_radio'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    ultima_reproduccion = db.Column(db.Integer, nullable=False, default=0)
+    # Mayor id visto en fecha_tope: se incorpora cuando pasen RADIO_WATERMARK_LAG segundos
+    tope_reproduccion = db.Column(db.Integer, nullable=False, default=0)
+    fecha_tope = db.Column(db.DateTime)
+    fecha_actualizacion = db.Column(db.DateTime, default=datetime.utcnow)
+
+class TrabajoMedia(db.Model):
+    __tablename__ = 'trabajos_media'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    tipo = db.Column(db.String(50), nullable=False)  # portada, etc.
+    cancion_id = db.Column(db.Integer, db.ForeignKey('canciones.id'), nullable=True)
+    payload = db.Column(db.Text, nullable=False)  # JSON con los parámetros de la tarea
+    estado = db.Column(db.Enum('pendiente', 'procesando', 'completado', 'error'),
+                       default='pendiente', nullable=False)
+    intentos = db.Column(db.Integer, default=0, nullable=False)
+    error = db.Column(db.Text, nullable=True)
+    fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow)
+    disponible_desde = db.Column(db.DateTime, default=datetime.utcnow)  # retraso entre reintentos
+    fecha_actualizacion = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Índice para reclamar trabajos pendientes en orden
+    __table_args__ = (
+        db.Index('ix_trabajos_estado_disponible', 'estado', 'disponible_desde'),
+    )
+
+# Mantenimiento de agregados de playlists
+def _ajustar_playlist(connection, session, playlist_id, canciones, duracion):
+    """Sumar (o restar) canciones y duración a una playlist en la misma transacción"""
+    tabla = Playlist.__table__
+    connection.execute(
+        tabla.update()
+             .where(tabla.c.id == playlist_id)
+             .values(total_canciones=tabla.c.total_canciones + canciones,
+                     duracion_total=tabla.c.duracion_total + duracion)
+    )
+    if session is not None:
+        session.info.setdefault('playlists_modificadas', set()).add(playlist_id)
+
+def _duracion_cancion(cancion_id):
+    canciones = Cancion.__table__
+    return db.func.coalesce(
+        db.select(canciones.c.duracion).where(canciones.c.id == cancion_id).scalar_subquery(), 0
+    )
+
+@db.event.listens_for(PlaylistCancion, 'after_insert')
+def agregar_a_agregados(mapper, connection, target):
+    _ajustar_playlist(connection, db.inspect(target).session, target.playlist_id, 1,
+                      _duracion_cancion(target.cancion_id))
+
+@db.event.listens_for(PlaylistCancion, 'after_delete')
+def quitar_de_agregados(mapper, connection, target):
+    _ajustar_playlist(connection, db.inspect(target).session, target.playlist_id, -1,
+                      -_duracion_cancion(target.cancion_id))
+
+@db.event.listens_for(PlaylistCancion, 'after_update')
+def mover_en_agregados(mapper, connection, target):
+    estado = db.inspect(target)
+    playlist_hist = estado.attrs.playlist_id.history
+    cancion_hist = estado.attrs.cancion_id.history
+    if not playlist_hist.has_changes() and not cancion_hist.has_changes():
+        return
+    playlist_anterior = playlist_hist.deleted[0] if playlist_hist.deleted else target.playlist_id
+    cancion_anterior = cancion_hist.deleted[0] if cancion_hist.deleted else target.cancion_id
+    _ajustar_playlist(connection, estado.session, playlist_anterior, -1,
+                      -_duracion_cancion(cancion_anterior))
+    _ajustar_playlist(connection, estado.session, target.playlist_id, 1,
+                      _duracion_cancion(target.cancion_id))
+
+@db.event.listens_for(Cancion, 'after_update')
+def propagar_duracion(mapper, connection, target):
+    """Propagar un cambio de Cancion.duracion a las playlists que la contienen"""
+    historial = db.inspect(target).attrs.duracion.history
+    if not historial.has_changes():
+        return
+    anterior = (historial.deleted[0] if historial.deleted else None) or 0
+    delta = (target.duracion or 0) - anterior
+    if not delta:
+        return
+    
+    tabla = Playlist.__table__
+    enlaces = PlaylistCancion.__table__
+    veces = db.select(db.func.count()).where(enlaces.c.playlist_id == tabla.c.id,
+                                             enlaces.c.cancion_id == target.id).scalar_subquery()
+    connection.execute(
+        tabla.update()
+             .where(tabla.c.id.in_(db.select(enlaces.c.playlist_id).where(enlaces.c.cancion_id == target.id)))
+             .values(duracion_total=tabla.c.duracion_total + delta * veces)
+    )
+    sesion = db.inspect(target).session
+    if sesion is not None:
+        sesion.info['playlists_modificadas_todas'] = True
+
+@db.event.listens_for(db.session, 'after_flush_postexec')
+def expirar_agregados(session, flush_context):
+    """Los UPDATE directos dejan obsoletas las instancias en memoria: expirarlas"""
+    ids = session.info.pop('playlists_modificadas', set())
+    todas = session.info.pop('playlists_modificadas_todas', False)
+    for instancia in list(session.identity_map.values()):
+        if isinstance(instancia, Playlist) and (todas or instancia.id in ids):
+            session.expire(instancia, ['total_canciones', 'duracion_total'])
+
+def recalcular_agregados_playlists():
+    """
+    Recalcular en bloque los agregados de todas las playlists
+    
+    Returns:
+        int: Número de playlists actualizadas
+    """
+    tabla = Playlist.__table__
+    enlaces = PlaylistCancion.__table__
+    canciones = Cancion.__table__
+    total = db.select(db.func.count()).where(enlaces.c.playlist_id == tabla.c.id).scalar_subquery()
+    duracion = db.select(db.func.coalesce(db.func.sum(canciones.c.duracion), 0))\
+                 .select_from(enlaces.join(canciones, canciones.c.id == enlaces.c.cancion_id))\
+                 .where(enlaces.c.playlist_id == tabla.c.id).scalar_subquery()
+    resultado = db.session.execute(tabla.update().values(total_canciones=total, duracion_total=duracion))
+    db.session.commit()
+    return resultado.rowcount
+
+# Radio personalizada: recomendaciones por co-ocurrencia de reproducciones
+def _en_lotes(valores, tamano=500):
+    """Partir una lista de ids para consultas IN acotadas"""
+    valores = list(valores)
+    for inicio in range(0, len(valores), tamano):
+        yield valores[inicio:inicio + tamano]
+
+def _coocurrencias_de(canciones):
+    """Filas de la matriz que tocan alguna de las canciones, como arrays (a, b, usuarios)"""
+    tabla = CoocurrenciaCancion
+    filas = set()
+    for lote in _en_lotes(canciones):
+        for columna in (tabla.cancion_a, tabla.cancion_b):
+            filas.update(db.session.execute(
+                db.select(tabla.cancion_a, tabla.cancion_b, tabla.usuarios).where(columna.in_(lote))
+            ).all())
+    if not filas:
+        return tuple(np.empty(0, dtype=np.int64) for _ in range(3))
+    return tuple(np.array(sorted(filas), dtype=np.int64).T)
+
+def _bonificacion_radio(ids):
+    """
+    Multiplicador por par para top_k_similar: 0 si el destino está inactivo,
+    más peso si comparten materia o grado objetivo
+    """
+    ids = np.array(sorted(ids), dtype=np.int64)
+    activas = np.zeros(len(ids))
+    materias = np.zeros(len(ids), dtype=np.int64)
+    grados = np.zeros(len(ids), dtype=np.int64)
+    codigos = {}
+    for lote in _en_lotes(ids.tolist()):
+        for cancion_id, activo, materia, grado in db.session.execute(
+                db.select(Cancion.id, Cancion.activo, Cancion.materia, Cancion.grado_objetivo)
+                  .where(Cancion.id.in_(lote))):
+            i = np.searchsorted(ids, cancion_id)
+            activas[i] = 1.0 if activo else 0.0
+            # 0 = sin dato: no cuenta como coincidencia
+            materias[i] = codigos.setdefault(('materia', materia), len(codigos) + 1) if materia else 0
+            grados[i] = codigos.setdefault(('grado', grado), len(codigos) + 1) if grado else 0
+    
+    peso_materia = app.config['RADIO_MATERIA_WEIGHT']
+    peso_grado = app.config['RADIO_GRADE_WEIGHT']
+    
+    def bonificacion(origen, destino):
+        o, d = np.searchsorted(ids, origen), np.searchsorted(ids, destino)
+        return (activas[d]
+                * (1 + peso_materia * ((materias[o] == materias[d]) & (materias[o] > 0)))
+                * (1 + peso_grado * ((grados[o] == grados[d]) & (grados[o] > 0))))
+    return bonificacion
+
+def actualizar_radio(completo=False):
+    """
+    Incorporar las reproducciones nuevas a la matriz de co-ocurrencias y
+    recalcular las canciones similares de las canciones afectadas
+    
+    Solo se leen las canciones de los usuarios que reprodujeron algo desde
+    la última actualización, así que el costo depende de lo nuevo y no del
+    historial completo: se recalculan las listas de las canciones con
+    usuarios nuevos y de sus vecinos directos.
+    
+    Los ids no se confirman en orden (lotes del buffer de reproducciones en
+    curso), así que la marca de agua avanza solo hasta el mayor id visto
+    hace al menos RADIO_WATERMARK_LAG segundos: un id menor sin confirmar
+    entonces ya tuvo ese tiempo para aparecer.
+    
+    Args:
+        completo: Vaciar la matriz y recalcular todo desde cero
+    
+    Returns:
+        dict: {'reproducciones', 'pares', 'canciones'} incorporadas y recalculadas
+    """
+    estado = db.session.get(EstadoRadio, 1)
+    if estado is None:
+        estado = EstadoRadio(id=1, ultima_reproduccion=0, tope_reproduccion=0)
+        db.session.add(estado)
+    # Hasta dónde es seguro leer: lo ya incorporado o el tope visto hace RADIO_WATERMARK_LAG
+    ahora = datetime.utcnow()
+    maximo = db.session.scalar(db.select(db.func.max(Reproduccion.id))) or 0
+    retraso = timedelta(seconds=app.config['RADIO_WATERMARK_LAG'])
+    hasta = estado.ultima_reproduccion
+    if not retraso:
+        hasta = maximo
+    elif estado.fecha_tope is not None and estado.fecha_tope <= ahora - retraso:
+        hasta = max(estado.tope_reproduccion, hasta)
+    if hasta >= estado.tope_reproduccion or estado.fecha_tope is None:
+        estado.tope_reproduccion, estado.fecha_tope = maximo, ahora
+    
+    if completo:
+        db.session.execute(db.delete(CancionSimilar))
+        db.session.execute(db.delete(CoocurrenciaCancion))
+        estado.ultima_reproduccion = 0
+    
+    desde = estado.ultima_reproduccion
+    resumen = {'reproducciones': max(hasta - desde, 0), 'pares': 0, 'canciones': 0}
+    if hasta <= desde:
+        db.session.commit()
+        return resumen
+    
+    # Pares (usuario, canción) de los usuarios con reproducciones nuevas
+    usuarios = db.session.scalars(
+        db.select(Reproduccion.usuario_id).distinct()
+          .where(Reproduccion.id > desde, Reproduccion.id <= hasta)
+    ).all()
+    deltas = [np.empty(0, dtype=np.int64)] * 3
+    for lote in _en_lotes(usuarios, app.config['RADIO_USER_BATCH']):
+        filas = db.session.execute(
+            db.select(Reproduccion.usuario_id, Reproduccion.cancion_id, db.func.min(Reproduccion.id))
+              .where(Reproduccion.usuario_id.in_(lote), Reproduccion.id <= hasta)
+              .group_by(Reproduccion.usuario_id, Reproduccion.cancion_id)
+        ).all()
+        usuario, cancion, primera = np.array(filas, dtype=np.int64).T
+        nuevos = cooccurrence_delta(usuario, cancion, primera > desde)
+        deltas = [np.concatenate(partes) for partes in zip(deltas, nuevos)]
+    a, b, incremento = sum_pairs(*deltas)
+    
+    if len(a):
+        # Sumar el incremento a las filas existentes de las canciones tocadas
+        tocadas = np.union1d(a, b)
+        ea, eb, eu = _coocurrencias_de(tocadas.tolist())
+        base = int(max(tocadas.max(), ea.max(initial=0), eb.max(initial=0))) + 1
+        existe = np.isin(a * base + b, ea * base + eb)
+        ma, mb, mu = sum_pairs(np.concatenate((ea, a)), np.concatenate((eb, b)),
+                               np.concatenate((eu, incremento)))
+        
+        nuevas = [{'cancion_a': int(x), 'cancion_b': int(y), 'usuarios': int(n)}
+                  for x, y, n in zip(a[~existe], b[~existe], incremento[~existe])]
+        posicion = np.searchsorted(ma * base + mb, a[existe] * base + b[existe])
+        cambiadas = [{'cancion_a': int(ma[i]), 'cancion_b': int(mb[i]), 'usuarios': int(mu[i])}
+                     for i in posicion]
+        if nuevas:
+            db.session.execute(db.insert(CoocurrenciaCancion), nuevas)
+        if cambiadas:
+            db.session.execute(db.update(CoocurrenciaCancion), cambiadas)
+        
+        # El coseno depende del total (diagonal) de cada canción: cambian las
+        # listas de las canciones tocadas y las de sus vecinos
+        afectadas = np.union1d(ma, mb)
+        ra, rb, ru = _coocurrencias_de(afectadas.tolist())
+        diagonal = ra == rb
+        totales = dict(zip(ra[diagonal].tolist(), ru[diagonal].tolist()))
+        for lote in _en_lotes(np.setdiff1d(np.union1d(ra, rb), afectadas).tolist()):
+            totales.update(db.session.execute(
+                db.select(CoocurrenciaCancion.cancion_a, CoocurrenciaCancion.usuarios)
+                  .where(CoocurrenciaCancion.cancion_a == CoocurrenciaCancion.cancion_b,
+                         CoocurrenciaCancion.cancion_a.in_(lote))
+            ).all())
+        ids = np.array(sorted(totales), dtype=np.int64)
+        origen, destino, puntaje = top_k_similar(
+            ra[~diagonal], rb[~diagonal], ru[~diagonal], ids, [totales[i] for i in ids.tolist()],
+            afectadas, app.config['RADIO_TOP_K'], boost=_bonificacion_radio(ids.tolist()))
+        
+        # Reemplazar las listas recalculadas
+        for lote in _en_lotes(afectadas.tolist()):
+            db.session.execute(db.delete(CancionSimilar).where(CancionSimilar.cancion_id.in_(lote)))
+        similares, anterior, puesto = [], None, 0
+        for cancion_id, similar_id, valor in zip(origen.tolist(), destino.tolist(), puntaje.tolist()):
+            puesto = puesto + 1 if cancion_id == anterior else 0
+            anterior = cancion_id
+            similares.append({'cancion_id': cancion_id, 'posicion': puesto,
+                              'similar_id': similar_id, 'puntaje': round(valor, 6)})
+        if similares:
+            db.session.execute(db.insert(CancionSimilar), similares)
+        resumen.update(pares=len(a), canciones=len(afectadas))
+    
+    estado.ultima_reproduccion = hasta
+    estado.fecha_actualizacion = ahora
+    db.session.commit()
+    return resumen
+
+# Orden disperso de las canciones de una playlist
+def renumerar_playlist(playlist_id):
+    """Reasignar posiciones espaciadas a toda la playlist (cuando se agota un hueco)"""
+    elementos = PlaylistCancion.query.filter_by(playlist_id=playlist_id)\
+                                     .order_by(PlaylistCancion.orden, PlaylistCancion.id).all()
+    for elemento, orden in zip(elementos, spaced_ranks(len(elementos), app.config['PLAYLIST_ORDER_GAP'])):
+        if elemento.orden != orden:
+            elemento.orden = orden
+    return len(elementos)
+
+def orden_en_playlist(playlist_id, despues_de=None, al_final=False, excluir=None):
+    """
+    Posición para colocar un elemento en una playlist tocando solo su fila
+    
+    Args:
+        playlist_id: Playlist destino
+        despues_de: PlaylistCancion tras el que se coloca (None = al inicio)
+        al_final: Colocar tras el último elemento (ignora despues_de)
+        excluir: PlaylistCancion que se está moviendo (no cuenta como vecino)
+        
+    Returns:
+        int: Posición nueva (renumera la playlist si no queda hueco entre los vecinos)
+    """
+    vecinos = db.select(PlaylistCancion.orden).where(PlaylistCancion.playlist_id == playlist_id)
+    if excluir is not None and excluir.id is not None:
+        vecinos = vecinos.where(PlaylistCancion.id != excluir.id)
+    
+    gap = app.config['PLAYLIST_ORDER_GAP']
+    for _ in range(2):
+        if al_final:
+            anterior = db.session.scalar(vecinos.order_by(PlaylistCancion.orden.desc()).limit(1))
+            siguiente = None
+        else:
+            anterior = despues_de.orden if despues_de is not None else None
+            posteriores = vecinos.where(PlaylistCancion.orden > anterior) if anterior is not None else vecinos
+            siguiente = db.session.scalar(posteriores.order_by(PlaylistCancion.orden).limit(1))
+        orden = rank_between(anterior, siguiente, gap)
+        if orden is not None:
+            return orden
+        renumerar_playlist(playlist_id)
+    raise RuntimeError(f'No se pudo ubicar el elemento en la playlist {playlist_id}')
 
 # Formularios
 class LoginForm(FlaskForm):
@@ -199,7 +856,8 @@ class RegistroForm(FlaskForm):
     especialidad = StringField('Especialidad/Materia', validators=[Optional(), Length(max=100)])
     submit = SubmitField('Registrarse')
 
-class SubirCancionForm(FlaskForm):
+class DatosCancionForm(FlaskForm):
+    """Datos de la canción (al finalizar una subida reanudable el audio ya está en el servidor)"""
     titulo = StringField('Título', validators=[DataRequired(), Length(min=1, max=200)])
     artista = StringField('Artista', validators=[DataRequired(), Length(min=1, max=200)])
     album = StringField('Álbum', validators=[Optional(), Length(max=200)])
@@ -228,13 +886,15 @@ class SubirCancionForm(FlaskForm):
         ('5to', '5° Secundaria')
     ])
     descripcion = TextAreaField('Descripción', validators=[Optional(), Length(max=500)])
-    archivo_audio = FileField('Archivo de Audio', 
-                             validators=[FileRequired(), 
-                                       FileAllowed(['mp3', 'wav', 'ogg', 'flac', 'm4a'])])
     cover_image = FileField('Imagen de Portada', 
                            validators=[FileAllowed(['jpg', 'jpeg', 'png', 'gif', 'webp'])])
     submit = SubmitField('Subir Canción')
 
+class SubirCancionForm(DatosCancionForm):
+    archivo_audio = FileField('Archivo de Audio', 
+                             validators=[FileRequired(), 
+                                       FileAllowed(['mp3', 'wav', 'ogg', 'flac', 'm4a'])])
+
 class PlaylistForm(FlaskForm):
     nombre = StringField('Nombre', validators=[DataRequired(), Length(min=1, max=200)])
     descripcion = TextAreaField('Descripción', validators=[Optional(), Length(max=500)])
@@ -244,34 +904,436 @@ class PlaylistForm(FlaskForm):
     submit = SubmitField('Crear Playlist')
 
 # Funciones auxiliares
+def guardar_reproducciones(eventos):
+    """Insertar un lote de reproducciones y actualizar contadores de forma atómica"""
+    with app.app_context():
+        try:
+            db.session.execute(db.insert(Reproduccion), eventos)
+            
+            # Un UPDATE ... SET total = total + n por canción
+            conteos = Counter(evento['cancion_id'] for evento in eventos)
+            for cancion_id, n in conteos.items():
+                db.session.execute(
+                    db.update(Cancion)
+                      .where(Cancion.id == cancion_id)
+                      .values(reproducciones_totales=Cancion.reproducciones_totales + n)
+                )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+playback_buffer = PlaybackBuffer(
+    guardar_reproducciones,
+    log_dir=app.config['PLAYBACK_LOG_DIR'],
+    batch_size=app.config['PLAYBACK_BATCH_SIZE'],
+    max_pending=app.config['PLAYBACK_MAX_PENDING'],
+    flush_interval=app.config['PLAYBACK_FLUSH_INTERVAL']
+)
+atexit.register(playback_buffer.flush)
+
+# Cola de trabajos multimedia (procesada por worker.py fuera de las peticiones)
+media_jobs = JobQueue(app, db, TrabajoMedia,
+                      max_attempts=app.config['MEDIA_JOBS_MAX_ATTEMPTS'],
+                      retry_delay=app.config['MEDIA_JOBS_RETRY_DELAY'],
+                      visibility_timeout=app.config['MEDIA_JOBS_VISIBILITY_TIMEOUT'],
+                      heartbeat_interval=app.config['MEDIA_JOBS_HEARTBEAT'])
+
+def _finalizar_cancion(trabajo):
+    """Marcar la canción como lista cuando ya no le quedan trabajos en curso"""
+    if trabajo.cancion_id is None:
+        return
+    en_curso = db.session.scalar(
+        db.select(db.func.count()).select_from(TrabajoMedia)
+          .where(TrabajoMedia.cancion_id == trabajo.cancion_id,
+                 TrabajoMedia.id != trabajo.id,
+                 TrabajoMedia.estado.in_(['pendiente', 'procesando']))
+    )
+    cancion = db.session.get(Cancion, trabajo.cancion_id)
+    if cancion is not None and not en_curso and cancion.estado == 'procesando':
+        cancion.estado = 'listo'
+
+def portada_procesada(trabajo, resultado):
+    cancion = db.session.get(Cancion, trabajo.cancion_id)
+    if cancion is not None:
+        cancion.cover_image = resultado['filename']
+        cancion.cover_key = resultado['key']
+        cancion.cover_placeholder = resultado['placeholder']
+    _finalizar_cancion(trabajo)
+
+def portada_fallida(trabajo, error):
+    # La canción sigue siendo reproducible: queda publicada sin portada
+    payload = json.loads(trabajo.payload)
+    if payload.get('compress', True):
+        try:
+            os.remove(payload['path'])
+        except OSError:
+            pass
+    _finalizar_cancion(trabajo)
+
+def portada_playlist_procesada(trabajo, resultado):
+    playlist = db.session.get(Playlist, json.loads(trabajo.payload)['playlist_id'])
+    if playlist is not None:
+        playlist.cover_image = resultado['filename']
+        playlist.cover_key = resultado['key']
+        playlist.cover_placeholder = resultado['placeholder']
+
+def avatar_procesado(trabajo, resultado):
+    usuario = db.session.get(Usuario, json.loads(trabajo.payload)['usuario_id'])
+    if usuario is not None:
+        usuario.avatar = resultado['filename']
+        usuario.avatar_key = resultado['key']
+        usuario.avatar_placeholder = resultado['placeholder']
+
+def versiones_procesadas(trabajo, resultado):
+    """Guardar (o reemplazar) las versiones por calidad generadas por el worker"""
+    cancion = db.session.get(Cancion, trabajo.cancion_id)
+    if cancion is None:
+        # La canción se eliminó mientras se transcodificaba
+        db.session.info.setdefault('audios_liberados', set()).update(
+            version['archivo'] for version in resultado['versiones'])
+        return
+    existentes = {version.calidad: version for version in cancion.versiones}
+    for datos in resultado['versiones']:
+        version = existentes.get(datos['calidad'])
+        if version is None:
+            cancion.versiones.append(VersionAudio(**datos))
+        else:
+            for campo, valor in datos.items():
+                setattr(version, campo, valor)
+    _finalizar_cancion(trabajo)
+
+def versiones_fallidas(trabajo, error):
+    # Sin versiones la canción se sirve con el archivo original
+    _finalizar_cancion(trabajo)
+
+def segmentos_procesados(trabajo, resultado):
+    cancion = db.session.get(Cancion, trabajo.cancion_id)
+    if cancion is not None:
+        cancion.segmentos = resultado['segmentos']
+    _finalizar_cancion(trabajo)
+
+def segmentos_fallidos(trabajo, error):
+    # Sin segmentos el reproductor usa /stream con el archivo completo
+    _finalizar_cancion(trabajo)
+
+def indice_procesado(trabajo, resultado):
+    seek_cache.pop(json.loads(trabajo.payload)['path'])
+    _finalizar_cancion(trabajo)
+
+def indice_fallido(trabajo, error):
+    # Sin índice, ?t= se ignora y el navegador busca por rangos como antes
+    _finalizar_cancion(trabajo)
+
+def picos_procesados(trabajo, resultado):
+    _finalizar_cancion(trabajo)
+
+def picos_fallidos(trabajo, error):
+    # Sin picos el reproductor muestra la barra de progreso simple
+    _finalizar_cancion(trabajo)
+
+def crc_procesado(trabajo, resultado):
+    _finalizar_cancion(trabajo)
+
+def crc_fallido(trabajo, error):
+    # La exportación ZIP lo calcula la primera vez que lo necesita
+    _finalizar_cancion(trabajo)
+
+media_jobs.register('portada', process_image_task,
+                    on_success=portada_procesada, on_failure=portada_fallida)
+media_jobs.register('portada_playlist', process_image_task, on_success=portada_playlist_procesada)
+media_jobs.register('avatar', process_image_task, on_success=avatar_procesado)
+media_jobs.register('versiones', build_renditions_task,
+                    on_success=versiones_procesadas, on_failure=versiones_fallidas)
+media_jobs.register('segmentos', build_segments_task,
+                    on_success=segmentos_procesados, on_failure=segmentos_fallidos)
+media_jobs.register('indice_busqueda', build_seek_index_task,
+                    on_success=indice_procesado, on_failure=indice_fallido)
+media_jobs.register('picos', build_peaks_task,
+                    on_success=picos_procesados, on_failure=picos_fallidos)
+media_jobs.register('crc', build_crc_task,
+                    on_success=crc_procesado, on_failure=crc_fallido)
+
+# Codificador para las versiones por calidad (opcional: sin él se sirve el original)
+audio_encoder = find_encoder(app.config['AUDIO_ENCODER']) if app.config['AUDIO_RENDITIONS_ENABLED'] else None
+if app.config['AUDIO_RENDITIONS_ENABLED'] and audio_encoder is None:
+    app.logger.warning(f"No se encontró {app.config['AUDIO_ENCODER']}: "
+                       "las canciones se servirán solo en su calidad original")
+
+def encolar_versiones(cancion):
+    """
+    Encolar la generación de versiones por calidad de una canción
+    
+    Returns:
+        bool: False si no hay codificador disponible
+    """
+    if audio_encoder is None:
+        return False
+    music_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'music')
+    media_jobs.enqueue('versiones', {
+        'path': os.path.join(music_dir, cancion.archivo_audio),
+        'store_dir': music_dir,
+        'calidades': app.config['AUDIO_QUALITY'],
+        'encoder': audio_encoder,
+    }, cancion_id=cancion.id)
+    return True
+
+def encolar_indice_busqueda(cancion):
+    """
+    Encolar el índice de búsqueda tiempo→byte del audio original
+    
+    Returns:
+        bool: False si el formato no se puede indexar (solo MP3, OGG y FLAC)
+    """
+    if seek_format(cancion.archivo_audio) is None:
+        return False
+    media_jobs.enqueue('indice_busqueda', {
+        'path': os.path.join(app.config['UPLOAD_FOLDER'], 'music', cancion.archivo_audio),
+    }, cancion_id=cancion.id)
+    return True
+
+def encolar_picos(cancion):
+    """
+    Encolar el cálculo de los picos de forma de onda de una canción
+    
+    Returns:
+        bool: False si está desactivado o el formato necesita ffmpeg y no está instalado
+    """
+    if not app.config['AUDIO_PEAKS_ENABLED'] or not can_decode(cancion.archivo_audio, audio_encoder):
+        return False
+    media_jobs.enqueue('picos', {
+        'path': os.path.join(app.config['UPLOAD_FOLDER'], 'music', cancion.archivo_audio),
+        'levels': list(app.config['AUDIO_PEAKS_LEVELS']),
+        'encoder': audio_encoder,
+    }, cancion_id=cancion.id)
+    return True
+
+def encolar_crc(cancion):
+    """
+    Encolar el CRC-32 del audio para las exportaciones ZIP
+    
+    Returns:
+        bool: False si ya está guardado (blob reutilizado)
+    """
+    ruta = os.path.join(app.config['UPLOAD_FOLDER'], 'music', cancion.archivo_audio)
+    if read_crc32(ruta) is not None:
+        return False
+    media_jobs.enqueue('crc', {'path': ruta}, cancion_id=cancion.id)
+    return True
+
+def encolar_segmentos(cancion):
+    """
+    Encolar el corte en segmentos de una canción
+    
+    Returns:
+        bool: False si está desactivado, el audio no está en el almacén por
+        contenido o no es MP3 y no hay codificador
+    """
+    if not app.config['AUDIO_SEGMENTS_ENABLED'] or segments_key(cancion.archivo_audio) is None:
+        return False
+    if not cancion.archivo_audio.lower().endswith('.mp3') and audio_encoder is None:
+        return False
+    music_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'music')
+    calidad = app.config['AUDIO_QUALITY'][app.config['AUDIO_SEGMENT_QUALITY']]
+    media_jobs.enqueue('segmentos', {
+        'path': os.path.join(music_dir, cancion.archivo_audio),
+        'store_dir': music_dir,
+        'duration': app.config['AUDIO_SEGMENT_DURATION'],
+        'bitrate': calidad['bitrate'],
+        'encoder': audio_encoder,
+    }, cancion_id=cancion.id)
+    return True
+
+def registrar_cancion(form, audio_upload):
+    """
+    Crear la canción a partir del formulario y de un audio ya guardado
+    (subida clásica y subidas reanudables)
+    
+    Args:
+        form: DatosCancionForm validado
+        audio_upload: Resultado válido de save_audio_upload / save_audio_file
+        
+    Returns:
+        Cancion: Canción creada (estado 'procesando' si tiene trabajos en cola)
+    """
+    app.logger.info(f'Usuario {current_user.email} subiendo canción: {form.titulo.data}')
+    
+    audio_filename = audio_upload['filename']
+    metadata = audio_upload['metadata']
+    if audio_upload['duplicate']:
+        app.logger.info(f'Audio duplicado, se reutiliza el archivo existente {audio_filename}')
+    
+    # Procesar imagen de portada si se proporciona
+    cover_filename = None
+    if form.cover_image.data:
+        cover_file = form.cover_image.data
+    
+        # Validar imagen
+        image_validation = validate_image_file(cover_file)
+        if not image_validation['valid']:
+            # Continuar sin imagen si hay error
+            flash(f'Advertencia: {image_validation["error"]}. La canción se subió sin portada.', 'warning')
+        else:
+            # Generar nombre único para la imagen
+            cover_filename = generate_unique_filename(cover_file.filename, 'cover')
+            cover_path = os.path.join(app.config['UPLOAD_FOLDER'], 'covers', cover_filename)
+    
+            # Guardar sin procesar: la compresión se hace en la cola de trabajos
+            cover_file.save(cover_path)
+    
+    # Crear registro en la base de datos
+    cancion = Cancion(
+        titulo=form.titulo.data,
+        artista=form.artista.data,
+        album=form.album.data,
+        genero=form.genero.data,
+        año=int(form.año.data) if form.año.data.isdigit() else None,
+        duracion=metadata['duration'],
+        archivo_audio=audio_filename,
+        descripcion=form.descripcion.data,
+        materia=form.materia.data,
+        grado_objetivo=form.grado_objetivo.data,
+        subido_por=current_user.id,
+        estado='procesando'
+    )
+    
+    db.session.add(cancion)
+    db.session.flush()
+    if cover_filename:
+        media_jobs.enqueue('portada', {'path': cover_path, 'filename': cover_filename},
+                           cancion_id=cancion.id)
+    encolados = [encolar_versiones(cancion), encolar_segmentos(cancion),
+                 encolar_indice_busqueda(cancion), encolar_picos(cancion), encolar_crc(cancion)]
+    if not any(encolados) and not cover_filename:
+        cancion.estado = 'listo'
+    db.session.commit()
+    
+    app.logger.info(f'Canción "{form.titulo.data}" subida exitosamente por {current_user.email}')
+    if cancion.estado == 'procesando':
+        if app.config['MEDIA_JOBS_INLINE']:
+            media_jobs.run_inline()
+        if cover_filename:
+            flash('¡Canción subida exitosamente! La portada se está procesando.', 'success')
+        else:
+            flash('¡Canción subida exitosamente! El audio se está procesando.', 'success')
+    else:
+        flash('¡Canción subida exitosamente!', 'success')
+    return cancion
+
+def contar_con_cache(clave, query):
+    """Total de una consulta filtrada, cacheado unos segundos (opcional por config)"""
+    if not app.config['PAGINATION_SHOW_TOTAL']:
+        return None
+    total = count_cache.get(clave)
+    if total is None:
+        total = query.order_by(None).count()
+        count_cache.set(clave, total)
+    return total
+
 @login_manager.user_loader
 def load_user(user_id):
-    return Usuario.query.get(int(user_id))
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return None
+    
+    usuario = user_cache.get(user_id)
+    if usuario is None:
+        registro = db.session.get(Usuario, user_id)
+        if registro is None:
+            return None
+        usuario = UsuarioSesion(registro)
+        user_cache.set(user_id, usuario)
+    
+    # Una cuenta desactivada deja de estar autenticada
+    return usuario if usuario.activo else None
+
+@db.event.listens_for(Usuario, 'after_update')
+@db.event.listens_for(Usuario, 'after_delete')
+def invalidar_usuario_cacheado(mapper, connection, target):
+    user_cache.pop(target.id)
+
+# Página principal en caché
+def construir_portada():
+    """Construir la instantánea de datos de la página principal (sin objetos ORM)"""
+    with app.app_context():
+        # Canciones más populares
+        canciones_populares = Cancion.query.filter_by(activo=True)\
+                                          .order_by(Cancion.reproducciones_totales.desc())\
+                                          .limit(6).all()
+        
+        # Playlists públicas recientes
+        playlists_recientes = Playlist.query.filter_by(publica=True, activa=True)\
+                                            .options(joinedload(Playlist.creador))\
+                                            .order_by(Playlist.fecha_creacion.desc())\
+                                            .limit(6).all()
+        
+        return {
+            'total_canciones': Cancion.query.filter_by(activo=True).count(),
+            'total_docentes': Usuario.query.filter_by(rol='docente', activo=True).count(),
+            'total_estudiantes': Usuario.query.filter_by(rol='estudiante', activo=True).count(),
+            'canciones_populares': [
+                SimpleNamespace(
+                    id=c.id, titulo=c.titulo, artista=c.artista, cover_image=c.cover_image,
+                    cover_key=c.cover_key, cover_placeholder=c.cover_placeholder,
+                    materia=c.materia, grado_objetivo=c.grado_objetivo,
+                    reproducciones_totales=c.reproducciones_totales,
+                    duracion_formato=c.duracion_formato
+                ) for c in canciones_populares
+            ],
+            'playlists_recientes': [
+                SimpleNamespace(
+                    id=p.id, nombre=p.nombre, descripcion=p.descripcion, cover_image=p.cover_image,
+                    cover_key=p.cover_key, cover_placeholder=p.cover_placeholder,
+                    total_canciones=p.total_canciones, duracion_total=p.duracion_total,
+                    creador=SimpleNamespace(nombre=p.creador.nombre)
+                ) for p in playlists_recientes
+            ],
+        }
+
+portada_cache = SnapshotCache(construir_portada,
+                              ttl=app.config['HOME_SNAPSHOT_TTL'],
+                              background=app.config['HOME_SNAPSHOT_BACKGROUND'])
+
+@db.event.listens_for(Cancion, 'after_insert')
+@db.event.listens_for(Cancion, 'after_update')
+@db.event.listens_for(Cancion, 'after_delete')
+@db.event.listens_for(Playlist, 'after_insert')
+@db.event.listens_for(Playlist, 'after_update')
+@db.event.listens_for(Playlist, 'after_delete')
+@db.event.listens_for(Usuario, 'after_insert')
+@db.event.listens_for(Usuario, 'after_delete')
+def invalidar_portada(mapper, connection, target):
+    _marcar_portada_sucia(target)
+
+@db.event.listens_for(Usuario, 'after_update')
+def invalidar_portada_por_usuario(mapper, connection, target):
+    # Ignorar cambios frecuentes como ultimo_acceso: solo afectan rol y activo
+    estado = db.inspect(target)
+    if estado.attrs.rol.history.has_changes() or estado.attrs.activo.history.has_changes():
+        _marcar_portada_sucia(target)
+
+def _marcar_portada_sucia(target):
+    """Recordar que la portada cambió (se invalida tras el commit, no durante el flush)"""
+    session = db.object_session(target)
+    if session is not None:
+        session.info['portada_sucia'] = True
+
+@db.event.listens_for(db.session, 'after_commit')
+def invalidar_portada_tras_commit(session):
+    # Invalidar antes del commit dejaría que otro worker reconstruya con datos viejos
+    if session.info.pop('portada_sucia', False):
+        portada_cache.invalidate()
+
+@db.event.listens_for(db.session, 'after_soft_rollback')
+def descartar_portada_sucia(session, previous_transaction):
+    session.info.pop('portada_sucia', None)
 
 # Rutas principales
 @app.route('/')
 def index():
-    # Estadísticas para la página principal
-    total_canciones = Cancion.query.filter_by(activo=True).count()
-    total_docentes = Usuario.query.filter_by(rol='docente', activo=True).count()
-    total_estudiantes = Usuario.query.filter_by(rol='estudiante', activo=True).count()
-    
-    # Canciones más populares
-    canciones_populares = Cancion.query.filter_by(activo=True)\
-                                      .order_by(Cancion.reproducciones_totales.desc())\
-                                      .limit(6).all()
-    
-    # Playlists públicas recientes
-    playlists_recientes = Playlist.query.filter_by(publica=True, activa=True)\
-                                        .order_by(Playlist.fecha_creacion.desc())\
-                                        .limit(6).all()
-    
-    return render_template('index.html',
-                         total_canciones=total_canciones,
-                         total_docentes=total_docentes,
-                         total_estudiantes=total_estudiantes,
-                         canciones_populares=canciones_populares,
-                         playlists_recientes=playlists_recientes)
+    # Estadísticas, canciones populares y playlists recientes desde la caché
+    return render_template('index.html', **portada_cache.get())
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -356,16 +1418,8 @@ def biblioteca():
     genero = request.args.get('genero', '', type=str)
     materia = request.args.get('materia', '', type=str)
     
-    query = Cancion.query.filter_by(activo=True)
-    
-    if buscar:
-        query = query.filter(
-            db.or_(
-                Cancion.titulo.contains(buscar),
-                Cancion.artista.contains(buscar),
-                Cancion.album.contains(buscar)
-            )
-        )
+    query = Cancion.query.filter_by(activo=True)\
+                         .options(joinedload(Cancion.subido_por_usuario))
     
     if genero:
         query = query.filter_by(genero=genero)
@@ -373,9 +1427,20 @@ def biblioteca():
     if materia:
         query = query.filter_by(materia=materia)
     
-    canciones = query.order_by(Cancion.fecha_subida.desc())\
-                    .paginate(page=page, per_page=app.config['CANCIONES_PER_PAGE'], 
-                             error_out=False)
+    # Con búsqueda se ordena por relevancia (resultados acotados, paginación
+    # clásica); sin ella, por fecha de subida con cursor (fecha_subida, id)
+    if buscar or 'page' in request.args:
+        if buscar:
+            query = search_backend.apply(query, buscar)
+        else:
+            query = query.order_by(Cancion.fecha_subida.desc(), Cancion.id.desc())
+        canciones = query.paginate(page=page, per_page=app.config['CANCIONES_PER_PAGE'], 
+                                   error_out=False)
+    else:
+        total = contar_con_cache(('biblioteca', genero, materia), query)
+        canciones = keyset_paginate(query, Cancion.fecha_subida, Cancion.id,
+                                    app.config['CANCIONES_PER_PAGE'],
+                                    cursor=request.args.get('cursor'), total=total)
     
     return render_template('biblioteca.html', canciones=canciones, 
                          buscar=buscar, genero=genero, materia=materia)
@@ -390,67 +1455,22 @@ def subir():
     
     form = SubirCancionForm()
     if form.validate_on_submit():
+        audio_upload = None
         try:
-            # Validar archivo de audio
+            # Guardar, validar y extraer metadatos del audio en una sola pasada
             audio_file = form.archivo_audio.data
-            audio_validation = validate_audio_file(audio_file)
-            
-            if not audio_validation['valid']:
-                flash(f'Error en archivo de audio: {audio_validation["error"]}', 'danger')
-                return render_template('subir.html', form=form)
-            
-            app.logger.info(f'Usuario {current_user.email} subiendo canción: {form.titulo.data}')
-            
-            # Generar nombre único para el archivo de audio
-            audio_filename = generate_unique_filename(audio_file.filename, 'audio')
-            audio_path = os.path.join(app.config['UPLOAD_FOLDER'], 'music', audio_filename)
-            
-            # Guardar archivo de audio
-            audio_file.save(audio_path)
-            
-            # Obtener metadatos del audio
-            metadata = get_audio_metadata_safe(audio_path)
-            
-            # Procesar imagen de portada si se proporciona
-            cover_filename = None
-            if form.cover_image.data:
-                cover_file = form.cover_image.data
-                
-                # Validar imagen
-                image_validation = validate_image_file(cover_file)
-                if not image_validation['valid']:
-                    # Continuar sin imagen si hay error
-                    flash(f'Advertencia: {image_validation["error"]}. La canción se subió sin portada.', 'warning')
-                else:
-                    # Generar nombre único para la imagen
-                    cover_filename = generate_unique_filename(cover_file.filename, 'cover')
-                    cover_path = os.path.join(app.config['UPLOAD_FOLDER'], 'covers', cover_filename)
-                    
-                    # Guardar y comprimir imagen
-                    cover_file.save(cover_path)
-                    compress_and_resize_image(cover_path)
-            
-            # Crear registro en la base de datos
-            cancion = Cancion(
-                titulo=form.titulo.data,
-                artista=form.artista.data,
-                album=form.album.data,
-                genero=form.genero.data,
-                año=int(form.año.data) if form.año.data.isdigit() else None,
-                duracion=metadata['duration'],
-                archivo_audio=audio_filename,
-                cover_image=cover_filename,
-                descripcion=form.descripcion.data,
-                materia=form.materia.data,
-                grado_objetivo=form.grado_objetivo.data,
-                subido_por=current_user.id
+            audio_upload = save_audio_upload(
+                audio_file.stream,
+                os.path.join(app.config['UPLOAD_FOLDER'], 'music'),
+                audio_file.filename,
+                max_size_mb=app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)
             )
             
-            db.session.add(cancion)
-            db.session.commit()
+            if not audio_upload['valid']:
+                flash(f'Error en archivo de audio: {audio_upload["error"]}', 'danger')
+                return render_template('subir.html', form=form)
             
-            app.logger.info(f'Canción "{form.titulo.data}" subida exitosamente por {current_user.email}')
-            flash('¡Canción subida exitosamente!', 'success')
+            registrar_cancion(form, audio_upload)
             return redirect(url_for('biblioteca'))
             
         except AudioProcessingError as e:
@@ -465,26 +1485,127 @@ def subir():
             app.logger.error(f'Error general al subir canción: {str(e)}')
             flash('Error inesperado al subir la canción. Intenta nuevamente.', 'danger')
             db.session.rollback()
+        
+        # La canción no se guardó: no dejar el audio sin referencias
+        if audio_upload and audio_upload['valid']:
+            liberar_audio_si_huerfano(audio_upload['filename'], audio_upload['reserva'])
     
     return render_template('subir.html', form=form)
 
+# Subidas reanudables: iniciar, enviar bloques con su offset y finalizar
+@app.route('/api/subidas', methods=['POST'])
+@login_required
+def iniciar_subida():
+    if not current_user.puede_subir_musica():
+        return jsonify({'error': 'No tienes permisos para subir música'}), 403
+    
+    datos = request.get_json(silent=True) or {}
+    nombre = str(datos.get('nombre') or '')
+    if not allowed_file(nombre, app.config['ALLOWED_AUDIO_EXTENSIONS']):
+        return jsonify({'error': 'Tipo de archivo no soportado'}), 400
+    
+    estado = subidas.create(current_user.id, nombre, datos.get('tamano'), datos.get('sha256'))
+    return jsonify({
+        'id': estado['id'],
+        'offset': 0,
+        'tamano_bloque': app.config['RESUMABLE_CHUNK_SIZE'],
+        'url': url_for('bloque_subida', upload_id=estado['id'])
+    }), 201
+
+@app.route('/api/subidas/<upload_id>', methods=['GET'])
+@login_required
+def estado_subida(upload_id):
+    """Offset confirmado: el cliente reanuda desde aquí tras un corte"""
+    estado = subidas.get(upload_id, current_user.id)
+    response = jsonify({'offset': estado['offset'], 'tamano': estado['size']})
+    response.headers['Upload-Offset'] = str(estado['offset'])
+    return response
+
+@app.route('/api/subidas/<upload_id>', methods=['PUT'])
+@login_required
+def bloque_subida(upload_id):
+    offset = request.headers.get('Upload-Offset', type=int)
+    if offset is None:
+        return jsonify({'error': 'Falta la cabecera Upload-Offset'}), 400
+    
+    # request.stream no se guarda en memoria ni en disco antes de llegar aquí
+    nuevo_offset = subidas.write_chunk(upload_id, current_user.id, offset, request.stream,
+                                       request.content_length,
+                                       request.headers.get('X-Chunk-Sha256'))
+    response = jsonify({'offset': nuevo_offset})
+    response.headers['Upload-Offset'] = str(nuevo_offset)
+    return response
+
+@app.route('/api/subidas/<upload_id>', methods=['DELETE'])
+@login_required
+def cancelar_subida(upload_id):
+    subidas.get(upload_id, current_user.id)
+    subidas.discard(upload_id)
+    return '', 204
+
+@app.route('/api/subidas/<upload_id>/finalizar', methods=['POST'])
+@login_required
+def finalizar_subida(upload_id):
+    """Crear la canción con el archivo ensamblado y los datos del formulario de subida"""
+    if not current_user.puede_subir_musica():
+        return jsonify({'error': 'No tienes permisos para subir música'}), 403
+    
+    subidas.get(upload_id, current_user.id)
+    form = DatosCancionForm()
+    if not form.validate_on_submit():
+        return jsonify({'error': 'Datos de la canción inválidos', 'errores': form.errors}), 400
+    
+    # Un doble clic o un reintento espera al primero y ya no encuentra la subida
+    with subidas.locked(upload_id):
+        estado = subidas.get(upload_id, current_user.id)
+        if estado['offset'] != estado['size']:
+            raise UploadError('La subida aún no está completa', 409, estado['offset'])
+        return guardar_subida(upload_id, estado, form)
+
+def guardar_subida(upload_id, estado, form):
+    """Registrar la canción de una subida completa (con el bloqueo de la subida tomado)"""
+    audio_upload = None
+    try:
+        # El archivo ensamblado se enlaza al almacén y se conserva hasta el commit
+        audio_upload = save_audio_file(
+            subidas.data_path(upload_id),
+            os.path.join(app.config['UPLOAD_FOLDER'], 'music'),
+            estado['filename'],
+            expected_sha256=estado['sha256']
+        )
+        if not audio_upload['valid']:
+            # Rechazo definitivo: el mismo archivo volvería a fallar
+            subidas.discard(upload_id)
+            return jsonify({'error': f'Error en archivo de audio: {audio_upload["error"]}'}), 422
+        
+        cancion = registrar_cancion(form, audio_upload)
+    except Exception as e:
+        app.logger.error(f'Error al finalizar subida {upload_id}: {str(e)}')
+        db.session.rollback()
+        if audio_upload and audio_upload['valid']:
+            liberar_audio_si_huerfano(audio_upload['filename'], audio_upload['reserva'])
+        # La subida se conserva completa: el cliente puede volver a finalizarla
+        return jsonify({'error': 'Error inesperado al guardar la canción'}), 500
+    
+    subidas.discard(upload_id)
+    return jsonify({'id': cancion.id, 'redirect': url_for('biblioteca')}), 201
+
+@app.errorhandler(UploadError)
+def error_de_subida(error):
+    response = jsonify({'error': str(error), 'offset': error.offset})
+    if error.offset is not None:
+        response.headers['Upload-Offset'] = str(error.offset)
+    return response, error.status
+
 @app.route('/reproductor/<int:cancion_id>')
 @login_required
 def reproductor(cancion_id):
     cancion = Cancion.query.get_or_404(cancion_id)
     
-    # Registrar reproducción
-    reproduccion = Reproduccion(
-        usuario_id=current_user.id,
-        cancion_id=cancion.id
-    )
-    db.session.add(reproduccion)
-    
-    # Incrementar contador de reproducciones
-    cancion.reproducciones_totales += 1
-    db.session.commit()
+    # Registrar reproducción (se persiste en lote desde el buffer)
+    playback_buffer.add(current_user.id, cancion.id)
     
-    return render_template('reproductor.html', cancion=cancion)
+    return render_template('reproductor.html', cancion=cancion, picos=url_picos(cancion))
 
 @app.route('/playlists')
 @login_required
@@ -495,41 +1616,657 @@ def playlists():
     mis_playlists = Playlist.query.filter_by(creado_por=current_user.id, activa=True)\
                                   .order_by(Playlist.fecha_creacion.desc()).all()
     
-    # Playlists públicas
-    playlists_publicas = Playlist.query.filter_by(publica=True, activa=True)\
-                                       .filter(Playlist.creado_por != current_user.id)\
-                                       .order_by(Playlist.fecha_creacion.desc())\
-                                       .paginate(page=page, per_page=app.config['PLAYLISTS_PER_PAGE'],
-                                               error_out=False)
+    # Playlists públicas (por cursor; ?page= mantiene la paginación clásica)
+    query = Playlist.query.filter_by(publica=True, activa=True)\
+                          .filter(Playlist.creado_por != current_user.id)\
+                          .options(joinedload(Playlist.creador))
+    if 'page' in request.args:
+        playlists_publicas = query.order_by(Playlist.fecha_creacion.desc(), Playlist.id.desc())\
+                                  .paginate(page=page, per_page=app.config['PLAYLISTS_PER_PAGE'],
+                                            error_out=False)
+    else:
+        total = contar_con_cache(('playlists_publicas', current_user.id), query)
+        playlists_publicas = keyset_paginate(query, Playlist.fecha_creacion, Playlist.id,
+                                             app.config['PLAYLISTS_PER_PAGE'],
+                                             cursor=request.args.get('cursor'), total=total)
     
     return render_template('playlists.html', 
                          mis_playlists=mis_playlists,
                          playlists_publicas=playlists_publicas)
 
+def url_picos(cancion):
+    """URL de la forma de onda, o None si aún no se calcularon los picos"""
+    ruta = os.path.join(app.config['UPLOAD_FOLDER'], 'music', cancion.archivo_audio)
+    if not os.path.exists(peaks_path(ruta)):
+        return None
+    return url_for('picos_cancion', cancion_id=cancion.id)
+
+def datos_cancion(cancion, calidad):
+    """
+    Datos de una canción para el reproductor (/api/cancion y manifiestos)
+    
+    Args:
+        cancion: Cancion
+        calidad: Nivel elegido con elegir_calidad() (None = original)
+    """
+    return {
+        'id': cancion.id,
+        'titulo': cancion.titulo,
+        'artista': cancion.artista,
+        'album': cancion.album,
+        'duracion': cancion.duracion_formato,
+        'archivo': url_for('static', filename=f'uploads/music/{cancion.archivo_audio}'),
+        # Nivel fijado al cargar: los rangos siguientes piden siempre el mismo archivo
+        'stream': url_for('stream_cancion', cancion_id=cancion.id, q=calidad or 'original'),
+        'manifiesto': url_for('manifiesto_cancion', cancion_id=cancion.id) if cancion.segmentos else None,
+        'duracion_segundos': cancion.duracion,
+        # Con índice, /stream?t= empieza en la trama exacta (sin adivinar por bitrate)
+        'busqueda': os.path.exists(seek_index_path(
+            os.path.join(app.config['UPLOAD_FOLDER'], 'music', cancion.archivo_audio))),
+        'picos': url_picos(cancion),
+        'cover': url_for('static', filename=f'uploads/covers/{cancion.cover_image}') if cancion.cover_image else None,
+        'cover_derivados': {
+            tamano: imagen_url('covers', cancion.cover_key, tamano, 'webp') for tamano in IMAGE_SIZES
+        } if cancion.cover_key else None,
+        'cover_placeholder': cancion.cover_placeholder
+    }
+
 @app.route('/api/cancion/<int:cancion_id>')
 @login_required
 def api_cancion(cancion_id):
     cancion = Cancion.query.get_or_404(cancion_id)
-    return jsonify({
+    return jsonify(datos_cancion(cancion, elegir_calidad()))
+
+def responder_manifiesto(datos, canciones):
+    """
+    Manifiesto de reproducción: todas las canciones en una respuesta con
+    ETag (304 si no cambió) y preload del audio de la primera
+    
+    Args:
+        datos: dict base del JSON (se le agrega 'canciones')
+        canciones: Canciones en orden de reproducción
+    """
+    calidad = elegir_calidad()
+    datos['canciones'] = [datos_cancion(cancion, calidad) for cancion in canciones]
+    
+    response = jsonify(datos)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.add_etag()
+    response.vary.update(('Downlink', 'Save-Data'))
+    if datos['canciones']:
+        # La primera canción empieza a descargarse mientras el reproductor procesa el JSON
+        primera = datos['canciones'][0]
+        if primera['manifiesto']:
+            clave = segments_key(canciones[0].archivo_audio)
+            response.headers.add('Link', f"<{primera['manifiesto']}>; rel=preload; as=fetch; crossorigin")
+            response.headers.add('Link', f"<{url_for('segmento_audio', clave=clave, nombre=segment_name(0))}>; "
+                                         "rel=preload; as=fetch; crossorigin")
+        else:
+            response.headers.add('Link', f"<{primera['stream']}>; rel=preload; as=audio")
+    return response.make_conditional(request)
+
+def playlist_visible(playlist_id):
+    """Playlist activa que el usuario puede ver (pública, propia o como admin)"""
+    playlist = Playlist.query.filter_by(id=playlist_id, activa=True).first_or_404()
+    if not playlist.publica and playlist.creado_por != current_user.id and not current_user.es_admin():
+        abort(403)
+    return playlist
+
+def canciones_de_playlist(playlist_id):
+    """Canciones activas de una playlist en orden de reproducción (una consulta)"""
+    return db.session.scalars(
+        db.select(Cancion)
+          .join(PlaylistCancion, PlaylistCancion.cancion_id == Cancion.id)
+          .where(PlaylistCancion.playlist_id == playlist_id, Cancion.activo == True)
+          .order_by(PlaylistCancion.orden, PlaylistCancion.id)
+    ).all()
+
+@app.route('/api/playlist/<int:playlist_id>/manifiesto')
+@login_required
+def manifiesto_playlist(playlist_id):
+    """Metadatos de todas las canciones de una playlist, en orden, en una sola petición"""
+    playlist = playlist_visible(playlist_id)
+    canciones = canciones_de_playlist(playlist.id)
+    return responder_manifiesto({
+        'playlist': {
+            'id': playlist.id,
+            'nombre': playlist.nombre,
+            'total_canciones': playlist.total_canciones,
+            'duracion_total': playlist.duracion_total,
+        },
+    }, canciones)
+
+@app.route('/api/playlist/<int:playlist_id>/canciones', methods=['POST'])
+@login_required
+def api_playlist_canciones(playlist_id):
+    """
+    Agregar, mover y quitar canciones de una playlist en una sola transacción
+    
+    Cuerpo: {"operaciones": [{"agregar": cancion_id}, {"mover": elemento_id,
+    "despues_de": elemento_id}, {"quitar": elemento_id}, ...]}. Sin
+    "despues_de" el elemento va al final; con "despues_de": null, al inicio.
+    Cada operación cambia solo la fila afectada; si alguna es inválida no se
+    aplica ninguna.
+    """
+    playlist = Playlist.query.filter_by(id=playlist_id, activa=True).first_or_404()
+    if playlist.creado_por != current_user.id and not current_user.es_admin():
+        abort(403)
+    
+    operaciones = (request.get_json(silent=True) or {}).get('operaciones')
+    if not isinstance(operaciones, list) or not operaciones:
+        return jsonify({'error': 'Se esperaba una lista de operaciones'}), 400
+    if len(operaciones) > app.config['PLAYLIST_MAX_OPERATIONS']:
+        return jsonify({'error': 'Demasiadas operaciones en una sola petición'}), 413
+    
+    def elemento_de_playlist(elemento_id):
+        elemento = db.session.get(PlaylistCancion, elemento_id) if isinstance(elemento_id, int) else None
+        if elemento is None or elemento.playlist_id != playlist.id:
+            raise ValueError(f'El elemento {elemento_id} no está en la playlist')
+        return elemento
+    
+    agregados = []
+    try:
+        for operacion in operaciones:
+            if not isinstance(operacion, dict):
+                raise ValueError('Cada operación debe ser un objeto')
+            if 'quitar' in operacion:
+                db.session.delete(elemento_de_playlist(operacion['quitar']))
+                continue
+            
+            if 'agregar' in operacion:
+                cancion = db.session.get(Cancion, operacion['agregar']) \
+                    if isinstance(operacion['agregar'], int) else None
+                if cancion is None or not cancion.activo:
+                    raise ValueError(f"La canción {operacion['agregar']} no existe")
+                elemento = PlaylistCancion(playlist_id=playlist.id, cancion_id=cancion.id)
+            elif 'mover' in operacion:
+                elemento = elemento_de_playlist(operacion['mover'])
+            else:
+                raise ValueError('Operación desconocida (agregar, mover o quitar)')
+            
+            ancla = operacion.get('despues_de')
+            elemento.orden = orden_en_playlist(
+                playlist.id,
+                despues_de=elemento_de_playlist(ancla) if ancla is not None else None,
+                al_final='despues_de' not in operacion,
+                excluir=elemento
+            )
+            if elemento.id is None:
+                db.session.add(elemento)
+                db.session.flush()
+                agregados.append(elemento.id)
+        db.session.commit()
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    
+    orden = db.session.scalars(
+        db.select(PlaylistCancion.id).where(PlaylistCancion.playlist_id == playlist.id)
+          .order_by(PlaylistCancion.orden, PlaylistCancion.id)
+    ).all()
+    return jsonify({'agregados': agregados, 'orden': orden})
+
+@app.route('/playlist/<int:playlist_id>/download')
+@login_required
+def descargar_playlist(playlist_id):
+    """
+    ZIP de la playlist para dispositivos sin conexión, armado al vuelo
+    
+    Los audios van sin recomprimir junto con playlist.m3u y playlist.json.
+    El tamaño y el contenido se conocen antes de enviar nada, así que la
+    respuesta lleva Content-Length y acepta Range para reanudar, sin
+    archivos temporales y con memoria constante por descarga.
+    """
+    playlist = playlist_visible(playlist_id)
+    music_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'music')
+    
+    miembros, pistas, entradas = [], [], []
+    mtime = 0
+    canciones = canciones_de_playlist(playlist.id)
+    ancho = len(str(len(canciones)))
+    for posicion, cancion in enumerate(canciones, 1):
+        info = stat_stream_file(os.path.join(music_dir, cancion.archivo_audio))
+        if info is None:
+            continue
+        # CRC guardado junto al blob al subirlo (los audios anteriores, la primera vez)
+        crc = stored_crc32(info.path)
+        
+        nombre = (f'{posicion:0{ancho}d} - {safe_member_name(cancion.artista)} - '
+                  f'{safe_member_name(cancion.titulo)}{os.path.splitext(info.path)[1].lower()}')
+        miembros.append(file_member(nombre, info.path, info.size, info.mtime, crc))
+        pistas.append((cancion.duracion, f'{cancion.artista} - {cancion.titulo}', nombre))
+        entradas.append({
+            'posicion': posicion,
+            'archivo': nombre,
+            'titulo': cancion.titulo,
+            'artista': cancion.artista,
+            'album': cancion.album,
+            'duracion': cancion.duracion,
+            'materia': cancion.materia,
+            'grado_objetivo': cancion.grado_objetivo,
+        })
+        mtime = max(mtime, info.mtime)
+    
+    manifiesto = json.dumps({
+        'playlist': {'id': playlist.id, 'nombre': playlist.nombre, 'descripcion': playlist.descripcion},
+        'canciones': entradas,
+    }, ensure_ascii=False, indent=2)
+    miembros.append(data_member('playlist.m3u', build_m3u(pistas).encode('utf-8'), mtime))
+    miembros.append(data_member('playlist.json', manifiesto.encode('utf-8'), mtime))
+    try:
+        zip_layout = ZipLayout(miembros)
+    except ValueError as e:
+        app.logger.warning(f'Playlist {playlist.id} no se puede exportar: {str(e)}')
+        abort(413)
+    
+    nombre_zip = safe_member_name(playlist.nombre, f'playlist-{playlist.id}')
+    return build_range_response(zip_layout.size, zip_layout.etag, zip_layout.iter_range, 'application/zip', {
+        'Content-Disposition': (f'attachment; filename="playlist-{playlist.id}.zip"; '
+                                f"filename*=UTF-8''{quote(nombre_zip)}.zip"),
+    })
+
+def cola_radio(cancion):
+    """
+    Orden de la radio de una canción: sus similares, luego los similares de
+    esos (intercalados por puesto) y al final las más escuchadas de la misma
+    materia y grado, sin repetir y hasta RADIO_QUEUE_SIZE canciones
+    
+    Returns:
+        list: Ids de canciones activas (sin la semilla)
+    """
+    cola = radio_cache.get(cancion.id)
+    if cola is not None:
+        return cola
+    
+    limite = app.config['RADIO_QUEUE_SIZE']
+    vistos = {cancion.id}
+    cola = []
+    
+    def agregar(ids):
+        for cancion_id in ids:
+            if len(cola) >= limite:
+                return
+            if cancion_id not in vistos:
+                vistos.add(cancion_id)
+                cola.append(cancion_id)
+    
+    def similares_de(ids):
+        return db.session.execute(
+            db.select(CancionSimilar.cancion_id, CancionSimilar.similar_id, CancionSimilar.posicion)
+              .join(Cancion, Cancion.id == CancionSimilar.similar_id)
+              .where(CancionSimilar.cancion_id.in_(ids), Cancion.activo == True)
+              .order_by(CancionSimilar.posicion)
+        ).all()
+    
+    vecinos = [fila.similar_id for fila in similares_de([cancion.id])]
+    agregar(vecinos)
+    if vecinos and len(cola) < limite:
+        puesto = {cancion_id: i for i, cancion_id in enumerate(vecinos)}
+        # Mismo puesto: primero los vecinos más cercanos a la semilla
+        agregar(fila.similar_id for fila in sorted(
+            similares_de(vecinos), key=lambda fila: (fila.posicion, puesto[fila.cancion_id])))
+    if len(cola) < limite:
+        # Sin historial suficiente: lo más escuchado, primero de la misma materia y grado
+        orden = []
+        if cancion.materia:
+            orden.append((Cancion.materia == cancion.materia).desc())
+        if cancion.grado_objetivo:
+            orden.append((Cancion.grado_objetivo == cancion.grado_objetivo).desc())
+        agregar(db.session.scalars(
+            db.select(Cancion.id).where(Cancion.activo == True, Cancion.id.not_in(vistos))
+              .order_by(*orden, Cancion.reproducciones_totales.desc(), Cancion.id)
+              .limit(limite - len(cola))
+        ))
+    
+    radio_cache.set(cancion.id, cola)
+    return cola
+
+@app.route('/api/radio/<int:cancion_id>')
+@login_required
+def radio_cancion(cancion_id):
+    """
+    Radio personalizada: cola sin fin de canciones parecidas a una canción
+    
+    Pide la página siguiente con ?desde=<siguiente> (y ?limite=); al llegar
+    al final de la cola vuelve a empezar. Solo lee listas precalculadas por
+    actualizar_radio(), así que responde sin recorrer las reproducciones.
+    """
+    cancion = Cancion.query.filter_by(id=cancion_id, activo=True).first_or_404()
+    try:
+        desde = max(int(request.args.get('desde', 0)), 0)
+        limite = min(max(int(request.args.get('limite', app.config['RADIO_PAGE_SIZE'])), 1), 100)
+    except ValueError:
+        return jsonify({'error': 'desde y limite deben ser números'}), 400
+    
+    cola = cola_radio(cancion)
+    ids = [cola[(desde + i) % len(cola)] for i in range(min(limite, len(cola)))]
+    encontradas = {c.id: c for c in db.session.scalars(
+        db.select(Cancion).where(Cancion.id.in_(ids), Cancion.activo == True))} if ids else {}
+    calidad = elegir_calidad()
+    response = jsonify({
+        'semilla': cancion.id,
+        'canciones': [datos_cancion(encontradas[i], calidad) for i in ids if i in encontradas],
+        'siguiente': desde + len(ids) if ids else None,
+    })
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.vary.update(('Downlink', 'Save-Data'))
+    return response
+
+@app.route('/api/canciones/manifiesto')
+@login_required
+def manifiesto_canciones():
+    """Manifiesto de una lista de canciones ad hoc (?ids=3,1,2, en ese orden)"""
+    try:
+        ids = [int(valor) for valor in request.args.get('ids', '').split(',') if valor.strip()]
+    except ValueError:
+        return jsonify({'error': 'ids debe ser una lista de números separados por comas'}), 400
+    if not ids:
+        return jsonify({'error': 'Se esperaba al menos un id'}), 400
+    if len(ids) > app.config['PLAYLIST_MANIFEST_MAX_IDS']:
+        return jsonify({'error': 'Demasiadas canciones en un solo manifiesto'}), 413
+    
+    encontradas = {cancion.id: cancion for cancion in db.session.scalars(
+        db.select(Cancion).where(Cancion.id.in_(set(ids)), Cancion.activo == True))}
+    return responder_manifiesto({}, [encontradas[i] for i in ids if i in encontradas])
+
+def json_catalogo(cancion):
+    """
+    Fragmento JSON de una canción para /api/canciones, precalculado por versión
+    
+    Solo contiene datos que no dependen del usuario (el nivel de calidad se
+    elige al pedir /stream), así que se comparte entre todas las peticiones.
+    """
+    guardado = catalogo_cache.get(cancion.id)
+    if guardado is not None and guardado[0] == cancion.version_catalogo:
+        return guardado[1]
+    fragmento = json.dumps({
         'id': cancion.id,
         'titulo': cancion.titulo,
         'artista': cancion.artista,
         'album': cancion.album,
+        'genero': cancion.genero,
+        'año': cancion.año,
+        'materia': cancion.materia,
+        'grado_objetivo': cancion.grado_objetivo,
         'duracion': cancion.duracion_formato,
-        'archivo': url_for('static', filename=f'uploads/music/{cancion.archivo_audio}'),
-        'cover': url_for('static', filename=f'uploads/covers/{cancion.cover_image}') if cancion.cover_image else None
-    })
+        'duracion_segundos': cancion.duracion,
+        'stream': url_for('stream_cancion', cancion_id=cancion.id),
+        'manifiesto': url_for('manifiesto_cancion', cancion_id=cancion.id) if cancion.segmentos else None,
+        'cover_derivados': {
+            tamano: imagen_url('covers', cancion.cover_key, tamano, 'webp') for tamano in IMAGE_SIZES
+        } if cancion.cover_key else None,
+        'cover_placeholder': cancion.cover_placeholder,
+        'version': cancion.version_catalogo,
+    }, ensure_ascii=False, separators=(',', ':'))
+    catalogo_cache.set(cancion.id, (cancion.version_catalogo, fragmento))
+    return fragmento
+
+@app.route('/api/canciones')
+@login_required
+def api_canciones():
+    """
+    Metadatos del catálogo en lote
+    
+    ?ids=1,2,3 devuelve esas canciones (activas) en ese orden; ?since=<versión>
+    devuelve las modificadas desde una sincronización anterior, con las
+    desactivadas en 'eliminadas'. La ETag depende solo de la versión del
+    catálogo, así que una biblioteca sin cambios responde 304 con una sola
+    consulta agregada.
+    """
+    try:
+        ids = [int(valor) for valor in request.args.get('ids', '').split(',') if valor.strip()]
+        desde = request.args.get('since', type=int)
+    except ValueError:
+        return jsonify({'error': 'ids debe ser una lista de números separados por comas'}), 400
+    if not ids and desde is None:
+        return jsonify({'error': 'Se esperaba ?ids= o ?since='}), 400
+    if len(ids) > app.config['CATALOG_BATCH_MAX_IDS']:
+        return jsonify({'error': 'Demasiadas canciones en una sola petición'}), 413
+    
+    # Versión actual del catálogo: el contador avanza con cada cambio confirmado
+    version = version_catalogo_actual(db.session)
+    total = db.session.scalar(db.select(db.func.count()).select_from(Cancion))
+    consulta = ','.join(map(str, ids)) if ids else f'since={desde}'
+    etag = f'catalogo-{version}-{total}-{zlib.crc32(consulta.encode()):08x}'
+    
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    elif ids:
+        encontradas = {cancion.id: cancion for cancion in db.session.scalars(
+            db.select(Cancion).where(Cancion.id.in_(set(ids)), Cancion.activo == True))}
+        fragmentos = [json_catalogo(encontradas[i]) for i in ids if i in encontradas]
+        response = app.response_class(
+            f'{{"version":{version},"canciones":[{",".join(fragmentos)}]}}',
+            mimetype='application/json')
+    else:
+        limite = app.config['CATALOG_DELTA_LIMIT']
+        cambios = db.session.scalars(
+            db.select(Cancion).where(Cancion.version_catalogo > desde)
+              .order_by(Cancion.version_catalogo).limit(limite + 1)
+        ).all()
+        completo = len(cambios) <= limite
+        cambios = cambios[:limite]
+        hasta = version if completo else cambios[-1].version_catalogo
+        fragmentos = [json_catalogo(cancion) for cancion in cambios if cancion.activo]
+        eliminadas = [cancion.id for cancion in cambios if not cancion.activo]
+        response = app.response_class(
+            f'{{"version":{hasta},"completo":{json.dumps(completo)},'
+            f'"canciones":[{",".join(fragmentos)}],"eliminadas":{json.dumps(eliminadas)}}}',
+            mimetype='application/json')
+    
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+@app.route('/api/cancion/<int:cancion_id>/peaks')
+@login_required
+def picos_cancion(cancion_id):
+    """
+    Picos de la forma de onda (int8 entrelazados: mín, máx, mín, máx...)
+    
+    ?ancho= indica cuántos picos necesita el cliente; se sirve el nivel más
+    pequeño que lo cubre para que la barra de búsqueda pese unos pocos KB.
+    """
+    cancion = Cancion.query.get_or_404(cancion_id)
+    nivel = read_peaks(os.path.join(app.config['UPLOAD_FOLDER'], 'music', cancion.archivo_audio),
+                       request.args.get('ancho', type=int))
+    if nivel is None:
+        abort(404)
+    cantidad, datos = nivel
+    
+    response = app.response_class(datos, mimetype='application/octet-stream')
+    response.headers['X-Peaks-Count'] = str(cantidad)
+    response.cache_control.private = True
+    response.cache_control.max_age = app.config['AUDIO_PEAKS_CACHE_MAX_AGE']
+    # El blob lleva el hash del contenido: si se reemplaza el audio cambia la ETag
+    response.set_etag(f'{os.path.splitext(os.path.basename(cancion.archivo_audio))[0]}-{cantidad}')
+    return response.make_conditional(request)
+
+@app.route('/api/reproduccion', methods=['POST'])
+@login_required
+def api_reproduccion():
+    """Recibir eventos de reproducción del reproductor (uno o un lote)"""
+    datos = request.get_json(silent=True)
+    if isinstance(datos, dict):
+        datos = datos.get('eventos', [datos])
+    if not isinstance(datos, list) or not datos:
+        return jsonify({'error': 'Se esperaba un evento o una lista de eventos'}), 400
+    if len(datos) > app.config['PLAYBACK_API_MAX_EVENTS']:
+        return jsonify({'error': 'Demasiados eventos en un solo lote'}), 413
+    
+    ahora = datetime.utcnow()
+    eventos = []
+    for dato in datos:
+        try:
+            cancion_id = int(dato['cancion_id'])
+            duracion = max(0, int(dato.get('duracion_reproducida') or 0))
+            fecha = ahora
+            if dato.get('timestamp'):
+                fecha = datetime.utcfromtimestamp(int(dato['timestamp']) / 1000)
+                if not ahora - timedelta(days=7) <= fecha <= ahora + timedelta(minutes=5):
+                    fecha = ahora
+        except (KeyError, TypeError, ValueError, OverflowError, OSError):
+            continue
+        eventos.append({
+            'usuario_id': current_user.id,
+            'cancion_id': cancion_id,
+            'fecha_reproduccion': fecha.isoformat(),
+            'duracion_reproducida': duracion,
+            'completada': bool(dato.get('completada', False)),
+        })
+    
+    # Descartar canciones inexistentes para no romper el lote completo en la BD
+    ids = {evento['cancion_id'] for evento in eventos}
+    if ids:
+        validos = set(db.session.scalars(db.select(Cancion.id).where(Cancion.id.in_(ids))))
+        eventos = [evento for evento in eventos if evento['cancion_id'] in validos]
+    
+    if not eventos:
+        return jsonify({'error': 'Ningún evento válido'}), 400
+    
+    playback_buffer.add_many(eventos)
+    return jsonify({'aceptados': len(eventos), 'rechazados': len(datos) - len(eventos)}), 202
+
+@app.route('/api/trabajos/estado')
+@login_required
+def api_trabajos_estado():
+    """Profundidad de la cola de trabajos multimedia (solo administradores)"""
+    if not current_user.es_admin():
+        abort(403)
+    return jsonify(media_jobs.stats())
+
+@app.route('/img/<any(covers, avatars):tipo>/<nombre>')
+def imagen_derivada(tipo, nombre):
+    """Derivados de imágenes: la URL cambia con el contenido, así que nunca caducan"""
+    response = send_from_directory(
+        os.path.join(app.config['UPLOAD_FOLDER'], tipo, IMAGE_DERIVATIVES_DIR), nombre,
+        max_age=app.config['IMAGE_CACHE_MAX_AGE']
+    )
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+def elegir_calidad():
+    """
+    Nivel de AUDIO_QUALITY para la petición actual: ?q=, preferencia del
+    usuario, Save-Data y ancho de banda (?bw= en kbps o la cabecera Downlink)
+    
+    Returns:
+        str | None: Nivel elegido, o None para el archivo original
+    """
+    throughput = request.args.get('bw', type=int)
+    if not throughput:
+        try:
+            # Client hint Downlink: Mbps estimados por el navegador
+            throughput = int(float(request.headers.get('Downlink', '')) * 1000)
+        except ValueError:
+            throughput = None
+    return choose_quality(
+        app.config['AUDIO_QUALITY'],
+        requested=request.args.get('q'),
+        preference=getattr(current_user, 'calidad_audio', None),
+        throughput_kbps=throughput,
+        save_data=request.headers.get('Save-Data', '').lower() == 'on',
+        default=app.config['AUDIO_DEFAULT_QUALITY'],
+        headroom=app.config['AUDIO_THROUGHPUT_HEADROOM']
+    )
+
+@app.route('/api/preferencias', methods=['POST'])
+@login_required
+def api_preferencias():
+    """Guardar la calidad de audio preferida ('auto', 'original' o un nivel)"""
+    datos = request.get_json(silent=True) or {}
+    calidad = datos.get('calidad_audio') or 'auto'
+    if calidad not in ('auto', 'original', *app.config['AUDIO_QUALITY']):
+        return jsonify({'error': 'Calidad de audio no válida'}), 400
+    
+    usuario = db.session.get(Usuario, current_user.id)
+    usuario.calidad_audio = None if calidad == 'auto' else calidad
+    db.session.commit()
+    return jsonify({'calidad_audio': calidad})
 
 @app.route('/stream/<int:cancion_id>')
 @login_required
 def stream_cancion(cancion_id):
-    cancion = Cancion.query.get_or_404(cancion_id)
-    file_path = os.path.join(app.config['UPLOAD_FOLDER'], 'music', cancion.archivo_audio)
+    # Archivos servibles de la canción: el original (clave None) y sus versiones
+    archivos = stream_cache.get(cancion_id)
+    if archivos is None:
+        cancion = Cancion.query.get_or_404(cancion_id)
+        music_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'music')
+        archivos = {None: stat_stream_file(os.path.join(music_dir, cancion.archivo_audio))}
+        if archivos[None] is None:
+            abort(404)
+        for version in cancion.versiones:
+            info = stat_stream_file(os.path.join(music_dir, version.archivo))
+            if info is not None:
+                archivos[version.calidad] = info
+        stream_cache.set(cancion_id, archivos)
+    
+    # Sin la versión pedida (aún no generada, o el original ya es de esa calidad)
+    calidad = elegir_calidad()
+    if calidad not in archivos:
+        calidad = None
+    info = archivos[calidad]
     
-    if not os.path.exists(file_path):
+    # ?t=segundos: empezar la respuesta en la trama exacta según el índice
+    inicio, offset, prefijo = 0, 0, b''
+    segundos = request.args.get('t', type=float)
+    if segundos and segundos > 0:
+        indice = seek_cache.get(info.path)
+        if indice is None:
+            indice = load_seek_index(info.path) or False
+            seek_cache.set(info.path, indice)
+        posicion = seek_position(info.path, indice, segundos) if indice else None
+        if posicion is not None:
+            inicio, offset = posicion
+            prefijo = indice.prefix if offset else b''
+    
+    try:
+        response = build_stream_response(info.path, info.mimetype, size=info.size,
+                                         mtime=info.mtime, etag=info.etag,
+                                         offset=offset, prefix=prefijo)
+        response.headers['X-Audio-Quality'] = calidad or 'original'
+        if segundos:
+            response.headers['X-Seek-Time'] = f'{inicio:.3f}'
+        response.vary.update(('Downlink', 'Save-Data'))
+        return response
+    except FileNotFoundError:
+        # El archivo fue eliminado o reemplazado desde que se cacheó
+        stream_cache.pop(cancion_id)
+        abort(404)
+
+@app.route('/stream/<int:cancion_id>/manifest.m3u8')
+@login_required
+def manifiesto_cancion(cancion_id):
+    """Lista HLS de los segmentos de una canción (reproducir solo necesita el primero)"""
+    cancion = Cancion.query.get_or_404(cancion_id)
+    key = segments_key(cancion.archivo_audio)
+    index = load_segments_index(os.path.join(app.config['UPLOAD_FOLDER'], 'music'), key)
+    if index is None:
         abort(404)
     
-    return send_file(file_path)
+    contenido = build_m3u8(index, lambda nombre: url_for('segmento_audio', clave=key, nombre=nombre))
+    response = app.response_class(contenido, mimetype='application/vnd.apple.mpegurl')
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.set_etag(key)
+    return response.make_conditional(request)
+
+@app.route('/segmentos/<clave>/<nombre>')
+@login_required
+def segmento_audio(clave, nombre):
+    """Segmento de audio: la URL lleva el hash del contenido, así que nunca caduca"""
+    directorio = segments_dir(os.path.join(app.config['UPLOAD_FOLDER'], 'music'), clave)
+    if directorio is None or not is_segment_name(nombre):
+        abort(404)
+    response = send_from_directory(directorio, nombre, mimetype=SEGMENT_MIMETYPE,
+                                   max_age=app.config['AUDIO_SEGMENT_CACHE_MAX_AGE'])
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
 
 # Manejo de errores
 @app.errorhandler(404)
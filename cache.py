@@ -0,0 +1,143 @@
+"""
+Cachés en memoria para Spotify Picaflorino
+Estructuras acotadas y seguras entre hilos para evitar consultas repetidas
+a la base de datos y al sistema de archivos
+"""
+
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Caché LRU acotada con expiración opcional por tiempo
+
+    Cada proceso (worker) mantiene su propia instancia; el TTL garantiza
+    que los cambios hechos por otros procesos terminen viéndose.
+    """
+
+    def __init__(self, maxsize=256, ttl=None):
+        """
+        Args:
+            maxsize: Número máximo de entradas
+            ttl: Segundos de vida de cada entrada (None = sin expiración)
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Obtener una entrada, o `default` si no existe o expiró"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            value, expires = item
+            if expires is not None and expires < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        """Guardar una entrada, desalojando la menos usada si se llena"""
+        ttl = self.ttl if ttl is None else ttl
+        expires = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        """Eliminar una entrada (invalidación)"""
+        with self._lock:
+            item = self._data.pop(key, None)
+            return item[0] if item is not None else default
+
+    def clear(self):
+        """Vaciar la caché"""
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+
+class SnapshotCache:
+    """
+    Instantánea única con TTL y stale-while-revalidate
+
+    Mientras exista una versión anterior se sirve de inmediato aunque haya
+    caducado, y un único hilo en segundo plano la reconstruye; así las
+    peticiones concurrentes no saturan la base de datos.
+    """
+
+    def __init__(self, builder, ttl=60, background=True):
+        """
+        Args:
+            builder: Función sin argumentos que construye la instantánea
+            ttl: Segundos durante los que la instantánea se considera fresca
+            background: Reconstruir en segundo plano (False = en línea)
+        """
+        self.builder = builder
+        self.ttl = ttl
+        self.background = background
+        self._value = None
+        self._built_at = None
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._generation = 0
+
+    def _is_fresh(self):
+        return self._built_at is not None and time.monotonic() - self._built_at < self.ttl
+
+    def _rebuild(self):
+        generation = self._generation
+        value = self.builder()
+        self._value = value
+        # Si se invalidó durante la reconstrucción, sigue caducada
+        if generation == self._generation:
+            self._built_at = time.monotonic()
+        return value
+
+    def _refresh_in_background(self):
+        try:
+            self._rebuild()
+        except Exception as e:
+            logging.error(f"Error al reconstruir instantánea en caché: {str(e)}")
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def get(self):
+        """Obtener la instantánea (posiblemente caducada mientras se renueva)"""
+        if self._is_fresh():
+            return self._value
+
+        if self._value is not None and self.background:
+            with self._lock:
+                start = not self._refreshing
+                self._refreshing = True
+            if start:
+                threading.Thread(target=self._refresh_in_background,
+                                 name='snapshot-refresh', daemon=True).start()
+            return self._value
+
+        # Sin versión previa: una sola petición construye, el resto espera
+        with self._lock:
+            if self._is_fresh():
+                return self._value
+            return self._rebuild()
+
+    def invalidate(self):
+        """Marcar la instantánea como caducada (se renovará en la próxima lectura)"""
+        self._generation += 1
+        self._built_at = None
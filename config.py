@@ -23,6 +23,7 @@ class Config:
     MAX_CONTENT_LENGTH = 50 * 1024 * 1024  # 50MB máximo por archivo
     ALLOWED_AUDIO_EXTENSIONS = {'mp3', 'wav', 'ogg', 'flac', 'm4a'}
     ALLOWED_IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
+    AUDIO_BLOB_GRACE = 3600  # Segundos que se conserva un audio reutilizado aunque aún no tenga referencias
     
     # Configuración de sesiones
     PERMANENT_SESSION_LIFETIME = timedelta(hours=2)
@@ -44,6 +45,8 @@ class Config:
     CANCIONES_PER_PAGE = 20
     PLAYLISTS_PER_PAGE = 12
     USUARIOS_PER_PAGE = 25
+    PAGINATION_SHOW_TOTAL = True  # Mostrar totales (COUNT cacheado) en listados por cursor
+    PAGINATION_COUNT_TTL = 60  # Segundos que se cachea cada total
     
     # Configuración de roles
     ROLES = {
@@ -58,6 +61,85 @@ class Config:
         'medium': {'bitrate': 192, 'format': 'mp3'},
         'low': {'bitrate': 128, 'format': 'mp3'}
     }
+    AUDIO_RENDITIONS_ENABLED = True  # Generar las versiones de AUDIO_QUALITY al subir
+    AUDIO_ENCODER = os.environ.get('AUDIO_ENCODER') or 'ffmpeg'  # Codificador local
+    AUDIO_DEFAULT_QUALITY = os.environ.get('AUDIO_DEFAULT_QUALITY') or None  # None = original
+    AUDIO_THROUGHPUT_HEADROOM = 0.5  # Fracción del ancho de banda del cliente para el audio
+    
+    # Streaming segmentado (/stream/<id>/manifest.m3u8)
+    AUDIO_SEGMENTS_ENABLED = True  # Cortar cada audio en segmentos al subirlo
+    AUDIO_SEGMENT_DURATION = 6  # Segundos por segmento
+    AUDIO_SEGMENT_QUALITY = 'medium'  # Nivel de AUDIO_QUALITY para segmentar originales que no son MP3
+    AUDIO_SEGMENT_CACHE_MAX_AGE = 365 * 24 * 3600  # Los segmentos nunca cambian
+    
+    # Forma de onda (/api/cancion/<id>/peaks)
+    AUDIO_PEAKS_ENABLED = True  # Calcular los picos de cada audio al subirlo
+    AUDIO_PEAKS_LEVELS = (256, 1024, 4096)  # Picos (mín, máx) por canción en cada nivel de detalle
+    AUDIO_PEAKS_CACHE_MAX_AGE = 24 * 3600  # Segundos de caché en el navegador (con ETag)
+    
+    # Configuración de cachés en memoria
+    STREAM_CACHE_SIZE = 1024  # Canciones con archivo resuelto en caché
+    STREAM_CACHE_TTL = 300  # Segundos antes de volver a consultar BD y disco
+    USER_CACHE_SIZE = 2048  # Usuarios con sesión cacheados por worker
+    USER_CACHE_TTL = 30  # Segundos máximos antes de releer rol y estado de la BD
+    
+    # Buffer de reproducciones (write-behind)
+    PLAYBACK_LOG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs')
+    PLAYBACK_BATCH_SIZE = 200  # Eventos pendientes que disparan un guardado
+    PLAYBACK_MAX_PENDING = 5000  # Límite de eventos en memoria
+    PLAYBACK_FLUSH_INTERVAL = 5  # Segundos entre guardados periódicos
+    PLAYBACK_API_MAX_EVENTS = 500  # Eventos máximos por petición a /api/reproduccion
+    
+    # Instantánea de la página principal (stale-while-revalidate)
+    HOME_SNAPSHOT_TTL = 60  # Segundos que la instantánea se considera fresca
+    HOME_SNAPSHOT_BACKGROUND = True  # Renovar en segundo plano sirviendo la versión anterior
+    
+    # Manifiestos de reproducción (/api/playlist/<id>/manifiesto)
+    PLAYLIST_MANIFEST_MAX_IDS = 200  # Canciones máximas en un manifiesto ad hoc (?ids=)
+    
+    # Orden de las canciones en playlists (posiciones dispersas)
+    PLAYLIST_ORDER_GAP = 1024  # Separación entre posiciones al agregar o renumerar
+    PLAYLIST_MAX_OPERATIONS = 500  # Operaciones máximas por petición a /api/playlist/<id>/canciones
+    
+    # API del catálogo (/api/canciones?ids= y ?since=)
+    CATALOG_BATCH_MAX_IDS = 500  # Canciones máximas por petición con ?ids=
+    CATALOG_DELTA_LIMIT = 1000  # Cambios máximos por respuesta de ?since= (el resto en la siguiente)
+    CATALOG_JSON_CACHE_SIZE = 10000  # Canciones con su JSON precalculado en memoria
+    
+    # Radio personalizada (python init_db.py radio, p. ej. desde cron cada 10 minutos)
+    RADIO_TOP_K = 50  # Canciones parecidas precalculadas por canción
+    RADIO_MATERIA_WEIGHT = 0.5  # Bonificación (x1.5) si comparten materia
+    RADIO_GRADE_WEIGHT = 0.25  # Bonificación (x1.25) si comparten grado objetivo
+    RADIO_USER_BATCH = 500  # Usuarios procesados a la vez al actualizar (acota la memoria)
+    RADIO_WATERMARK_LAG = 120  # Segundos antes de incorporar las reproducciones vistas (lotes sin confirmar)
+    RADIO_QUEUE_SIZE = 200  # Canciones distintas de la cola antes de volver a empezar
+    RADIO_PAGE_SIZE = 20  # Canciones por respuesta de /api/radio (máximo 100)
+    RADIO_CACHE_SIZE = 1000  # Colas de radio guardadas en memoria por proceso
+    RADIO_CACHE_TTL = 300  # Segundos que se reutiliza la cola calculada de cada canción
+    
+    # Motor de búsqueda: 'auto' elige FULLTEXT (MySQL), FTS5 (SQLite) o 'memoria'
+    SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND') or 'auto'
+    
+    # Cola de trabajos multimedia (python worker.py)
+    MEDIA_JOBS_INLINE = False  # Procesar en la misma petición (sin worker)
+    MEDIA_JOBS_CONCURRENCY = int(os.environ.get('MEDIA_JOBS_CONCURRENCY') or 2)  # Procesos del worker
+    MEDIA_JOBS_MAX_ATTEMPTS = 3  # Intentos antes de marcar un trabajo como error
+    MEDIA_JOBS_RETRY_DELAY = 30  # Segundos base entre reintentos (exponencial)
+    MEDIA_JOBS_VISIBILITY_TIMEOUT = 3600  # Segundos sin latido antes de reclamar un trabajo (> 3 transcodes de 15 min)
+    MEDIA_JOBS_HEARTBEAT = 60  # Segundos entre latidos de los trabajos en curso
+    
+    # Importación masiva del catálogo (python init_db.py import)
+    IMPORT_PROGRESS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs')
+    IMPORT_BATCH_SIZE = 500  # Canciones por inserción masiva
+    
+    # Subidas reanudables por bloques (/api/subidas)
+    RESUMABLE_UPLOAD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tmp', 'subidas')
+    RESUMABLE_UPLOAD_MAX_SIZE = 500 * 1024 * 1024  # Tamaño máximo del archivo completo
+    RESUMABLE_CHUNK_SIZE = 5 * 1024 * 1024  # Tamaño de bloque recomendado al cliente
+    RESUMABLE_UPLOAD_TTL = 24 * 3600  # Segundos antes de descartar una subida abandonada
+    
+    # Derivados de imágenes (URLs con hash del contenido)
+    IMAGE_CACHE_MAX_AGE = 365 * 24 * 3600  # Un año: Cache-Control immutable
 
 class DevelopmentConfig(Config):
     DEBUG = True
@@ -72,6 +154,10 @@ class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
     WTF_CSRF_ENABLED = False
+    HOME_SNAPSHOT_BACKGROUND = False
+    MEDIA_JOBS_INLINE = True
+    AUDIO_BLOB_GRACE = 0
+    RADIO_WATERMARK_LAG = 0
 
 config = {
     'development': DevelopmentConfig,
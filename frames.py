@@ -0,0 +1,204 @@
+"""
+Lectura de tramas de audio para Spotify Picaflorino
+Recorre las cabeceras de las tramas MP3, las páginas OGG y los bloques de
+metadatos FLAC de un archivo sin decodificar el audio, para cortarlo en
+segmentos o ubicar posiciones en el tiempo
+"""
+
+import mmap
+import struct
+from collections import namedtuple
+
+# Trama MP3: posición y tamaño en bytes, muestras que contiene y su frecuencia
+Mp3Frame = namedtuple('Mp3Frame', ['offset', 'size', 'samples', 'sample_rate'])
+
+# Página OGG: posición, tamaño, granule (-1 si ningún paquete termina en ella),
+# serie lógica, si continúa un paquete de la página anterior y su primer paquete
+OggPage = namedtuple('OggPage', ['offset', 'size', 'granule', 'serial', 'continued', 'first_packet'])
+
+# Metadatos FLAC: STREAMINFO, puntos de la SEEKTABLE (muestra, offset desde
+# la primera trama) e inicio de las tramas de audio
+FlacInfo = namedtuple('FlacInfo', ['streaminfo', 'sample_rate', 'total_samples',
+                                   'seekpoints', 'audio_offset'])
+
+_OGG_HEADER = struct.Struct('<4sBBqIIIB')
+_FLAC_SEEKPOINT = struct.Struct('>QQH')
+_FLAC_PLACEHOLDER = 0xFFFFFFFFFFFFFFFF
+
+# kbps por índice de bitrate: (versión MPEG, capa) -> tabla
+_BITRATES = {
+    (1, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (1, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (1, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (2, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (2, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (2, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+
+# Hz por índice de frecuencia según los bits de versión (3 = MPEG1, 2 = MPEG2, 0 = MPEG2.5)
+_SAMPLE_RATES = {
+    3: (44100, 48000, 32000),
+    2: (22050, 24000, 16000),
+    0: (11025, 12000, 8000),
+}
+
+
+def parse_mp3_header(header):
+    """
+    Interpretar los 4 bytes de cabecera de una trama MP3
+
+    Args:
+        header: bytes de la cabecera
+
+    Returns:
+        tuple | None: (tamaño, muestras, frecuencia, clave de formato), o
+        None si no es una cabecera válida (formato libre incluido)
+    """
+    if len(header) < 4 or header[0] != 0xFF or header[1] & 0xE0 != 0xE0:
+        return None
+    version_bits = (header[1] >> 3) & 0x03
+    layer_bits = (header[1] >> 1) & 0x03
+    bitrate_index = header[2] >> 4
+    rate_index = (header[2] >> 2) & 0x03
+    if version_bits == 1 or layer_bits == 0 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+
+    version = 1 if version_bits == 3 else 2
+    layer = 4 - layer_bits
+    bitrate = _BITRATES[(version, layer)][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version_bits][rate_index]
+    padding = (header[2] >> 1) & 0x01
+
+    if layer == 1:
+        samples = 384
+        size = (12 * bitrate // sample_rate + padding) * 4
+    elif layer == 2 or version == 1:
+        samples = 1152
+        size = 144 * bitrate // sample_rate + padding
+    else:
+        samples = 576
+        size = 72 * bitrate // sample_rate + padding
+    return size, samples, sample_rate, (version_bits, layer_bits, rate_index)
+
+
+def id3v2_size(data):
+    """Bytes que ocupa una etiqueta ID3v2 al inicio de `data` (0 si no hay)"""
+    if len(data) < 10 or data[:3] != b'ID3':
+        return 0
+    size = 0
+    for byte in data[6:10]:
+        size = (size << 7) | (byte & 0x7F)
+    footer = 10 if data[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def iter_mp3_frames(data, start=None):
+    """
+    Recorrer las tramas MP3 de un buffer
+
+    Salta las etiquetas ID3v2 y, tras datos corruptos, se resincroniza
+    solo cuando dos tramas seguidas coinciden en formato (evita falsos
+    sincronismos dentro de los datos de audio).
+
+    Args:
+        data: bytes, bytearray o mmap con el archivo completo
+        start: Posición de una trama conocida (None = inicio del archivo)
+
+    Yields:
+        Mp3Frame: Cada trama de audio en orden
+    """
+    end = len(data)
+    pos = id3v2_size(data) if start is None else start
+    expected = None  # Formato de la última trama válida
+    while pos + 4 <= end:
+        parsed = parse_mp3_header(data[pos:pos + 4])
+        if parsed is not None and (expected is None or parsed[3] == expected):
+            size, samples, sample_rate, key = parsed
+            if expected is None:
+                # Confirmar el sincronismo con la trama siguiente
+                following = parse_mp3_header(data[pos + size:pos + size + 4])
+                if pos + size < end and (following is None or following[3] != key):
+                    pos += 1
+                    continue
+            if pos + size > end:
+                break  # Trama truncada al final del archivo
+            expected = key
+            yield Mp3Frame(pos, size, samples, sample_rate)
+            pos += size
+            continue
+
+        if data[pos:pos + 3] == b'TAG' and end - pos <= 128 + 227:
+            break  # ID3v1 (y Lyrics/TAG+) al final
+        expected = None
+        next_sync = data.find(b'\xff', pos + 1)
+        if next_sync < 0:
+            break
+        pos = next_sync
+
+
+def iter_ogg_pages(data, start=0):
+    """
+    Recorrer las páginas OGG de un buffer (resincroniza en 'OggS' tras datos corruptos)
+
+    Yields:
+        OggPage: Cada página en orden
+    """
+    end = len(data)
+    pos = start
+    while pos + _OGG_HEADER.size <= end:
+        capture, version, header_type, granule, serial, _, _, segments = \
+            _OGG_HEADER.unpack_from(data, pos)
+        table_end = pos + _OGG_HEADER.size + segments
+        if capture != b'OggS' or version != 0 or table_end > end:
+            pos = data.find(b'OggS', pos + 1)
+            if pos < 0:
+                break
+            continue
+        body = sum(data[pos + _OGG_HEADER.size:table_end])
+        if table_end + body > end:
+            break  # Página truncada al final del archivo
+        yield OggPage(pos, table_end + body - pos, granule, serial, bool(header_type & 0x01),
+                      data[table_end:table_end + min(body, 64)])
+        pos = table_end + body
+
+
+def read_flac_metadata(data):
+    """
+    Leer STREAMINFO y SEEKTABLE de un FLAC
+
+    Returns:
+        FlacInfo | None: Metadatos, o None si no es un FLAC válido
+    """
+    pos = id3v2_size(data)
+    if data[pos:pos + 4] != b'fLaC':
+        return None
+    pos += 4
+    streaminfo, seekpoints = None, []
+    while pos + 4 <= len(data):
+        header = data[pos]
+        length = int.from_bytes(data[pos + 1:pos + 4], 'big')
+        block = data[pos + 4:pos + 4 + length]
+        if header & 0x7F == 0 and length >= 34:
+            streaminfo = bytes(block[:34])
+        elif header & 0x7F == 3:
+            for i in range(length // _FLAC_SEEKPOINT.size):
+                sample, offset, _ = _FLAC_SEEKPOINT.unpack_from(block, i * _FLAC_SEEKPOINT.size)
+                if sample != _FLAC_PLACEHOLDER:
+                    seekpoints.append((sample, offset))
+        pos += 4 + length
+        if header & 0x80:
+            break
+    if streaminfo is None:
+        return None
+    fields = int.from_bytes(streaminfo[10:18], 'big')
+    sample_rate = fields >> 44
+    total_samples = fields & 0xFFFFFFFFF
+    if not sample_rate:
+        return None
+    return FlacInfo(streaminfo, sample_rate, total_samples, sorted(seekpoints), pos)
+
+
+def open_mapped(path):
+    """Abrir un archivo como mmap de solo lectura (usar con `with`)"""
+    with open(path, 'rb') as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
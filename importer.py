@@ -0,0 +1,224 @@
+"""
+Importación masiva del catálogo para Spotify Picaflorino
+Recorre una carpeta o un archivo zip, extrae etiquetas y duración con
+mutagen en un pool de procesos y registra las canciones en lotes, con
+progreso reanudable y modo de prueba (dry-run)
+"""
+
+import os
+import re
+import json
+import shutil
+import logging
+import zipfile
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from mutagen import File as MutagenFile
+from search import normalize_text
+from storage import blob_lock, blob_releasable, blob_sha256, hash_file, remove_blob, reserve_blob
+
+AUDIO_EXTENSIONS = ('.mp3', '.wav', '.ogg', '.flac', '.m4a')
+
+_YEAR_RE = re.compile(r'\d{4}')
+
+
+def read_audio_tags(path):
+    """
+    Leer etiquetas, duración y hash de un archivo (se ejecuta en un proceso hijo)
+
+    Args:
+        path: Ruta del archivo de audio
+
+    Returns:
+        dict: titulo, artista, album, año, genero, duracion y sha256, o {'error': str}
+    """
+    try:
+        audio = MutagenFile(path, easy=True)
+    except Exception as e:
+        return {'error': str(e)}
+    if audio is None:
+        return {'error': 'El archivo no es un formato de audio válido'}
+
+    def tag(name):
+        try:
+            values = audio.get(name) or []
+        except (KeyError, ValueError, TypeError):
+            values = []
+        return str(values[0]).strip() if values else None
+
+    # Un archivo ilegible (permisos, borrado a mitad) solo omite esa canción
+    try:
+        sha256 = hash_file(path)
+    except OSError as e:
+        return {'error': str(e)}
+
+    year = _YEAR_RE.search(tag('date') or '')
+    genre = normalize_text(tag('genre')).strip()
+    length = getattr(audio.info, 'length', None)
+    return {
+        'titulo': tag('title'),
+        'artista': tag('artist'),
+        'album': tag('album'),
+        'año': int(year.group()) if year else None,
+        'genero': genre[:50] or None,
+        'duracion': int(length) if length else None,
+        'sha256': sha256,
+    }
+
+
+def iter_audio_files(directory):
+    """
+    Recorrer una carpeta en orden estable
+
+    Yields:
+        tuple: (ruta relativa, ruta absoluta) de cada audio
+    """
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(AUDIO_EXTENSIONS):
+                path = os.path.join(root, name)
+                yield os.path.relpath(path, directory), path
+
+
+def extract_zip_audio(zip_path, staging_dir):
+    """
+    Extraer los audios de un zip a una carpeta temporal
+
+    Los archivos se guardan con nombres generados (nunca con la ruta del
+    miembro), así un zip malicioso no puede escribir fuera de staging_dir.
+
+    Returns:
+        list: (nombre del miembro, ruta extraída)
+    """
+    entries = []
+    with zipfile.ZipFile(zip_path) as archive:
+        members = sorted((m for m in archive.infolist()
+                          if not m.is_dir() and m.filename.lower().endswith(AUDIO_EXTENSIONS)),
+                         key=lambda m: m.filename)
+        for index, member in enumerate(members):
+            _, ext = os.path.splitext(member.filename)
+            path = os.path.join(staging_dir, f'{index:06d}{ext.lower()}')
+            with archive.open(member) as src, open(path, 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            entries.append((member.filename, path))
+    return entries
+
+
+def load_progress(progress_path):
+    """Claves de archivos ya importados en ejecuciones anteriores"""
+    if not progress_path or not os.path.exists(progress_path):
+        return set()
+    with open(progress_path, encoding='utf-8') as f:
+        return {json.loads(line) for line in f if line.strip()}
+
+
+def _row_from_tags(key, tags):
+    stem = os.path.splitext(os.path.basename(key))[0]
+    return {
+        'titulo': (tags['titulo'] or stem.replace('_', ' ').strip() or stem)[:200],
+        'artista': (tags['artista'] or 'Desconocido')[:200],
+        'album': tags['album'][:200] if tags['album'] else None,
+        'año': tags['año'],
+        'genero': tags['genero'],
+        'duracion': tags['duracion'],
+    }
+
+
+def import_catalog(source, dest_dir, insert_batch, progress_path=None, dry_run=False,
+                   workers=None, batch_size=500, link=True, defaults=None):
+    """
+    Importar una carpeta o un zip de audios al catálogo
+
+    Args:
+        source: Carpeta o archivo .zip
+        dest_dir: Carpeta de música (uploads/music)
+        insert_batch: Función que recibe una lista de filas y las guarda
+        progress_path: Registro de progreso para reanudar (None = sin registro)
+        dry_run: Solo leer etiquetas, sin copiar ni guardar nada
+        workers: Procesos del pool (None = número de CPUs)
+        batch_size: Filas por inserción masiva
+        link: Usar hardlinks en vez de copias cuando sea posible (el
+            almacén por contenido reutiliza los archivos repetidos)
+        defaults: Valores comunes para cada fila (ej: subido_por)
+
+    Returns:
+        dict: {'importadas', 'ya_importadas', 'errores': [(archivo, error)], 'filas'}
+    """
+    done = load_progress(progress_path)
+    summary = {'importadas': 0, 'ya_importadas': 0, 'errores': [], 'filas': []}
+    staging_dir = None
+    os.makedirs(dest_dir, exist_ok=True)
+
+    try:
+        if zipfile.is_zipfile(source):
+            # En la misma carpeta de destino para poder mover sin copiar
+            staging_dir = tempfile.mkdtemp(prefix='.importacion-', dir=dest_dir)
+            entries = extract_zip_audio(source, staging_dir)
+            mode = 'move'
+        else:
+            entries = list(iter_audio_files(source))
+            mode = 'link' if link else 'copy'
+
+        pending = []
+        for key, path in entries:
+            if key in done:
+                summary['ya_importadas'] += 1
+            else:
+                pending.append((key, path))
+
+        batch, keys, placed = [], [], []
+
+        def flush():
+            if not batch:
+                return
+            try:
+                insert_batch(batch)
+            except Exception:
+                # Sin filas guardadas no deben quedar archivos huérfanos (salvo
+                # los que otra subida reutilizó mientras tanto)
+                for relpath, lease in placed:
+                    with blob_lock(dest_dir, blob_sha256(relpath)):
+                        if blob_releasable(dest_dir, relpath, lease):
+                            remove_blob(dest_dir, relpath)
+                raise
+            if progress_path:
+                with open(progress_path, 'a', encoding='utf-8') as f:
+                    f.write(''.join(json.dumps(key) + '\n' for key in keys))
+                    f.flush()
+                    os.fsync(f.fileno())
+            summary['importadas'] += len(batch)
+            batch.clear()
+            keys.clear()
+            placed.clear()
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = pool.map(read_audio_tags, [path for _, path in pending], chunksize=16)
+            for (key, path), tags in zip(pending, results):
+                if 'error' in tags:
+                    summary['errores'].append((key, tags['error']))
+                    continue
+
+                row = dict(defaults or {}, **_row_from_tags(key, tags))
+                if dry_run:
+                    summary['filas'].append(row)
+                    continue
+
+                # Almacén por contenido: los audios repetidos comparten archivo
+                _, ext = os.path.splitext(key)
+                relpath, created, lease = reserve_blob(path, dest_dir, tags['sha256'], ext, mode)
+                row['archivo_audio'] = relpath
+                batch.append(row)
+                keys.append(key)
+                if created:
+                    placed.append((relpath, lease))
+                if len(batch) >= batch_size:
+                    flush()
+            flush()
+    finally:
+        if staging_dir:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+    for key, error in summary['errores']:
+        logging.warning(f"Importación: {key} omitido ({error})")
+    return summary
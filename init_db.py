@@ -8,14 +8,26 @@ para el funcionamiento del sistema educativo musical.
 
 import os
 import sys
+import hashlib
+import argparse
 from datetime import datetime, timedelta
 from werkzeug.security import generate_password_hash
 
 # Agregar el directorio padre al path para importar los módulos
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from app import app, db, Usuario, Cancion, Playlist, PlaylistCancion, Reproduccion
+from app import (app, db, Usuario, Cancion, Playlist, PlaylistCancion, Reproduccion,
+                 TrabajoMedia, VersionAudio, Contador, CoocurrenciaCancion, CancionSimilar, EstadoRadio,
+                 media_jobs, search_backend, actualizar_radio,
+                 recalcular_agregados_playlists, encolar_versiones, encolar_segmentos,
+                 encolar_indice_busqueda, encolar_picos, reservar_versiones_catalogo,
+                 renumerar_playlist, audio_encoder)
 from config import config
+from importer import import_catalog
+from storage import blob_abspath, is_blob_path, migrate_file
+from seekindex import seek_format, seek_index_path
+from peaks import peaks_path
+from ordering import spaced_ranks
 
 def init_database():
     """Inicializar la base de datos con todas las tablas"""
@@ -414,8 +426,9 @@ def create_sample_playlists():
         db.session.add(playlist)
         db.session.flush()  # Para obtener el ID
         
-        # Agregar canciones a la playlist
-        for orden, cancion_titulo in enumerate(playlist_data['canciones'], 1):
+        # Agregar canciones a la playlist (posiciones con hueco para mover sin renumerar)
+        ordenes = spaced_ranks(len(playlist_data['canciones']), app.config['PLAYLIST_ORDER_GAP'])
+        for orden, cancion_titulo in zip(ordenes, playlist_data['canciones']):
             cancion = Cancion.query.filter_by(titulo=cancion_titulo).first()
             if cancion:
                 playlist_cancion = PlaylistCancion(
@@ -511,6 +524,426 @@ def show_database_info():
         except Exception as e:
             print(f"❌ Error al obtener información: {str(e)}")
 
+def rebuild_search_index():
+    """Crear o reconstruir el índice de búsqueda de canciones"""
+    print(f"🔎 Reconstruyendo índice de búsqueda ({search_backend.name})...")
+    
+    with app.app_context():
+        try:
+            with db.engine.begin() as connection:
+                search_backend.create_index(connection)
+            print("✅ Índice de búsqueda actualizado")
+        except Exception as e:
+            print(f"❌ Error al reconstruir el índice: {str(e)}")
+
+def migrate_schema():
+    """Agregar las columnas, tablas e índices nuevos que falten en una base existente"""
+    print("🧱 Migrando el esquema de la base de datos...")
+    
+    with app.app_context():
+        try:
+            estado = ("ENUM('procesando','listo','error')" if db.engine.dialect.name == 'mysql'
+                      else "VARCHAR(10)")
+            nuevas_columnas = [
+                # Agregados de playlists
+                ('playlists', 'total_canciones', "INTEGER NOT NULL DEFAULT 0"),
+                ('playlists', 'duracion_total', "INTEGER NOT NULL DEFAULT 0"),
+                # Estado de procesamiento de canciones (cola de trabajos multimedia)
+                ('canciones', 'estado', f"{estado} NOT NULL DEFAULT 'listo'"),
+                # Derivados de imágenes
+                ('canciones', 'cover_key', "VARCHAR(32)"),
+                ('canciones', 'cover_placeholder', "TEXT"),
+                ('playlists', 'cover_key', "VARCHAR(32)"),
+                ('playlists', 'cover_placeholder', "TEXT"),
+                ('usuarios', 'avatar_key', "VARCHAR(32)"),
+                ('usuarios', 'avatar_placeholder', "TEXT"),
+                # Calidad de audio preferida
+                ('usuarios', 'calidad_audio', "VARCHAR(20)"),
+                # Streaming segmentado
+                ('canciones', 'segmentos', "INTEGER"),
+                # Versión del catálogo (deltas de /api/canciones?since=)
+                ('canciones', 'version_catalogo', "INTEGER NOT NULL DEFAULT 0"),
+                # Marca de agua con retraso de la radio
+                ('estado_radio', 'tope_reproduccion', "INTEGER NOT NULL DEFAULT 0"),
+                ('estado_radio', 'fecha_tope', "DATETIME"),
+            ]
+            inspector = db.inspect(db.engine)
+            # Las tablas que aún no existen se crean más abajo con todas sus columnas
+            existentes = {tabla: {c['name'] for c in inspector.get_columns(tabla)}
+                          for tabla in {tabla for tabla, _, _ in nuevas_columnas}
+                          if inspector.has_table(tabla)}
+            with db.engine.begin() as connection:
+                for tabla, columna, tipo in nuevas_columnas:
+                    if tabla in existentes and columna not in existentes[tabla]:
+                        connection.execute(db.text(f"ALTER TABLE {tabla} ADD COLUMN {columna} {tipo}"))
+                        print(f"   ✅ Columna {tabla}.{columna} agregada")
+            
+            # Tablas de la cola de trabajos y de versiones si la base es anterior a ellas
+            TrabajoMedia.__table__.create(db.engine, checkfirst=True)
+            VersionAudio.__table__.create(db.engine, checkfirst=True)
+            Contador.__table__.create(db.engine, checkfirst=True)
+            # Tablas de la radio personalizada
+            for modelo in (CoocurrenciaCancion, CancionSimilar, EstadoRadio):
+                modelo.__table__.create(db.engine, checkfirst=True)
+            
+            # Índices nuevos de tablas existentes
+            for tabla, nombre in ((Cancion.__table__, 'ix_canciones_activo_fecha'),
+                                  (Playlist.__table__, 'ix_playlists_publica_fecha'),
+                                  (Cancion.__table__, 'ix_canciones_version_catalogo'),
+                                  (PlaylistCancion.__table__, 'ix_playlist_canciones_playlist_orden'),
+                                  (Reproduccion.__table__, 'ix_reproducciones_usuario_cancion')):
+                for indice in tabla.indexes:
+                    if indice.name == nombre:
+                        indice.create(db.engine, checkfirst=True)
+            
+            # Versión inicial para las canciones anteriores al contador
+            sin_version = db.session.scalar(
+                db.select(db.func.count()).select_from(Cancion).where(Cancion.version_catalogo == 0))
+            if sin_version:
+                # Un bloque de versiones del tamaño del mayor id: id + base no se repite
+                mayor_id = db.session.scalar(db.select(db.func.max(Cancion.id)))
+                base = reservar_versiones_catalogo(db.session, mayor_id) - 1
+                db.session.execute(db.update(Cancion).where(Cancion.version_catalogo == 0)
+                                     .values(version_catalogo=Cancion.id + base))
+                db.session.commit()
+                print(f"   ✅ {sin_version} canciones con versión de catálogo")
+            print("✅ Esquema actualizado")
+        except Exception as e:
+            print(f"❌ Error al migrar el esquema: {str(e)}")
+            db.session.rollback()
+
+def repair_playlist_aggregates():
+    """Espaciar las playlists con orden denso y recalcular los agregados de playlists"""
+    print("🔧 Recalculando agregados de playlists...")
+    
+    with app.app_context():
+        try:
+            # Solo las playlists con vecinos a menos de PLAYLIST_ORDER_GAP (orden
+            # denso heredado o huecos agotados); las ya espaciadas no se tocan
+            saltos = db.select(
+                PlaylistCancion.playlist_id,
+                (PlaylistCancion.orden - db.func.lag(PlaylistCancion.orden).over(
+                    partition_by=PlaylistCancion.playlist_id,
+                    order_by=(PlaylistCancion.orden, PlaylistCancion.id))).label('salto')
+            ).subquery()
+            playlist_ids = db.session.scalars(
+                db.select(saltos.c.playlist_id).distinct()
+                  .where(saltos.c.salto < app.config['PLAYLIST_ORDER_GAP'])
+            ).all()
+            for playlist_id in playlist_ids:
+                renumerar_playlist(playlist_id)
+            db.session.commit()
+            print(f"   ✅ {len(playlist_ids)} playlists renumeradas")
+            
+            total = recalcular_agregados_playlists()
+            print(f"✅ {total} playlists actualizadas")
+        except Exception as e:
+            print(f"❌ Error al recalcular agregados: {str(e)}")
+            db.session.rollback()
+
+def migrate_audio_storage():
+    """Mover los audios con nombre plano al almacén direccionado por contenido"""
+    print("📦 Migrando audios al almacenamiento por contenido...")
+    
+    music_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'music')
+    with app.app_context():
+        try:
+            archivos = [a for a in db.session.scalars(db.select(Cancion.archivo_audio).distinct())
+                        if not is_blob_path(a)]
+            migrados = duplicados = 0
+            faltantes = []
+            pendientes_de_borrar = []
+            
+            for i, archivo in enumerate(archivos, 1):
+                nuevo, creado = migrate_file(music_dir, archivo)
+                if nuevo is None:
+                    faltantes.append(archivo)
+                    continue
+                # Una sola actualización por archivo (todas las canciones que lo usan)
+                db.session.execute(
+                    db.update(Cancion).where(Cancion.archivo_audio == archivo)
+                      .values(archivo_audio=nuevo)
+                )
+                pendientes_de_borrar.append(os.path.join(music_dir, archivo))
+                migrados += 1
+                duplicados += 0 if creado else 1
+                
+                if i % 200 == 0 or i == len(archivos):
+                    db.session.commit()
+                    # El original se borra solo cuando la BD ya apunta al blob
+                    for ruta in pendientes_de_borrar:
+                        os.unlink(ruta)
+                    pendientes_de_borrar = []
+            db.session.commit()
+            for ruta in pendientes_de_borrar:
+                os.unlink(ruta)
+            
+            print(f"✅ {migrados} archivos migrados ({duplicados} eran duplicados)")
+            for archivo in faltantes:
+                print(f"   ⚠️  No se encontró {archivo}")
+        except Exception as e:
+            print(f"❌ Error durante la migración: {str(e)}")
+            db.session.rollback()
+
+def backfill_image_derivatives():
+    """Generar derivados (WebP/JPEG por tamaño y marcador borroso) de imágenes existentes"""
+    print("🖼️  Generando derivados de portadas y avatares...")
+    
+    uploads = app.config['UPLOAD_FOLDER']
+    with app.app_context():
+        try:
+            encolados = 0
+            for cancion in Cancion.query.filter(Cancion.cover_image.isnot(None),
+                                                Cancion.cover_key.is_(None)):
+                media_jobs.enqueue('portada', {
+                    'path': os.path.join(uploads, 'covers', cancion.cover_image),
+                    'filename': cancion.cover_image, 'compress': False
+                }, cancion_id=cancion.id)
+                encolados += 1
+            for playlist in Playlist.query.filter(Playlist.cover_image.isnot(None),
+                                                  Playlist.cover_key.is_(None)):
+                media_jobs.enqueue('portada_playlist', {
+                    'path': os.path.join(uploads, 'covers', playlist.cover_image),
+                    'filename': playlist.cover_image, 'compress': False,
+                    'playlist_id': playlist.id
+                })
+                encolados += 1
+            for usuario in Usuario.query.filter(Usuario.avatar.isnot(None),
+                                                Usuario.avatar_key.is_(None)):
+                media_jobs.enqueue('avatar', {
+                    'path': os.path.join(uploads, 'avatars', usuario.avatar),
+                    'filename': usuario.avatar, 'compress': False,
+                    'usuario_id': usuario.id
+                })
+                encolados += 1
+            db.session.commit()
+            print(f"   📋 {encolados} imágenes en cola")
+            
+            procesados = media_jobs.drain(app.config['MEDIA_JOBS_CONCURRENCY'])
+            print(f"✅ {procesados} trabajos procesados")
+            errores = media_jobs.stats().get('error', {})
+            if errores:
+                print(f"   ⚠️  Trabajos con error: {errores}")
+        except Exception as e:
+            print(f"❌ Error al generar derivados: {str(e)}")
+            db.session.rollback()
+
+def backfill_audio_renditions():
+    """Generar las versiones por calidad (AUDIO_QUALITY) de las canciones existentes"""
+    print("🎚️  Generando versiones de audio por calidad...")
+    
+    if audio_encoder is None:
+        print(f"❌ No se encontró el codificador {app.config['AUDIO_ENCODER']} (instale ffmpeg)")
+        return
+    
+    with app.app_context():
+        try:
+            # Canciones a las que les falta alguna versión (las omitidas se recalculan rápido)
+            niveles = len(app.config['AUDIO_QUALITY'])
+            con_versiones = (db.select(VersionAudio.cancion_id)
+                               .group_by(VersionAudio.cancion_id)
+                               .having(db.func.count() >= niveles))
+            encolados = 0
+            for cancion in Cancion.query.filter(Cancion.id.not_in(con_versiones)):
+                encolar_versiones(cancion)
+                encolados += 1
+            db.session.commit()
+            print(f"   📋 {encolados} canciones en cola")
+            
+            procesados = media_jobs.drain(app.config['MEDIA_JOBS_CONCURRENCY'])
+            print(f"✅ {procesados} trabajos procesados")
+            errores = media_jobs.stats().get('error', {})
+            if errores:
+                print(f"   ⚠️  Trabajos con error: {errores}")
+        except Exception as e:
+            print(f"❌ Error al generar versiones: {str(e)}")
+            db.session.rollback()
+
+def backfill_audio_segments():
+    """Cortar en segmentos (streaming estilo HLS) las canciones existentes"""
+    print("✂️  Generando segmentos de audio...")
+    
+    with app.app_context():
+        try:
+            encolados = omitidas = 0
+            for cancion in Cancion.query.filter(Cancion.segmentos.is_(None)):
+                if encolar_segmentos(cancion):
+                    encolados += 1
+                else:
+                    omitidas += 1
+            db.session.commit()
+            print(f"   📋 {encolados} canciones en cola")
+            if omitidas:
+                print(f"   ⚠️  {omitidas} omitidas (sin ffmpeg para formatos que no son MP3, "
+                      "o audios pendientes de 'migrate-storage')")
+            
+            procesados = media_jobs.drain(app.config['MEDIA_JOBS_CONCURRENCY'])
+            print(f"✅ {procesados} trabajos procesados")
+            errores = media_jobs.stats().get('error', {})
+            if errores:
+                print(f"   ⚠️  Trabajos con error: {errores}")
+        except Exception as e:
+            print(f"❌ Error al generar segmentos: {str(e)}")
+            db.session.rollback()
+
+def backfill_seek_index():
+    """Construir el índice de búsqueda tiempo→byte de los audios existentes"""
+    print("⏱️  Construyendo índices de búsqueda...")
+    
+    music_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'music')
+    with app.app_context():
+        try:
+            # Un trabajo por archivo: las canciones que comparten blob comparten índice
+            encolados = 0
+            vistos = set()
+            for cancion in Cancion.query.order_by(Cancion.id):
+                archivo = cancion.archivo_audio
+                if archivo in vistos or seek_format(archivo) is None:
+                    continue
+                vistos.add(archivo)
+                if not os.path.exists(seek_index_path(os.path.join(music_dir, archivo))):
+                    encolados += encolar_indice_busqueda(cancion)
+            for version in VersionAudio.query.order_by(VersionAudio.id):
+                ruta = blob_abspath(music_dir, version.archivo)
+                if (version.archivo not in vistos and seek_format(ruta) is not None
+                        and not os.path.exists(seek_index_path(ruta))):
+                    vistos.add(version.archivo)
+                    media_jobs.enqueue('indice_busqueda', {'path': ruta})
+                    encolados += 1
+            db.session.commit()
+            print(f"   📋 {encolados} archivos en cola")
+            
+            procesados = media_jobs.drain(app.config['MEDIA_JOBS_CONCURRENCY'])
+            print(f"✅ {procesados} trabajos procesados")
+            errores = media_jobs.stats().get('error', {})
+            if errores:
+                print(f"   ⚠️  Trabajos con error: {errores}")
+        except Exception as e:
+            print(f"❌ Error al construir índices: {str(e)}")
+            db.session.rollback()
+
+def backfill_waveform_peaks():
+    """Calcular los picos de forma de onda de los audios existentes"""
+    print("〰️  Calculando formas de onda...")
+    
+    music_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'music')
+    with app.app_context():
+        try:
+            # Un trabajo por archivo: las canciones que comparten blob comparten picos
+            encolados = omitidas = 0
+            vistos = set()
+            for cancion in Cancion.query.order_by(Cancion.id):
+                archivo = cancion.archivo_audio
+                if archivo in vistos or os.path.exists(peaks_path(os.path.join(music_dir, archivo))):
+                    continue
+                vistos.add(archivo)
+                if encolar_picos(cancion):
+                    encolados += 1
+                else:
+                    omitidas += 1
+            db.session.commit()
+            print(f"   📋 {encolados} archivos en cola")
+            if omitidas:
+                print(f"   ⚠️  {omitidas} omitidos (sin ffmpeg solo se decodifican archivos WAV)")
+            
+            procesados = media_jobs.drain(app.config['MEDIA_JOBS_CONCURRENCY'])
+            print(f"✅ {procesados} trabajos procesados")
+            errores = media_jobs.stats().get('error', {})
+            if errores:
+                print(f"   ⚠️  Trabajos con error: {errores}")
+        except Exception as e:
+            print(f"❌ Error al calcular formas de onda: {str(e)}")
+            db.session.rollback()
+
+def update_radio(argv):
+    """Incorporar las reproducciones nuevas a la radio personalizada (--completo: desde cero)"""
+    completo = '--completo' in argv
+    print("📻 Recalculando desde cero la radio personalizada..." if completo
+          else "📻 Actualizando la radio personalizada...")
+    
+    with app.app_context():
+        try:
+            resumen = actualizar_radio(completo=completo)
+            print(f"   📊 {resumen['reproducciones']} reproducciones nuevas, {resumen['pares']} pares actualizados")
+            print(f"✅ {resumen['canciones']} canciones con recomendaciones recalculadas")
+        except Exception as e:
+            print(f"❌ Error al actualizar la radio: {str(e)}")
+            db.session.rollback()
+
+def import_music(argv):
+    """Importar una carpeta o un zip de audios como canciones del catálogo"""
+    parser = argparse.ArgumentParser(prog='python init_db.py import')
+    parser.add_argument('origen', help='Carpeta o archivo .zip con los audios')
+    parser.add_argument('--email', default='admin@ie30012.edu.pe',
+                        help='Docente o administrador que figurará como autor')
+    parser.add_argument('--dry-run', action='store_true', help='Solo mostrar lo que se importaría')
+    parser.add_argument('--workers', type=int, default=None, help='Procesos para leer etiquetas')
+    parser.add_argument('--copiar', action='store_true', help='Copiar en vez de usar hardlinks')
+    parser.add_argument('--materia', default=None)
+    parser.add_argument('--grado', default=None)
+    args = parser.parse_args(argv)
+    
+    print(f"📥 Importando canciones desde {args.origen}...")
+    
+    with app.app_context():
+        autor = Usuario.query.filter_by(email=args.email).first()
+        if not autor or not autor.puede_subir_musica():
+            print(f"❌ {args.email} no existe o no puede subir música")
+            return
+        
+        def insertar_lote(filas):
+            try:
+                # La inserción masiva no pasa por before_flush: versionar aquí
+                version = reservar_versiones_catalogo(db.session, len(filas))
+                for fila in filas:
+                    fila['version_catalogo'] = version
+                    version += 1
+                db.session.execute(db.insert(Cancion), filas)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            print(f"   ✅ {len(filas)} canciones guardadas")
+        
+        # Un registro de progreso por origen para poder reanudar
+        origen = os.path.abspath(args.origen)
+        os.makedirs(app.config['IMPORT_PROGRESS_DIR'], exist_ok=True)
+        progreso = os.path.join(app.config['IMPORT_PROGRESS_DIR'],
+                                f"importacion.{hashlib.sha1(origen.encode()).hexdigest()[:12]}.progress")
+        
+        try:
+            resumen = import_catalog(
+                origen,
+                os.path.join(app.config['UPLOAD_FOLDER'], 'music'),
+                insertar_lote,
+                progress_path=None if args.dry_run else progreso,
+                dry_run=args.dry_run,
+                workers=args.workers,
+                batch_size=app.config['IMPORT_BATCH_SIZE'],
+                link=not args.copiar,
+                defaults={'subido_por': autor.id, 'materia': args.materia,
+                          'grado_objetivo': args.grado}
+            )
+        except Exception as e:
+            print(f"❌ Error durante la importación: {str(e)}")
+            print("   Vuelva a ejecutar el comando para continuar desde el último lote guardado")
+            return
+        
+        if args.dry_run:
+            for fila in resumen['filas']:
+                print(f"   • {fila['titulo']} - {fila['artista']} ({fila['duracion'] or 0}s)")
+            print(f"🔍 {len(resumen['filas'])} canciones se importarían")
+        else:
+            print(f"✅ {resumen['importadas']} canciones importadas")
+            if resumen['importadas']:
+                # La inserción masiva no dispara los eventos del ORM
+                with db.engine.begin() as connection:
+                    search_backend.create_index(connection)
+        if resumen['ya_importadas']:
+            print(f"⏭️  {resumen['ya_importadas']} ya importadas anteriormente")
+        for archivo, error in resumen['errores']:
+            print(f"   ⚠️  {archivo}: {error}")
+
 if __name__ == '__main__':
     print("🎵 Spotify Picaflorino - Inicializador de Base de Datos")
     print("=" * 60)
@@ -526,17 +959,51 @@ if __name__ == '__main__':
             reset_database()
         elif command == 'info':
             show_database_info()
+        elif command == 'reindex':
+            rebuild_search_index()
+        elif command == 'migrate':
+            migrate_schema()
+        elif command == 'repair':
+            repair_playlist_aggregates()
+        elif command == 'import':
+            import_music(sys.argv[2:])
+        elif command == 'migrate-storage':
+            migrate_audio_storage()
+        elif command == 'images':
+            backfill_image_derivatives()
+        elif command == 'renditions':
+            backfill_audio_renditions()
+        elif command == 'segments':
+            backfill_audio_segments()
+        elif command == 'seek-index':
+            backfill_seek_index()
+        elif command == 'peaks':
+            backfill_waveform_peaks()
+        elif command == 'radio':
+            update_radio(sys.argv[2:])
         else:
             print(f"❌ Comando desconocido: {command}")
-            print("Comandos disponibles: init, reset, info")
+            print("Comandos disponibles: init, reset, info, reindex, migrate, repair, import, "
+                  "migrate-storage, images, renditions, segments, seek-index, peaks, radio")
     else:
         print("Comandos disponibles:")
         print("  python init_db.py init  - Inicializar base de datos")
         print("  python init_db.py reset - Resetear base de datos (elimina todo)")
         print("  python init_db.py info  - Mostrar información de la BD")
+        print("  python init_db.py reindex - Reconstruir índice de búsqueda")
+        print("  python init_db.py migrate - Agregar columnas, tablas e índices nuevos")
+        print("  python init_db.py repair - Espaciar playlists densas y recalcular agregados")
+        print("  python init_db.py import <carpeta|zip> [--dry-run] - Importar canciones en lote")
+        print("  python init_db.py migrate-storage - Mover audios al almacenamiento por contenido")
+        print("  python init_db.py images - Generar derivados de portadas y avatares")
+        print("  python init_db.py renditions - Generar versiones de audio por calidad")
+        print("  python init_db.py segments - Cortar audios en segmentos para streaming")
+        print("  python init_db.py seek-index - Construir índices de búsqueda (MP3/OGG/FLAC)")
+        print("  python init_db.py peaks - Calcular formas de onda para el reproductor")
+        print("  python init_db.py radio [--completo] - Actualizar la radio personalizada")
         print()
         
-        command = input("Seleccione una opción (init/reset/info): ").strip().lower()
+        command = input("Seleccione una opción (init/reset/info/reindex/migrate/repair/migrate-storage/images/renditions/segments/seek-index/peaks/radio): ").strip().lower()
         
         if command == 'init':
             init_database()
@@ -544,5 +1011,25 @@ if __name__ == '__main__':
             reset_database()
         elif command == 'info':
             show_database_info()
+        elif command == 'reindex':
+            rebuild_search_index()
+        elif command == 'migrate':
+            migrate_schema()
+        elif command == 'repair':
+            repair_playlist_aggregates()
+        elif command == 'migrate-storage':
+            migrate_audio_storage()
+        elif command == 'images':
+            backfill_image_derivatives()
+        elif command == 'renditions':
+            backfill_audio_renditions()
+        elif command == 'segments':
+            backfill_audio_segments()
+        elif command == 'seek-index':
+            backfill_seek_index()
+        elif command == 'peaks':
+            backfill_waveform_peaks()
+        elif command == 'radio':
+            update_radio([])
         else:
             print("❌ Opción no válida")
@@ -0,0 +1,313 @@
+"""
+Cola de trabajos de procesamiento multimedia para Spotify Picaflorino
+Cola durable respaldada por una tabla de la base de datos, con reintentos,
+límite de concurrencia y un pool de procesos para el trabajo de CPU
+(Pillow, mutagen) fuera de los workers web
+"""
+
+import json
+import time
+import logging
+from datetime import datetime, timedelta
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+
+class JobQueue:
+    """
+    Cola de trabajos sobre el modelo TrabajoMedia
+
+    Cada tipo de trabajo registra una tarea (función de nivel de módulo que
+    recibe el payload y se ejecuta en un proceso hijo) y callbacks opcionales
+    que aplican el resultado en la base de datos desde el proceso principal.
+    """
+
+    def __init__(self, app, db, model, max_attempts=3, retry_delay=30,
+                 visibility_timeout=3600, heartbeat_interval=60):
+        """
+        Args:
+            app: Aplicación Flask (para el contexto de aplicación)
+            db: Instancia de SQLAlchemy
+            model: Modelo de la tabla de trabajos
+            max_attempts: Intentos antes de marcar un trabajo como error
+            retry_delay: Segundos base de espera entre reintentos (exponencial)
+            visibility_timeout: Segundos sin latido tras los que un trabajo
+                'procesando' se considera abandonado y vuelve a la cola
+            heartbeat_interval: Segundos entre latidos de los trabajos en curso
+                (deben ser bastante menos que visibility_timeout)
+        """
+        self.app = app
+        self.db = db
+        self.model = model
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.visibility_timeout = visibility_timeout
+        self.heartbeat_interval = heartbeat_interval
+        self._handlers = {}
+
+    def register(self, tipo, task, on_success=None, on_failure=None):
+        """
+        Registrar un tipo de trabajo
+
+        Args:
+            tipo: Nombre del tipo (ej: 'portada')
+            task: Función pura task(payload) -> dict, ejecutada en un proceso hijo
+            on_success: Callback(trabajo, resultado) con contexto de aplicación
+            on_failure: Callback(trabajo, error) cuando se agotan los reintentos
+        """
+        self._handlers[tipo] = (task, on_success, on_failure)
+
+    def enqueue(self, tipo, payload, cancion_id=None):
+        """
+        Agregar un trabajo a la sesión actual (se guarda con el commit del llamador)
+
+        Returns:
+            Trabajo creado
+        """
+        if tipo not in self._handlers:
+            raise ValueError(f'Tipo de trabajo desconocido: {tipo}')
+        trabajo = self.model(tipo=tipo, cancion_id=cancion_id, payload=json.dumps(payload))
+        self.db.session.add(trabajo)
+        return trabajo
+
+    def stats(self):
+        """
+        Profundidad de la cola por estado y tipo
+
+        Returns:
+            dict: {'pendiente': {'portada': 3}, 'error': {...}, ...}
+        """
+        filas = self.db.session.execute(
+            self.db.select(self.model.estado, self.model.tipo, self.db.func.count())
+                   .group_by(self.model.estado, self.model.tipo)
+        ).all()
+        resumen = {}
+        for estado, tipo, total in filas:
+            resumen.setdefault(estado, {})[tipo] = total
+        return resumen
+
+    # Reclamación y cierre de trabajos
+    def _requeue_abandoned(self):
+        limite = datetime.utcnow() - timedelta(seconds=self.visibility_timeout)
+        self.db.session.execute(
+            self.db.update(self.model)
+                   .where(self.model.estado == 'procesando',
+                          self.model.fecha_actualizacion < limite)
+                   .values(estado='pendiente')
+        )
+        self.db.session.commit()
+
+    def claim(self, limit):
+        """
+        Reclamar hasta `limit` trabajos pendientes de forma atómica
+
+        El UPDATE condicionado al estado garantiza que dos procesos worker
+        nunca tomen el mismo trabajo.
+
+        Returns:
+            list: Trabajos reclamados (estado 'procesando')
+        """
+        ahora = datetime.utcnow()
+        candidatos = self.db.session.scalars(
+            self.db.select(self.model.id)
+                   .where(self.model.estado == 'pendiente',
+                          self.model.disponible_desde <= ahora)
+                   .order_by(self.model.id)
+                   .limit(limit)
+        ).all()
+
+        reclamados = []
+        for trabajo_id in candidatos:
+            resultado = self.db.session.execute(
+                self.db.update(self.model)
+                       .where(self.model.id == trabajo_id, self.model.estado == 'pendiente')
+                       .values(estado='procesando', fecha_actualizacion=ahora,
+                               intentos=self.model.intentos + 1)
+            )
+            if resultado.rowcount == 1:
+                reclamados.append(trabajo_id)
+        self.db.session.commit()
+
+        if not reclamados:
+            return []
+        return self.db.session.scalars(
+            self.db.select(self.model).where(self.model.id.in_(reclamados))
+                   .order_by(self.model.id)
+        ).all()
+
+    def _heartbeat(self, trabajos):
+        """Renovar fecha_actualizacion de los trabajos en curso para que no se reclamen"""
+        self.db.session.execute(
+            self.db.update(self.model)
+                   .where(self.model.id.in_([trabajo.id for trabajo in trabajos]),
+                          self.model.estado == 'procesando')
+                   .values(fecha_actualizacion=datetime.utcnow())
+                   .execution_options(synchronize_session=False)
+        )
+        self.db.session.commit()
+
+    def _finish(self, trabajo, resultado=None, error=None):
+        _, on_success, on_failure = self._handlers[trabajo.tipo]
+        if error is None and on_success is not None:
+            try:
+                on_success(trabajo, resultado)
+            except Exception as e:
+                self.db.session.rollback()
+                error = e
+
+        trabajo.fecha_actualizacion = datetime.utcnow()
+        if error is None:
+            trabajo.estado = 'completado'
+            trabajo.error = None
+        elif trabajo.intentos < self.max_attempts:
+            espera = self.retry_delay * 2 ** (trabajo.intentos - 1)
+            trabajo.estado = 'pendiente'
+            trabajo.error = str(error)
+            trabajo.disponible_desde = datetime.utcnow() + timedelta(seconds=espera)
+            logging.warning(f"Trabajo {trabajo.id} ({trabajo.tipo}) falló, reintento en {espera}s: {error}")
+        else:
+            if on_failure is not None:
+                try:
+                    on_failure(trabajo, error)
+                except Exception as e:
+                    # El estado final se guarda igual: si no, el trabajo se reclamaría para siempre
+                    self.db.session.rollback()
+                    logging.error(f"Trabajo {trabajo.id} ({trabajo.tipo}): error en on_failure: {e}")
+            trabajo.estado = 'error'
+            trabajo.error = str(error)
+            trabajo.fecha_actualizacion = datetime.utcnow()
+            logging.error(f"Trabajo {trabajo.id} ({trabajo.tipo}) descartado tras "
+                          f"{trabajo.intentos} intentos: {error}")
+        self.db.session.commit()
+
+    def _release(self, trabajos):
+        """Devolver a la cola trabajos reclamados que no llegaron a ejecutarse (sin gastar intento)"""
+        if not trabajos:
+            return
+        self.db.session.execute(
+            self.db.update(self.model)
+                   .where(self.model.id.in_([trabajo.id for trabajo in trabajos]),
+                          self.model.estado == 'procesando')
+                   .values(estado='pendiente', intentos=self.model.intentos - 1)
+                   .execution_options(synchronize_session=False)
+        )
+        self.db.session.commit()
+
+    # Ejecución
+    def run_pending(self, executor=None, limit=None):
+        """
+        Ejecutar una ronda de trabajos pendientes
+
+        Args:
+            executor: Pool de procesos; None ejecuta las tareas en línea
+            limit: Máximo de trabajos de la ronda (límite de concurrencia)
+
+        Returns:
+            int: Número de trabajos procesados
+
+        Raises:
+            BrokenProcessPool: Un proceso hijo murió; los trabajos de la ronda
+                ya quedaron cerrados o de vuelta en la cola y hay que recrear el pool
+        """
+        self._requeue_abandoned()
+        trabajos = self.claim(limit or 10)
+        if not trabajos:
+            return 0
+
+        if executor is None:
+            for trabajo in trabajos:
+                task = self._handlers[trabajo.tipo][0]
+                try:
+                    resultado = task(json.loads(trabajo.payload))
+                except Exception as e:
+                    self._finish(trabajo, error=e)
+                else:
+                    self._finish(trabajo, resultado)
+            return len(trabajos)
+
+        futuros, roto = {}, None
+        for trabajo in trabajos:
+            try:
+                futuros[executor.submit(self._handlers[trabajo.tipo][0],
+                                        json.loads(trabajo.payload))] = trabajo
+            except BrokenProcessPool as e:
+                roto = e
+                break
+        self._release(trabajos[len(futuros):])
+        pendientes = set(futuros)
+        while pendientes:
+            # Un transcode largo sigue latiendo: no vuelve a la cola mientras corre
+            listos, pendientes = wait(pendientes, timeout=self.heartbeat_interval,
+                                      return_when=FIRST_COMPLETED)
+            for futuro in listos:
+                trabajo = futuros[futuro]
+                try:
+                    resultado = futuro.result()
+                except Exception as e:
+                    # Un hijo que muere cuenta como intento fallido de los trabajos en curso
+                    if isinstance(e, BrokenProcessPool):
+                        roto = e
+                    self._finish(trabajo, error=e)
+                else:
+                    self._finish(trabajo, resultado)
+            if pendientes:
+                self._heartbeat([futuros[futuro] for futuro in pendientes])
+        if roto is not None:
+            raise roto
+        return len(trabajos)
+
+    def run_forever(self, concurrency=2, poll_interval=2.0):
+        """Bucle del proceso worker: reclama y ejecuta trabajos sin parar"""
+        logging.info(f"Worker de trabajos multimedia iniciado ({concurrency} procesos)")
+        executor = ProcessPoolExecutor(max_workers=concurrency)
+        try:
+            while True:
+                with self.app.app_context():
+                    try:
+                        procesados = self.run_pending(executor, limit=concurrency)
+                    except BrokenProcessPool:
+                        executor = self._replace_pool(executor, concurrency)
+                        procesados = 0
+                    except Exception as e:
+                        logging.error(f"Error en el worker de trabajos: {str(e)}")
+                        self.db.session.rollback()
+                        procesados = 0
+                if not procesados:
+                    time.sleep(poll_interval)
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+    def _replace_pool(self, executor, concurrency):
+        """Un pool con un hijo muerto (OOM, fallo de Pillow o NumPy) no vuelve a funcionar"""
+        logging.error("Un proceso del pool terminó de forma abrupta: se recrea el pool")
+        self.db.session.rollback()
+        executor.shutdown(wait=False, cancel_futures=True)
+        return ProcessPoolExecutor(max_workers=concurrency)
+
+    def drain(self, concurrency=2):
+        """
+        Procesar la cola con el pool de procesos hasta dejarla vacía
+        (comandos de mantenimiento como el backfill de imágenes)
+
+        Returns:
+            int: Número de trabajos procesados
+        """
+        total = 0
+        executor = ProcessPoolExecutor(max_workers=concurrency)
+        try:
+            while True:
+                try:
+                    procesados = self.run_pending(executor, limit=concurrency * 4)
+                except BrokenProcessPool:
+                    executor = self._replace_pool(executor, concurrency)
+                    continue
+                if not procesados:
+                    return total
+                total += procesados
+        finally:
+            executor.shutdown()
+
+    def run_inline(self):
+        """Procesar la cola en el proceso actual (desarrollo y pruebas)"""
+        while self.run_pending():
+            pass
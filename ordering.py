@@ -0,0 +1,36 @@
+"""
+Orden disperso de listas para Spotify Picaflorino
+Las posiciones son enteros separados por un hueco (1024, 2048, ...): agregar
+o mover un elemento solo cambia su propia fila, tomando un valor entre sus
+dos vecinos; cuando ya no queda hueco se renumera la lista completa
+"""
+
+DEFAULT_GAP = 1024
+
+
+def rank_between(before, after, gap=DEFAULT_GAP):
+    """
+    Posición para un elemento entre dos vecinos
+
+    Args:
+        before: Posición del vecino anterior (None = el elemento va primero)
+        after: Posición del vecino siguiente (None = el elemento va al final)
+        gap: Separación entre posiciones al agregar en un extremo
+
+    Returns:
+        int | None: Posición nueva, o None si no queda hueco entre los vecinos
+    """
+    if before is None and after is None:
+        return gap
+    if before is None:
+        return after - gap
+    if after is None:
+        return before + gap
+    if after - before < 2:
+        return None
+    return before + (after - before) // 2
+
+
+def spaced_ranks(count, gap=DEFAULT_GAP):
+    """Posiciones espaciadas para `count` elementos en orden (renumeración)"""
+    return [gap * (position + 1) for position in range(count)]
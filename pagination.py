@@ -0,0 +1,127 @@
+"""
+Paginación por cursor (keyset) para Spotify Picaflorino
+Evita el COUNT(*) y el OFFSET creciente de la paginación clásica usando
+cursores opacos basados en (fecha, id)
+"""
+
+import json
+import base64
+from datetime import datetime
+from sqlalchemy import and_, or_
+
+
+def encode_cursor(direction, value, row_id):
+    """
+    Codificar un cursor opaco
+
+    Args:
+        direction: 'next' (páginas más antiguas) o 'prev' (más recientes)
+        value: Valor de la columna de orden (datetime)
+        row_id: ID de la fila límite
+
+    Returns:
+        str: Cursor en base64 apto para URLs
+    """
+    raw = json.dumps([direction, value.isoformat() if value else None, row_id])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    """
+    Decodificar un cursor recibido por query string
+
+    Args:
+        token: Cursor generado por encode_cursor
+
+    Returns:
+        tuple | None: (direction, value, row_id) o None si es inválido
+    """
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        direction, value, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        if direction not in ('next', 'prev') or value is None:
+            return None
+        return direction, datetime.fromisoformat(value), int(row_id)
+    except (ValueError, TypeError):
+        return None
+
+
+class KeysetPage:
+    """
+    Página de resultados por cursor
+
+    Expone `items`, `has_next`, `has_prev` y `total` igual que la paginación
+    de Flask-SQLAlchemy, más `next_cursor` / `prev_cursor` para los enlaces.
+    """
+
+    is_keyset = True
+
+    def __init__(self, items, per_page, next_cursor=None, prev_cursor=None, total=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def keyset_paginate(query, sort_column, id_column, per_page, cursor=None, total=None):
+    """
+    Paginar una consulta ordenada de forma descendente por (sort_column, id)
+
+    Args:
+        query: Consulta ya filtrada (sin ORDER BY)
+        sort_column: Columna de orden (ej: Cancion.fecha_subida)
+        id_column: Columna ID para desempatar
+        per_page: Elementos por página
+        cursor: Cursor recibido (None = primera página)
+        total: Total de elementos, si ya se conoce
+
+    Returns:
+        KeysetPage: Página con sus cursores anterior y siguiente
+    """
+    def key(item):
+        return getattr(item, sort_column.key), getattr(item, id_column.key)
+
+    decoded = decode_cursor(cursor)
+    if decoded is None:
+        rows = query.order_by(sort_column.desc(), id_column.desc()).limit(per_page + 1).all()
+        has_more_before = False
+        has_more_after = len(rows) > per_page
+        items = rows[:per_page]
+    else:
+        direction, value, row_id = decoded
+        if direction == 'next':
+            rows = query.filter(or_(sort_column < value,
+                                    and_(sort_column == value, id_column < row_id))) \
+                        .order_by(sort_column.desc(), id_column.desc()) \
+                        .limit(per_page + 1).all()
+            has_more_before = True
+            has_more_after = len(rows) > per_page
+            items = rows[:per_page]
+        else:
+            # Hacia atrás: se lee en orden ascendente y se invierte
+            rows = query.filter(or_(sort_column > value,
+                                    and_(sort_column == value, id_column > row_id))) \
+                        .order_by(sort_column.asc(), id_column.asc()) \
+                        .limit(per_page + 1).all()
+            has_more_before = len(rows) > per_page
+            has_more_after = True
+            items = list(reversed(rows[:per_page]))
+
+    next_cursor = prev_cursor = None
+    if items and has_more_after:
+        next_cursor = encode_cursor('next', *key(items[-1]))
+    if items and has_more_before:
+        prev_cursor = encode_cursor('prev', *key(items[0]))
+
+    return KeysetPage(items, per_page, next_cursor, prev_cursor, total)
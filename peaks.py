@@ -0,0 +1,269 @@
+"""
+Picos de forma de onda para Spotify Picaflorino
+Cada audio se decodifica una sola vez fuera de las peticiones y se reduce
+con NumPy a pares (mínimo, máximo) en varios niveles de detalle, guardados
+junto al blob (ab/cd/<sha>.peaks); el reproductor dibuja la barra de
+búsqueda con unos pocos KB sin tocar el audio
+"""
+
+import os
+import struct
+import subprocess
+import wave
+import numpy as np
+
+PEAKS_SUFFIX = '.peaks'
+PEAKS_VERSION = 1
+
+# Duración de cada bloque del nivel más fino antes de agrupar (10 ms)
+BLOCK_SECONDS = 0.01
+
+# Frecuencia a la que ffmpeg entrega el PCM (suficiente para la envolvente)
+DECODE_SAMPLE_RATE = 11025
+
+# Muestras leídas por iteración al decodificar
+CHUNK_FRAMES = 1 << 16
+
+DECODE_TIMEOUT = 10 * 60
+
+# magia, versión, niveles, reservado, duración en ms; después un '<I' por nivel
+_HEADER = struct.Struct('<4sBBHI')
+_LEVEL = struct.Struct('<I')
+_MAGIC = b'PEAK'
+
+
+class PeaksError(Exception):
+    """El audio no se pudo decodificar para calcular los picos"""
+
+
+def peaks_path(audio_path):
+    """Archivo de picos junto al blob: ab/cd/<sha>.peaks"""
+    return os.path.splitext(audio_path)[0] + PEAKS_SUFFIX
+
+
+def can_decode(path, encoder):
+    """Si el audio se puede decodificar (WAV sin más; el resto necesita ffmpeg)"""
+    return bool(encoder) or path.lower().endswith('.wav')
+
+
+def _wav_frames(raw, sample_width, channels):
+    """PCM entrelazado de un WAV a float32 (frames, canales) en [-1, 1]"""
+    if sample_width == 1:
+        samples = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif sample_width == 2:
+        samples = np.frombuffer(raw, dtype='<i2').astype(np.float32) / 32768
+    elif sample_width == 3:
+        triples = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        values = triples[:, 0] | (triples[:, 1] << 8) | (triples[:, 2] << 16)
+        samples = ((values << 8) >> 8).astype(np.float32) / (1 << 23)
+    elif sample_width == 4:
+        samples = np.frombuffer(raw, dtype='<i4').astype(np.float32) / (1 << 31)
+    else:
+        raise PeaksError(f'Tamaño de muestra WAV no soportado: {sample_width} bytes')
+    return samples.reshape(-1, channels)
+
+
+def _decode_wav(path):
+    with wave.open(path, 'rb') as wav:
+        channels, width = wav.getnchannels(), wav.getsampwidth()
+        yield wav.getframerate()
+        while True:
+            raw = wav.readframes(CHUNK_FRAMES)
+            if not raw:
+                break
+            yield _wav_frames(raw[:len(raw) - len(raw) % (channels * width)], width, channels)
+
+
+def _decode_ffmpeg(path, encoder):
+    command = [
+        encoder, '-nostdin', '-hide_banner', '-loglevel', 'error',
+        '-i', path, '-map', '0:a:0', '-ac', '1', '-ar', str(DECODE_SAMPLE_RATE),
+        '-f', 's16le', '-',
+    ]
+    try:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except OSError as e:
+        raise PeaksError(f'No se pudo ejecutar el decodificador: {e}')
+    try:
+        yield DECODE_SAMPLE_RATE
+        while True:
+            raw = process.stdout.read(CHUNK_FRAMES * 2)
+            if not raw:
+                break
+            yield _wav_frames(raw[:len(raw) - len(raw) % 2], 2, 1)
+        _, error = process.communicate(timeout=DECODE_TIMEOUT)
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+    if process.returncode != 0:
+        error = error.decode('utf-8', 'replace').strip().splitlines()
+        raise PeaksError(error[-1] if error else f'ffmpeg terminó con código {process.returncode}')
+
+
+def decode_audio(path, encoder=None):
+    """
+    Decodificar un audio a PCM por bloques
+
+    Los WAV PCM se leen con la biblioteca estándar; el resto de formatos
+    (y los WAV en coma flotante) pasan por ffmpeg a mono y DECODE_SAMPLE_RATE.
+
+    Yields:
+        Primero la frecuencia de muestreo (int); después arrays float32
+        (frames, canales) con valores en [-1, 1]
+    """
+    if path.lower().endswith('.wav'):
+        try:
+            with wave.open(path, 'rb'):
+                pass
+        except (wave.Error, EOFError):
+            if not encoder:
+                raise PeaksError('WAV no PCM y no hay un decodificador (ffmpeg) instalado')
+        else:
+            yield from _decode_wav(path)
+            return
+    if not encoder:
+        raise PeaksError('No hay un decodificador de audio (ffmpeg) instalado')
+    yield from _decode_ffmpeg(path, encoder)
+
+
+def reduce_blocks(chunks, block_frames):
+    """
+    Mínimo y máximo de cada bloque de `block_frames` muestras (en todos los canales)
+
+    Returns:
+        tuple: (mínimos, máximos) como arrays float32, uno por bloque
+    """
+    mins, maxs = [], []
+    carry_low = carry_high = np.empty(0, dtype=np.float32)
+    for frames in chunks:
+        low = np.concatenate((carry_low, frames.min(axis=1)))
+        high = np.concatenate((carry_high, frames.max(axis=1)))
+        whole = len(low) - len(low) % block_frames
+        if whole:
+            mins.append(low[:whole].reshape(-1, block_frames).min(axis=1))
+            maxs.append(high[:whole].reshape(-1, block_frames).max(axis=1))
+        carry_low, carry_high = low[whole:], high[whole:]
+    if len(carry_low):
+        mins.append(carry_low.min(keepdims=True))
+        maxs.append(carry_high.max(keepdims=True))
+    if not mins:
+        return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.float32)
+    return np.concatenate(mins), np.concatenate(maxs)
+
+
+def downsample_peaks(mins, maxs, count):
+    """
+    Agrupar los bloques en `count` picos (o menos si el audio es más corto)
+
+    Returns:
+        numpy.ndarray: int8 entrelazado [mín, máx, mín, máx, ...]
+    """
+    if len(mins) > count:
+        edges = (np.arange(count, dtype=np.int64) * len(mins)) // count
+        mins = np.minimum.reduceat(mins, edges)
+        maxs = np.maximum.reduceat(maxs, edges)
+    peaks = np.empty(2 * len(mins), dtype=np.int8)
+    peaks[0::2] = np.clip(np.floor(mins * 128), -128, 127)
+    peaks[1::2] = np.clip(np.ceil(maxs * 127), -128, 127)
+    return peaks
+
+
+def build_peaks(path, levels, encoder=None):
+    """
+    Decodificar un audio y calcular sus picos en cada nivel
+
+    Args:
+        path: Archivo de audio
+        levels: Número de picos de cada nivel (p. ej. (256, 1024, 4096))
+        encoder: Ruta de ffmpeg para formatos comprimidos
+
+    Returns:
+        tuple: (duración en segundos, [array int8 por nivel])
+    """
+    chunks = decode_audio(path, encoder)
+    sample_rate = next(chunks)
+    frames = 0
+
+    def counted():
+        nonlocal frames
+        for chunk in chunks:
+            frames += len(chunk)
+            yield chunk
+
+    block = max(1, int(sample_rate * BLOCK_SECONDS))
+    mins, maxs = reduce_blocks(counted(), block)
+    if not len(mins):
+        raise PeaksError('El audio no contiene muestras')
+    return frames / sample_rate, [downsample_peaks(mins, maxs, count) for count in sorted(levels)]
+
+
+def write_peaks(path, duration, levels):
+    """Guardar los niveles junto al blob (escritura atómica)"""
+    target = peaks_path(path)
+    tmp = f'{target}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(_HEADER.pack(_MAGIC, PEAKS_VERSION, len(levels), 0, int(round(duration * 1000))))
+        for peaks in levels:
+            f.write(_LEVEL.pack(len(peaks) // 2))
+        for peaks in levels:
+            f.write(peaks.tobytes())
+    os.replace(tmp, target)
+    return target
+
+
+def read_peaks(path, width=None):
+    """
+    Leer un nivel de picos de un blob
+
+    Args:
+        path: Blob de audio
+        width: Picos que necesita el cliente; se elige el nivel más pequeño
+            que lo cubre (None = el más detallado)
+
+    Returns:
+        tuple | None: (picos del nivel, bytes int8 entrelazados), o None si
+        no hay archivo de picos válido
+    """
+    try:
+        with open(peaks_path(path), 'rb') as f:
+            magic, version, count, _, _ = _HEADER.unpack(f.read(_HEADER.size))
+            if magic != _MAGIC or version != PEAKS_VERSION or not count:
+                return None
+            sizes = [_LEVEL.unpack(f.read(_LEVEL.size))[0] for _ in range(count)]
+            chosen = len(sizes) - 1
+            if width:
+                chosen = next((i for i, size in enumerate(sizes) if size >= width), chosen)
+            f.seek(2 * sum(sizes[:chosen]), os.SEEK_CUR)
+            data = f.read(2 * sizes[chosen])
+    except (OSError, struct.error):
+        return None
+    if len(data) != 2 * sizes[chosen]:
+        return None
+    return sizes[chosen], data
+
+
+def remove_peaks(path):
+    try:
+        os.unlink(peaks_path(path))
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def build_peaks_task(payload):
+    """
+    Calcular y guardar los picos de un blob (tarea de la cola de trabajos)
+
+    Args:
+        payload: dict con 'path' (blob de audio), 'levels' (Config.AUDIO_PEAKS_LEVELS)
+            y 'encoder' (ruta de ffmpeg o None)
+
+    Returns:
+        dict: {'niveles': [picos por nivel], 'duracion': segundos}
+    """
+    if not os.path.isfile(payload['path']):
+        raise PeaksError(f"No existe el archivo {payload['path']}")
+    duration, levels = build_peaks(payload['path'], payload['levels'], payload.get('encoder'))
+    write_peaks(payload['path'], duration, levels)
+    return {'niveles': [len(peaks) // 2 for peaks in levels], 'duracion': round(duration, 3)}
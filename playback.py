@@ -0,0 +1,220 @@
+"""
+Buffer de reproducciones para Spotify Picaflorino
+Acumula eventos de reproducción en memoria y los persiste en lotes
+(write-behind), con un registro local de respaldo que sobrevive a
+reinicios del worker
+"""
+
+import os
+import json
+import glob
+import uuid
+import logging
+import threading
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo entre procesos
+    fcntl = None
+
+LOG_PREFIX = 'reproducciones'
+
+
+class PlaybackBuffer:
+    """
+    Cola acotada de eventos de reproducción con vaciado por tiempo o tamaño
+
+    Cada evento se escribe primero en un archivo de registro propio de la
+    instancia (`reproducciones.<pid>-<aleatorio>.log`: un proceso nuevo con
+    el mismo pid, algo normal en contenedores, no reutiliza el de uno
+    anterior). Al vaciar, el lote se entrega a `flush_callback` y, si se
+    guarda correctamente, el registro se descarta.
+    Los registros huérfanos de procesos que murieron se recuperan al iniciar.
+    """
+
+    def __init__(self, flush_callback, log_dir, batch_size=200,
+                 max_pending=5000, flush_interval=5.0):
+        """
+        Args:
+            flush_callback: Función que recibe la lista de eventos a guardar
+            log_dir: Directorio para los registros de respaldo
+            batch_size: Eventos pendientes que disparan un vaciado inmediato
+            max_pending: Límite de eventos en memoria (vaciado síncrono)
+            flush_interval: Segundos entre vaciados periódicos
+        """
+        self.flush_callback = flush_callback
+        self.log_dir = log_dir
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+
+        self._events = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._log_file = None
+        self._log_name = None
+        self._pid = None
+        self._thread = None
+
+    # Registro de respaldo
+    def _log_path(self):
+        return os.path.join(self.log_dir, f'{LOG_PREFIX}.{self._log_name}.log')
+
+    def _open_log(self):
+        """Abrir (y bloquear) un registro nuevo para este proceso, recuperando huérfanos"""
+        os.makedirs(self.log_dir, exist_ok=True)
+        self._pid = os.getpid()
+        self._log_name = f'{self._pid}-{uuid.uuid4().hex[:12]}'
+        self._log_file = self._new_log()
+        self._recover_orphans()
+
+    def _new_log(self):
+        f = open(self._log_path(), 'a', encoding='utf-8')
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return f
+
+    def _recover_orphans(self):
+        """Reincorporar eventos de registros cuyo proceso ya no existe"""
+        pattern = os.path.join(self.log_dir, f'{LOG_PREFIX}.*.log*')
+        own = (self._log_path(), self._log_path() + '.flushing')
+        for path in glob.glob(pattern):
+            if path in own:
+                continue
+            try:
+                with open(path, 'r+', encoding='utf-8') as f:
+                    if fcntl is not None:
+                        try:
+                            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        except OSError:
+                            continue  # Otro worker vivo lo tiene bloqueado
+                    if os.fstat(f.fileno()).st_nlink == 0:
+                        continue  # Otro worker lo recuperó mientras se esperaba
+                    lines = [line for line in f.read().splitlines() if line.strip()]
+                    recovered = []
+                    for line in lines:
+                        try:
+                            recovered.append(json.loads(line))
+                        except ValueError:
+                            continue  # Línea truncada por una caída
+                    self._write_log(recovered)
+                    self._events.extend(recovered)
+                    # Eliminarlo antes de soltar el bloqueo: nadie más lo vuelve a leer
+                    if fcntl is not None:
+                        os.unlink(path)
+                if fcntl is None:
+                    os.unlink(path)  # Windows no permite eliminar un archivo abierto
+                if recovered:
+                    logging.info(f"Recuperadas {len(recovered)} reproducciones de {path}")
+            except OSError as e:
+                logging.error(f"Error al recuperar registro {path}: {str(e)}")
+
+    def _write_log(self, events):
+        if not events:
+            return
+        self._log_file.write(''.join(json.dumps(e) + '\n' for e in events))
+        self._log_file.flush()
+
+    def _ensure_started(self):
+        """Inicialización perezosa (también tras un fork de gunicorn)"""
+        if self._pid == os.getpid():
+            return
+        self._events = []
+        self._open_log()
+        self._thread = threading.Thread(target=self._run, name='playback-buffer', daemon=True)
+        self._thread.start()
+
+    # API pública
+    def add(self, usuario_id, cancion_id, duracion_reproducida=0, completada=False,
+            fecha=None):
+        """
+        Encolar un evento de reproducción
+
+        Args:
+            usuario_id: ID del usuario que reproduce
+            cancion_id: ID de la canción
+            duracion_reproducida: Segundos escuchados
+            completada: Si la canción se escuchó completa
+            fecha: Fecha del evento (por defecto, ahora en UTC)
+        """
+        self.add_many([{
+            'usuario_id': usuario_id,
+            'cancion_id': cancion_id,
+            'fecha_reproduccion': (fecha or datetime.utcnow()).isoformat(),
+            'duracion_reproducida': int(duracion_reproducida or 0),
+            'completada': bool(completada),
+        }])
+
+    def add_many(self, events):
+        """Encolar varios eventos ya normalizados en una sola escritura"""
+        with self._lock:
+            self._ensure_started()
+            self._write_log(events)
+            self._events.extend(events)
+            pending = len(self._events)
+
+        if pending >= self.max_pending:
+            self.flush()
+        elif pending >= self.batch_size:
+            self._wakeup.set()
+
+    def pending(self):
+        """Número de eventos aún no persistidos"""
+        with self._lock:
+            return len(self._events)
+
+    def flush(self):
+        """
+        Persistir los eventos pendientes
+
+        Returns:
+            int: Número de eventos guardados
+        """
+        with self._flush_lock:
+            with self._lock:
+                if not self._events:
+                    return 0
+                batch, self._events = self._events, []
+                # Rotar el registro: los eventos nuevos van a un archivo limpio
+                # (el archivo anterior sigue bloqueado hasta confirmar el guardado)
+                flushing_path = self._log_path() + '.flushing'
+                flushing_file = self._log_file
+                os.replace(self._log_path(), flushing_path)
+                self._log_file = self._new_log()
+
+            try:
+                self.flush_callback([_parse_event(e) for e in batch])
+                saved = len(batch)
+            except Exception as e:
+                logging.error(f"Error al guardar {len(batch)} reproducciones: {str(e)}")
+                with self._lock:
+                    # Devolver el lote a la cola y al registro vigente
+                    self._write_log(batch)
+                    self._events[:0] = batch
+                    overflow = len(self._events) - self.max_pending
+                    if overflow > 0:
+                        del self._events[:overflow]
+                        logging.error(f"Descartadas {overflow} reproducciones por cola llena")
+                saved = 0
+            finally:
+                os.unlink(flushing_path)
+                flushing_file.close()
+            return saved
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logging.error(f"Error en el vaciado periódico de reproducciones: {str(e)}")
+
+
+def _parse_event(event):
+    """Convertir un evento del registro a los tipos de la tabla"""
+    event = dict(event)
+    event['fecha_reproduccion'] = datetime.fromisoformat(event['fecha_reproduccion'])
+    return event
@@ -0,0 +1,107 @@
+"""
+Recomendaciones entre canciones para Spotify Picaflorino ("Radio personalizada")
+Dos canciones se parecen si las escuchan los mismos usuarios: la matriz
+dispersa de co-ocurrencias (usuarios en común por par de canciones) se
+calcula con operaciones vectorizadas de NumPy a partir de los pares
+(usuario, canción), se actualiza solo con las reproducciones nuevas y de
+ella salen las k canciones más parecidas a cada una
+"""
+
+import numpy as np
+
+_EMPTY = np.empty(0, dtype=np.int64)
+
+
+def sum_pairs(a, b, counts):
+    """
+    Sumar los incrementos repetidos de un mismo par (a, b)
+
+    Returns:
+        tuple: (a, b, suma) con un elemento por par distinto, ordenados por (a, b)
+    """
+    a = np.asarray(a, dtype=np.int64)
+    b = np.asarray(b, dtype=np.int64)
+    if not len(a):
+        return _EMPTY, _EMPTY, _EMPTY
+    base = int(max(a.max(), b.max())) + 1
+    codes, inverse = np.unique(a * base + b, return_inverse=True)
+    totals = np.bincount(inverse, weights=counts).astype(np.int64)
+    return codes // base, codes % base, totals
+
+
+def cooccurrence_delta(users, items, is_new):
+    """
+    Usuarios en común que aportan las reproducciones nuevas a cada par de canciones
+
+    Args:
+        users, items: Pares distintos (usuario, canción) de los usuarios con
+            reproducciones nuevas: todas sus canciones, nuevas y anteriores
+        is_new: True donde el usuario escucha la canción por primera vez
+
+    Returns:
+        tuple: (canción a, canción b, incremento) con a <= b; en la diagonal
+        (a == b) queda cuántos usuarios nuevos tiene cada canción
+    """
+    users = np.asarray(users, dtype=np.int64)
+    items = np.asarray(items, dtype=np.int64)
+    is_new = np.asarray(is_new, dtype=bool)
+    if not is_new.any():
+        return _EMPTY, _EMPTY, _EMPTY
+
+    order = np.lexsort((items, users))
+    users, items, is_new = users[order], items[order], is_new[order]
+
+    # Cada canción se empareja con ella misma y con las siguientes del mismo usuario
+    starts = np.flatnonzero(np.r_[True, users[1:] != users[:-1]])
+    ends = np.repeat(np.r_[starts[1:], len(users)], np.diff(np.r_[starts, len(users)]))
+    spans = ends - np.arange(len(users))
+    left = np.repeat(np.arange(len(users)), spans)
+    right = left + np.arange(len(left)) - np.repeat(np.cumsum(spans) - spans, spans)
+
+    # Los pares entre canciones ya escuchadas se contaron en actualizaciones anteriores
+    keep = is_new[left] | is_new[right]
+    return sum_pairs(items[left[keep]], items[right[keep]], np.ones(int(keep.sum())))
+
+
+def top_k_similar(a, b, counts, item_ids, item_users, sources, k, boost=None):
+    """
+    Las k canciones más parecidas a cada canción de `sources` (similitud coseno)
+
+    Args:
+        a, b, counts: Pares fuera de la diagonal (a < b) con sus usuarios en común
+        item_ids: Ids de canción ordenados
+        item_users: Usuarios de cada canción de `item_ids` (la diagonal)
+        sources: Canciones para las que se calcula la lista
+        k: Canciones por lista
+        boost: Función (origen, destino) -> multiplicador por par; 0 descarta
+
+    Returns:
+        tuple: (origen, destino, puntaje) ordenados por origen y puntaje descendente
+    """
+    a = np.asarray(a, dtype=np.int64)
+    b = np.asarray(b, dtype=np.int64)
+    counts = np.asarray(counts, dtype=np.float64)
+    src = np.concatenate((a, b))
+    dst = np.concatenate((b, a))
+    shared = np.concatenate((counts, counts))
+    keep = np.isin(src, sources)
+    src, dst, shared = src[keep], dst[keep], shared[keep]
+    if not len(src):
+        return _EMPTY, _EMPTY, np.empty(0)
+
+    item_ids = np.asarray(item_ids, dtype=np.int64)
+    item_users = np.asarray(item_users, dtype=np.float64)
+    norms = np.sqrt(item_users[np.searchsorted(item_ids, src)] * item_users[np.searchsorted(item_ids, dst)])
+    scores = shared / np.maximum(norms, 1)
+    if boost is not None:
+        scores = scores * boost(src, dst)
+    keep = scores > 0
+    src, dst, scores = src[keep], dst[keep], scores[keep]
+
+    # Puesto dentro de cada origen (empates por id para que el resultado sea estable)
+    order = np.lexsort((dst, -scores, src))
+    src, dst, scores = src[order], dst[order], scores[order]
+    starts = np.flatnonzero(np.r_[True, src[1:] != src[:-1]]) if len(src) else _EMPTY
+    rank = np.arange(len(src)) - np.repeat(starts, np.diff(np.r_[starts, len(src)]))
+    keep = rank < k
+    return src[keep], dst[keep], scores[keep]
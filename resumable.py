@@ -0,0 +1,228 @@
+"""
+Subidas reanudables por bloques para Spotify Picaflorino
+Protocolo en tres pasos (iniciar, PUT de cada bloque con su offset y
+finalizar) con el estado de cada subida guardado en disco, para que
+cualquier worker pueda continuarla y un corte de red no obligue a
+empezar desde cero
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import logging
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo entre procesos
+    fcntl = None
+
+COPY_CHUNK_SIZE = 64 * 1024
+
+_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+
+
+class UploadError(Exception):
+    """Error de protocolo con su código HTTP (y el offset vigente, si aplica)"""
+
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+class ResumableUploadStore:
+    """
+    Subidas en curso: `<base_dir>/<id>/data.part` y su `state.json`
+
+    El estado (dueño, nombre, tamaño total, hash esperado y offset
+    confirmado) vive en disco junto a los datos, así que sobrevive a
+    reinicios y es compartido por todos los workers.
+    """
+
+    def __init__(self, base_dir, max_size, chunk_max, ttl=24 * 3600):
+        """
+        Args:
+            base_dir: Directorio de trabajo (en el mismo disco que la música)
+            max_size: Tamaño máximo del archivo completo en bytes
+            chunk_max: Tamaño máximo de cada bloque en bytes
+            ttl: Segundos de inactividad antes de descartar una subida
+        """
+        self.base_dir = base_dir
+        self.max_size = max_size
+        self.chunk_max = chunk_max
+        self.ttl = ttl
+
+    # Rutas y estado
+    def _dir(self, upload_id):
+        if not upload_id or not _ID_RE.match(upload_id):
+            raise UploadError('Subida no encontrada', 404)
+        return os.path.join(self.base_dir, upload_id)
+
+    def data_path(self, upload_id):
+        return os.path.join(self._dir(upload_id), 'data.part')
+
+    def _read_state(self, upload_id):
+        try:
+            with open(os.path.join(self._dir(upload_id), 'state.json'), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            raise UploadError('Subida no encontrada', 404)
+
+    def _write_state(self, upload_id, state):
+        path = os.path.join(self._dir(upload_id), 'state.json')
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(path + '.tmp', path)
+
+    def _lock(self, upload_id):
+        """Bloqueo exclusivo de la subida (dos PUT simultáneos no se mezclan)"""
+        try:
+            f = open(os.path.join(self._dir(upload_id), 'lock'), 'a')
+        except FileNotFoundError:
+            raise UploadError('Subida no encontrada', 404)
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        return f
+
+    @contextmanager
+    def locked(self, upload_id):
+        """
+        Mantener la subida bloqueada durante el bloque with (finalizar una sola vez)
+
+        Al obtener el bloqueo hay que volver a leer el estado: quien lo tenía
+        antes pudo haber terminado y descartado la subida
+        """
+        lock = self._lock(upload_id)
+        try:
+            yield
+        finally:
+            lock.close()
+
+    # API pública
+    def create(self, owner_id, filename, size, sha256=None):
+        """
+        Iniciar una subida
+
+        Args:
+            owner_id: ID del usuario que sube
+            filename: Nombre original del archivo
+            size: Tamaño total anunciado en bytes
+            sha256: Hash del archivo completo (opcional, se verifica al finalizar)
+
+        Returns:
+            dict: Estado de la subida (incluye 'id' y 'offset')
+        """
+        if not isinstance(size, int) or size <= 0:
+            raise UploadError('Tamaño de archivo inválido')
+        if size > self.max_size:
+            raise UploadError(f'El archivo excede el tamaño máximo de '
+                              f'{self.max_size // (1024 * 1024)}MB', 413)
+        if sha256 is not None and not re.match(r'^[0-9a-f]{64}$', str(sha256)):
+            raise UploadError('Hash SHA-256 inválido')
+
+        self.cleanup_expired()
+        upload_id = uuid.uuid4().hex
+        os.makedirs(self._dir(upload_id))
+        open(self.data_path(upload_id), 'wb').close()
+        state = {
+            'id': upload_id,
+            'owner_id': owner_id,
+            'filename': filename,
+            'size': size,
+            'sha256': sha256,
+            'offset': 0,
+            'updated': time.time(),
+        }
+        self._write_state(upload_id, state)
+        return state
+
+    def get(self, upload_id, owner_id=None):
+        """Estado de una subida (404 si no existe o es de otro usuario)"""
+        state = self._read_state(upload_id)
+        if owner_id is not None and state['owner_id'] != owner_id:
+            raise UploadError('Subida no encontrada', 404)
+        return state
+
+    def write_chunk(self, upload_id, owner_id, offset, stream, length, checksum):
+        """
+        Escribir un bloque en su posición
+
+        Args:
+            upload_id: ID de la subida
+            owner_id: Usuario que envía el bloque
+            offset: Posición anunciada por el cliente (debe ser el offset confirmado)
+            stream: Cuerpo de la petición
+            length: Bytes del bloque (Content-Length)
+            checksum: SHA-256 hexadecimal del bloque
+
+        Returns:
+            int: Nuevo offset confirmado
+        """
+        if length is None or length <= 0:
+            raise UploadError('Falta Content-Length del bloque', 411)
+        if length > self.chunk_max:
+            raise UploadError('Bloque demasiado grande', 413)
+        if not checksum:
+            raise UploadError('Falta el hash SHA-256 del bloque')
+
+        lock = self._lock(upload_id)
+        try:
+            state = self.get(upload_id, owner_id)
+            if offset != state['offset']:
+                # El cliente debe reanudar desde el offset confirmado
+                raise UploadError('Offset no coincide', 409, state['offset'])
+            if offset + length > state['size']:
+                raise UploadError('El bloque excede el tamaño anunciado', 413, state['offset'])
+
+            digest = hashlib.sha256()
+            received = 0
+            with open(self.data_path(upload_id), 'r+b') as f:
+                # Descartar restos de un bloque anterior interrumpido
+                f.truncate(offset)
+                f.seek(offset)
+                while received < length:
+                    chunk = stream.read(min(COPY_CHUNK_SIZE, length - received))
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    f.write(chunk)
+                    received += len(chunk)
+
+                if received != length or digest.hexdigest() != checksum.lower():
+                    f.truncate(offset)
+                    raise UploadError('El bloque llegó incompleto o dañado', 422, offset)
+                f.flush()
+                os.fsync(f.fileno())
+
+            state['offset'] = offset + length
+            state['updated'] = time.time()
+            self._write_state(upload_id, state)
+            return state['offset']
+        finally:
+            lock.close()
+
+    def discard(self, upload_id):
+        """Eliminar una subida y sus datos"""
+        shutil.rmtree(self._dir(upload_id), ignore_errors=True)
+
+    def cleanup_expired(self):
+        """Eliminar subidas abandonadas hace más de `ttl` segundos"""
+        if not os.path.isdir(self.base_dir):
+            return
+        limite = time.time() - self.ttl
+        for upload_id in os.listdir(self.base_dir):
+            if not _ID_RE.match(upload_id):
+                continue
+            try:
+                if self._read_state(upload_id)['updated'] < limite:
+                    self.discard(upload_id)
+                    logging.info(f"Subida reanudable expirada eliminada: {upload_id}")
+            except UploadError:
+                # Directorio sin estado (creación interrumpida)
+                if os.path.getmtime(os.path.join(self.base_dir, upload_id)) < limite:
+                    self.discard(upload_id)
@@ -0,0 +1,339 @@
+"""
+Búsqueda de texto completo para Spotify Picaflorino
+Búsqueda sin distinción de mayúsculas ni tildes sobre título, artista y
+álbum, ordenada por relevancia. Usa FULLTEXT en MySQL, FTS5 en SQLite y
+un índice invertido en memoria como alternativa
+"""
+
+import re
+import time
+import bisect
+import logging
+import threading
+import unicodedata
+from collections import defaultdict
+from sqlalchemy import case, false, or_, text, Integer, Float
+from sqlalchemy.engine import make_url
+
+# Campos indexados y su peso en la relevancia
+SEARCH_FIELDS = {'titulo': 10.0, 'artista': 5.0, 'album': 1.0}
+
+# Máximo de resultados que devuelve el índice en memoria
+MAX_RESULTS = 1000
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def normalize_text(value):
+    """
+    Normalizar texto para búsqueda: minúsculas y sin tildes
+
+    Args:
+        value: Texto original (ej: "Canción")
+
+    Returns:
+        str: Texto normalizado (ej: "cancion")
+    """
+    if not value:
+        return ''
+    value = unicodedata.normalize('NFKD', value)
+    value = ''.join(c for c in value if not unicodedata.combining(c))
+    return value.lower()
+
+
+def tokenize(value):
+    """
+    Separar un texto en términos normalizados
+
+    Args:
+        value: Texto a tokenizar
+
+    Returns:
+        list: Términos en orden de aparición
+    """
+    return _TOKEN_RE.findall(normalize_text(value))
+
+
+class MySQLFulltextSearch:
+    """Búsqueda con índice FULLTEXT de InnoDB (la collation ya ignora tildes)"""
+
+    name = 'mysql'
+
+    # innodb_ft_min_token_size por defecto
+    MIN_TOKEN_SIZE = 3
+
+    def __init__(self, model):
+        self.model = model
+
+    def create_index(self, connection):
+        """Crear el índice FULLTEXT si la tabla no lo tiene"""
+        existe = connection.execute(text(
+            "SELECT COUNT(*) FROM information_schema.statistics "
+            "WHERE table_schema = DATABASE() AND table_name = :tabla "
+            "AND index_name = 'ft_canciones_busqueda'"
+        ), {'tabla': self.model.__tablename__}).scalar()
+        if not existe:
+            connection.execute(text(
+                f"ALTER TABLE {self.model.__tablename__} "
+                f"ADD FULLTEXT INDEX ft_canciones_busqueda ({', '.join(SEARCH_FIELDS)})"
+            ))
+
+    def on_change(self, connection, target):
+        # MySQL mantiene el índice FULLTEXT automáticamente
+        pass
+
+    def on_delete(self, connection, target):
+        pass
+
+    def apply(self, query, term):
+        from sqlalchemy.dialects.mysql import match
+
+        terms = tokenize(term)
+        indexed = [t for t in terms if len(t) >= self.MIN_TOKEN_SIZE]
+        if not indexed:
+            return _apply_like(query, self.model, term)
+
+        columns = [getattr(self.model, field) for field in SEARCH_FIELDS]
+        relevancia = match(*columns, against=' '.join(f'+{t}*' for t in indexed)).in_boolean_mode()
+        # Los términos cortos no están en el índice: se exigen con LIKE
+        short = [_contains_any(self.model, t) for t in terms if len(t) < self.MIN_TOKEN_SIZE]
+        return query.filter(relevancia > 0, *short).order_by(relevancia.desc(), self.model.id.desc())
+
+
+class SQLiteFTS5Search:
+    """Búsqueda con una tabla virtual FTS5 externa (rowid = id de canción)"""
+
+    name = 'fts5'
+    TABLE = 'canciones_fts'
+
+    def __init__(self, model):
+        self.model = model
+
+    def create_index(self, connection):
+        """Crear la tabla FTS5 y poblarla con las canciones activas"""
+        connection.execute(text(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.TABLE} USING fts5("
+            f"{', '.join(SEARCH_FIELDS)}, tokenize='unicode61 remove_diacritics 2')"
+        ))
+        connection.execute(text(f"DELETE FROM {self.TABLE}"))
+        fields = ', '.join(SEARCH_FIELDS)
+        connection.execute(text(
+            f"INSERT INTO {self.TABLE} (rowid, {fields}) "
+            f"SELECT id, {fields} FROM {self.model.__tablename__} WHERE activo = 1"
+        ))
+
+    def drop_index(self, connection):
+        connection.execute(text(f"DROP TABLE IF EXISTS {self.TABLE}"))
+
+    def on_change(self, connection, target):
+        connection.execute(text(f"DELETE FROM {self.TABLE} WHERE rowid = :id"), {'id': target.id})
+        if target.activo is not False:
+            fields = ', '.join(SEARCH_FIELDS)
+            values = ', '.join(f':{field}' for field in SEARCH_FIELDS)
+            params = {field: getattr(target, field) or '' for field in SEARCH_FIELDS}
+            params['id'] = target.id
+            connection.execute(text(
+                f"INSERT INTO {self.TABLE} (rowid, {fields}) VALUES (:id, {values})"
+            ), params)
+
+    def on_delete(self, connection, target):
+        connection.execute(text(f"DELETE FROM {self.TABLE} WHERE rowid = :id"), {'id': target.id})
+
+    def apply(self, query, term):
+        terms = tokenize(term)
+        if not terms:
+            return query
+
+        weights = ', '.join(str(w) for w in SEARCH_FIELDS.values())
+        ranking = text(
+            f"SELECT rowid AS id, bm25({self.TABLE}, {weights}) AS rank "
+            f"FROM {self.TABLE} WHERE {self.TABLE} MATCH :q"
+        ).bindparams(q=' '.join(f'"{t}"*' for t in terms)) \
+         .columns(id=Integer, rank=Float).subquery('fts')
+        # bm25 devuelve valores negativos: menor es más relevante
+        return query.join(ranking, self.model.id == ranking.c.id) \
+                    .order_by(ranking.c.rank, self.model.id.desc())
+
+
+class InvertedIndexSearch:
+    """
+    Índice invertido en memoria por proceso
+
+    Se construye de forma perezosa desde la base de datos, se actualiza con
+    los eventos de Cancion y se reconstruye periódicamente (`max_age`) para
+    recoger cambios hechos por otros workers.
+    """
+
+    name = 'memoria'
+
+    def __init__(self, model, loader=None, max_age=300):
+        """
+        Args:
+            model: Modelo Cancion
+            loader: Función que devuelve filas (id, titulo, artista, album) activas
+            max_age: Segundos antes de reconstruir el índice completo
+        """
+        self.model = model
+        self.loader = loader
+        self.max_age = max_age
+        self._lock = threading.RLock()
+        self._postings = defaultdict(dict)  # término -> {id: peso}
+        self._docs = {}  # id -> términos indexados
+        self._vocabulary = []
+        self._vocabulary_dirty = False
+        self._built_at = None
+
+    def create_index(self, connection):
+        """Al crear la tabla el índice queda obsoleto; se reconstruye al buscar"""
+        with self._lock:
+            self._built_at = None
+
+    def rebuild(self):
+        """Reconstruir el índice completo desde el loader"""
+        rows = self.loader() if self.loader else []
+        with self._lock:
+            self._postings = defaultdict(dict)
+            self._docs = {}
+            for row in rows:
+                self._add(row[0], dict(zip(SEARCH_FIELDS, row[1:])))
+            self._vocabulary_dirty = True
+            self._built_at = time.monotonic()
+
+    def _add(self, doc_id, fields):
+        terms = defaultdict(float)
+        for field, weight in SEARCH_FIELDS.items():
+            for term in tokenize(fields.get(field)):
+                terms[term] += weight
+        for term, weight in terms.items():
+            self._postings[term][doc_id] = weight
+        self._docs[doc_id] = list(terms)
+
+    def _remove(self, doc_id):
+        for term in self._docs.pop(doc_id, []):
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+                    self._vocabulary_dirty = True
+
+    def on_change(self, connection, target):
+        with self._lock:
+            if self._built_at is None:
+                return
+            self._remove(target.id)
+            if target.activo is not False:
+                self._add(target.id, {field: getattr(target, field) for field in SEARCH_FIELDS})
+                self._vocabulary_dirty = True
+
+    def on_delete(self, connection, target):
+        with self._lock:
+            if self._built_at is not None:
+                self._remove(target.id)
+
+    def _expand(self, prefix):
+        """Términos del vocabulario que empiezan por `prefix`"""
+        if self._vocabulary_dirty:
+            self._vocabulary = sorted(self._postings)
+            self._vocabulary_dirty = False
+        start = bisect.bisect_left(self._vocabulary, prefix)
+        end = bisect.bisect_left(self._vocabulary, prefix + '\uffff')
+        return self._vocabulary[start:end]
+
+    def search(self, term, limit=MAX_RESULTS):
+        """
+        Buscar canciones por relevancia
+
+        Args:
+            term: Texto de búsqueda
+            limit: Máximo de resultados
+
+        Returns:
+            list: IDs de canción ordenados por relevancia
+        """
+        terms = tokenize(term)
+        if not terms:
+            return []
+
+        if self._built_at is None or time.monotonic() - self._built_at > self.max_age:
+            self.rebuild()
+
+        with self._lock:
+            scores = None
+            for query_term in terms:
+                # Cada término es un prefijo, como en FULLTEXT y FTS5 (búsqueda mientras se escribe)
+                term_scores = defaultdict(float)
+                for vocab_term in self._expand(query_term):
+                    for doc_id, weight in self._postings[vocab_term].items():
+                        exact = 1.0 if vocab_term == query_term else 0.5
+                        term_scores[doc_id] = max(term_scores[doc_id], weight * exact)
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {doc_id: score + term_scores[doc_id]
+                              for doc_id, score in scores.items() if doc_id in term_scores}
+                if not scores:
+                    return []
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], -item[0]))
+        return [doc_id for doc_id, _ in ranked[:limit]]
+
+    def apply(self, query, term):
+        if not tokenize(term):
+            return query
+        ids = self.search(term)
+        if not ids:
+            return query.filter(false())
+        orden = case({doc_id: pos for pos, doc_id in enumerate(ids)}, value=self.model.id)
+        return query.filter(self.model.id.in_(ids)).order_by(orden)
+
+
+def _contains_any(model, term):
+    """Condición LIKE: el texto aparece en alguno de los campos indexados"""
+    return or_(*(getattr(model, field).contains(term) for field in SEARCH_FIELDS))
+
+
+def _apply_like(query, model, term):
+    """Búsqueda con LIKE para términos que FULLTEXT no indexa"""
+    return query.filter(_contains_any(model, term)).order_by(model.fecha_subida.desc())
+
+
+def create_search_backend(database_uri, model, backend='auto', loader=None):
+    """
+    Elegir el motor de búsqueda según la base de datos configurada
+
+    Args:
+        database_uri: SQLALCHEMY_DATABASE_URI de la aplicación
+        model: Modelo Cancion
+        backend: 'auto', 'mysql', 'fts5' o 'memoria'
+        loader: Función de carga para el índice en memoria
+
+    Returns:
+        Motor de búsqueda con create_index / on_change / on_delete / apply
+    """
+    if backend == 'auto':
+        dialect = make_url(database_uri).get_backend_name()
+        if dialect == 'mysql':
+            backend = 'mysql'
+        elif dialect == 'sqlite' and _sqlite_has_fts5():
+            backend = 'fts5'
+        else:
+            backend = 'memoria'
+
+    if backend == 'mysql':
+        return MySQLFulltextSearch(model)
+    if backend == 'fts5':
+        return SQLiteFTS5Search(model)
+    return InvertedIndexSearch(model, loader=loader)
+
+
+def _sqlite_has_fts5():
+    import sqlite3
+    try:
+        conn = sqlite3.connect(':memory:')
+        conn.execute('CREATE VIRTUAL TABLE t USING fts5(x)')
+        conn.close()
+        return True
+    except sqlite3.Error:
+        logging.warning('SQLite sin FTS5: se usará el índice de búsqueda en memoria')
+        return False
@@ -0,0 +1,257 @@
+"""
+Índice de búsqueda tiempo→byte para Spotify Picaflorino
+Cada blob de audio (MP3, OGG o FLAC) se recorre una sola vez y se guarda
+junto a él (ab/cd/<sha>.seek) una tabla compacta de (tiempo, offset) con
+la que /stream/<id>?t=150 empieza exactamente en una trama, sin que el
+navegador adivine posiciones a partir del bitrate
+"""
+
+import os
+import sys
+import struct
+from array import array
+from bisect import bisect_right
+from frames import iter_mp3_frames, iter_ogg_pages, open_mapped, read_flac_metadata
+
+SEEK_INDEX_SUFFIX = '.seek'
+SEEK_INDEX_VERSION = 1
+
+# Entradas MP3 cada ~1 s; la trama exacta se busca al servir desde la entrada previa
+MP3_ENTRY_INTERVAL = 1.0
+
+FORMAT_MP3, FORMAT_OGG, FORMAT_FLAC = 1, 2, 3
+_FORMATS = {'.mp3': FORMAT_MP3, '.ogg': FORMAT_OGG, '.oga': FORMAT_OGG,
+            '.opus': FORMAT_OGG, '.flac': FORMAT_FLAC}
+
+# magia, versión, formato, reservado, entradas, bytes del prefijo
+_HEADER = struct.Struct('<4sBBHII')
+_MAGIC = b'SEEK'
+
+
+class SeekIndex:
+    """
+    Tabla ordenada de puntos de búsqueda respaldada por arrays
+
+    Attributes:
+        fmt: FORMAT_MP3, FORMAT_OGG o FORMAT_FLAC
+        times: array('I') de milisegundos
+        offsets: array('Q') de posiciones en el archivo
+        prefix: Bytes que deben preceder al audio servido desde un punto
+            intermedio (cabeceras OGG o STREAMINFO de FLAC; vacío en MP3)
+    """
+
+    def __init__(self, fmt, times=None, offsets=None, prefix=b''):
+        self.fmt = fmt
+        self.times = times if times is not None else array('I')
+        self.offsets = offsets if offsets is not None else array('Q')
+        self.prefix = prefix
+
+    def __len__(self):
+        return len(self.times)
+
+    def add(self, seconds, offset):
+        millis = int(round(seconds * 1000))
+        if self.times and millis <= self.times[-1]:
+            return  # Solo puntos estrictamente crecientes
+        self.times.append(millis)
+        self.offsets.append(offset)
+
+    def lookup(self, seconds):
+        """
+        Último punto en o antes de `seconds`
+
+        Returns:
+            tuple | None: (segundos, offset), o None si el índice está vacío
+        """
+        position = bisect_right(self.times, int(seconds * 1000)) - 1
+        if position < 0:
+            if not self.times:
+                return None
+            position = 0
+        return self.times[position] / 1000, self.offsets[position]
+
+    def to_bytes(self):
+        times, offsets = array('I', self.times), array('Q', self.offsets)
+        if sys.byteorder == 'big':
+            times.byteswap()
+            offsets.byteswap()
+        header = _HEADER.pack(_MAGIC, SEEK_INDEX_VERSION, self.fmt, 0, len(times), len(self.prefix))
+        return header + self.prefix + times.tobytes() + offsets.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        magic, version, fmt, _, count, prefix_len = _HEADER.unpack_from(data)
+        if magic != _MAGIC or version != SEEK_INDEX_VERSION:
+            raise ValueError('Índice de búsqueda inválido')
+        pos = _HEADER.size
+        prefix = bytes(data[pos:pos + prefix_len])
+        pos += prefix_len
+        times, offsets = array('I'), array('Q')
+        times.frombytes(data[pos:pos + count * times.itemsize])
+        pos += count * times.itemsize
+        offsets.frombytes(data[pos:pos + count * offsets.itemsize])
+        if len(offsets) != count:
+            raise ValueError('Índice de búsqueda truncado')
+        if sys.byteorder == 'big':
+            times.byteswap()
+            offsets.byteswap()
+        return cls(fmt, times, offsets, prefix)
+
+
+def seek_format(path):
+    """Formato de índice para una ruta (None si no se puede indexar)"""
+    return _FORMATS.get(os.path.splitext(path)[1].lower())
+
+
+def seek_index_path(audio_path):
+    """Archivo del índice junto al blob: ab/cd/<sha>.seek"""
+    return os.path.splitext(audio_path)[0] + SEEK_INDEX_SUFFIX
+
+
+def _index_mp3(data):
+    index = SeekIndex(FORMAT_MP3)
+    elapsed = 0.0
+    next_entry = 0.0
+    for frame in iter_mp3_frames(data):
+        if elapsed >= next_entry:
+            index.add(elapsed, frame.offset)
+            next_entry = elapsed + MP3_ENTRY_INTERVAL
+        elapsed += frame.samples / frame.sample_rate
+    return index
+
+
+def _index_ogg(data):
+    pages = iter_ogg_pages(data)
+    first = next(pages, None)
+    if first is None:
+        return SeekIndex(FORMAT_OGG)
+
+    # Frecuencia (y pre-skip de Opus) desde la cabecera de identificación
+    packet = first.first_packet
+    if packet.startswith(b'\x01vorbis') and len(packet) >= 16:
+        sample_rate, preskip = struct.unpack_from('<I', packet, 12)[0], 0
+    elif packet.startswith(b'OpusHead') and len(packet) >= 12:
+        sample_rate, preskip = 48000, struct.unpack_from('<H', packet, 10)[0]
+    else:
+        raise ValueError('Códec OGG no soportado (solo Vorbis y Opus)')
+
+    index = SeekIndex(FORMAT_OGG)
+    header_end = None
+    previous_granule = 0
+    for page in pages:
+        if page.serial != first.serial:
+            continue  # Otra serie lógica (ogg encadenado o multiplexado)
+        if header_end is None:
+            if page.granule in (0, -1):
+                continue  # Páginas de cabeceras (comentarios, setup)
+            header_end = page.offset
+        if not page.continued:
+            # Los paquetes de esta página empiezan tras la última muestra de la anterior
+            index.add(max(previous_granule - preskip, 0) / sample_rate, page.offset)
+        if page.granule != -1:
+            previous_granule = page.granule
+    if header_end is not None:
+        index.prefix = bytes(data[first.offset:header_end])
+    return index
+
+
+def _index_flac(data):
+    info = read_flac_metadata(data)
+    if info is None:
+        raise ValueError('El archivo no es un FLAC válido')
+
+    # Solo STREAMINFO como último bloque: la SEEKTABLE original no vale tras el salto
+    prefix = b'fLaC' + bytes([0x80]) + len(info.streaminfo).to_bytes(3, 'big') + info.streaminfo
+    index = SeekIndex(FORMAT_FLAC, prefix=prefix)
+    index.add(0, info.audio_offset)
+    for sample, offset in info.seekpoints:
+        index.add(sample / info.sample_rate, info.audio_offset + offset)
+    return index
+
+
+_BUILDERS = {FORMAT_MP3: _index_mp3, FORMAT_OGG: _index_ogg, FORMAT_FLAC: _index_flac}
+
+
+def build_seek_index(path):
+    """
+    Recorrer un archivo y construir su índice de búsqueda
+
+    Returns:
+        SeekIndex: Puntos (tiempo, offset); vacío si no se encontró audio
+    """
+    fmt = seek_format(path)
+    if fmt is None:
+        raise ValueError(f'Formato sin índice de búsqueda: {path}')
+    if os.path.getsize(path) == 0:
+        return SeekIndex(fmt)
+    with open_mapped(path) as data:
+        return _BUILDERS[fmt](data)
+
+
+def write_seek_index(path, index):
+    """Guardar el índice junto al blob (escritura atómica)"""
+    target = seek_index_path(path)
+    tmp = f'{target}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(index.to_bytes())
+    os.replace(tmp, target)
+    return target
+
+
+def load_seek_index(path):
+    """Índice guardado de un blob, o None si no existe o está dañado"""
+    try:
+        with open(seek_index_path(path), 'rb') as f:
+            return SeekIndex.from_bytes(f.read())
+    except (OSError, ValueError, struct.error):
+        return None
+
+
+def remove_seek_index(path):
+    try:
+        os.unlink(seek_index_path(path))
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def seek_position(path, index, seconds):
+    """
+    Posición exacta desde la que servir el audio para empezar en `seconds`
+
+    En MP3 se avanza trama a trama desde el punto previo del índice; en OGG
+    y FLAC el punto del índice ya es un límite de página o de trama.
+
+    Returns:
+        tuple | None: (segundos reales de inicio, offset), o None sin índice
+    """
+    point = index.lookup(seconds)
+    if point is None:
+        return None
+    start, offset = point
+    if index.fmt != FORMAT_MP3 or start >= seconds:
+        return start, offset
+    with open_mapped(path) as data:
+        for frame in iter_mp3_frames(data, offset):
+            duration = frame.samples / frame.sample_rate
+            if start + duration > seconds:
+                return start, frame.offset
+            start += duration
+    return start, offset
+
+
+def build_seek_index_task(payload):
+    """
+    Construir y guardar el índice de un blob (tarea de la cola de trabajos)
+
+    Args:
+        payload: dict con 'path' (blob de audio)
+
+    Returns:
+        dict: {'entradas': número de puntos}
+    """
+    index = build_seek_index(payload['path'])
+    if not len(index):
+        raise ValueError('No se encontraron tramas de audio')
+    write_seek_index(payload['path'], index)
+    return {'entradas': len(index)}
@@ -0,0 +1,193 @@
+"""
+Streaming segmentado (estilo HLS) para Spotify Picaflorino
+Cada audio se corta una sola vez en segmentos MP3 de duración fija, en
+límites de trama, y se guardan junto al blob original (ab/cd/<sha>.seg/)
+con un índice; los segmentos nunca cambian, así que navegadores y proxies
+pueden reutilizarlos entre estudiantes
+"""
+
+import os
+import re
+import json
+import shutil
+import tempfile
+from frames import iter_mp3_frames, open_mapped
+from transcode import TranscodeError, find_encoder, transcode_audio
+
+SEGMENTS_SUFFIX = '.seg'
+SEGMENTS_INDEX = 'index.json'
+SEGMENT_MIMETYPE = 'audio/mpeg'
+
+_SEGMENT_NAME_RE = re.compile(r'^\d{5}\.mp3$')
+_KEY_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+def segments_key(archivo):
+    """Clave de los segmentos de un blob (su hash), o None si no es un blob"""
+    stem = os.path.splitext(os.path.basename(archivo or ''))[0]
+    return stem if _KEY_RE.match(stem) else None
+
+
+def segments_dir(base_dir, key):
+    """Carpeta de segmentos de un blob: <base>/ab/cd/<sha>.seg"""
+    if not key or not _KEY_RE.match(key):
+        return None
+    return os.path.join(base_dir, key[:2], key[2:4], key + SEGMENTS_SUFFIX)
+
+
+def is_segment_name(name):
+    return bool(_SEGMENT_NAME_RE.match(name or ''))
+
+
+def segment_name(index):
+    return f'{index:05d}.mp3'
+
+
+def load_segments_index(base_dir, key):
+    """Índice de segmentos de un blob, o None si aún no se generó"""
+    directory = segments_dir(base_dir, key)
+    if directory is None:
+        return None
+    try:
+        with open(os.path.join(directory, SEGMENTS_INDEX), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def remove_segments(base_dir, key):
+    """Eliminar los segmentos de un blob que ya no tiene referencias"""
+    directory = segments_dir(base_dir, key)
+    if directory and os.path.isdir(directory):
+        shutil.rmtree(directory, ignore_errors=True)
+        return True
+    return False
+
+
+def split_mp3(src_path, dest_dir, segment_duration):
+    """
+    Cortar un MP3 en segmentos en límites de trama
+
+    Args:
+        src_path: Archivo MP3
+        dest_dir: Carpeta de salida (debe existir)
+        segment_duration: Duración objetivo de cada segmento en segundos
+
+    Returns:
+        list: [{'duracion': segundos, 'tamano': bytes}] por segmento
+    """
+    segmentos = []
+    with open_mapped(src_path) as data:
+        start = None
+        position = 0
+        samples = 0
+        sample_rate = None
+
+        def cut(end):
+            name = segment_name(len(segmentos))
+            with open(os.path.join(dest_dir, name), 'wb') as out:
+                out.write(data[start:end])
+            segmentos.append({'duracion': round(samples / sample_rate, 3), 'tamano': end - start})
+
+        for frame in iter_mp3_frames(data):
+            if start is None or frame.offset != position:
+                # Inicio o salto de datos corruptos: el segmento sigue desde aquí
+                if start is not None:
+                    cut(position)
+                    samples = 0
+                start = frame.offset
+            sample_rate = frame.sample_rate
+            samples += frame.samples
+            position = frame.offset + frame.size
+            if samples >= segment_duration * sample_rate:
+                cut(position)
+                start, samples = None, 0
+        if start is not None and samples:
+            cut(position)
+    return segmentos
+
+
+def build_segments_task(payload):
+    """
+    Generar los segmentos de un audio (tarea de la cola de trabajos)
+
+    Los originales que no son MP3 se codifican antes con ffmpeg al
+    bitrate indicado. Si otra canción con el mismo contenido ya generó
+    los segmentos, se reutilizan.
+
+    Args:
+        payload: dict con 'path' (blob original), 'store_dir' (uploads/music),
+            'duration' (segundos por segmento), 'bitrate' (kbps para
+            originales no MP3) y 'encoder' (ruta de ffmpeg, opcional)
+
+    Returns:
+        dict: {'segmentos': número de segmentos, 'duracion': segundos}
+    """
+    src = payload['path']
+    key = segments_key(src)
+    if key is None:
+        raise ValueError(f'{src} no está en el almacén por contenido')
+    index = load_segments_index(payload['store_dir'], key)
+    if index is not None:
+        return {'segmentos': len(index['segmentos']), 'duracion': index['duracion']}
+
+    final_dir = segments_dir(payload['store_dir'], key)
+    work_dir = tempfile.mkdtemp(prefix='.segmentos-', dir=os.path.dirname(final_dir))
+    try:
+        mp3_path = src
+        if not src.lower().endswith('.mp3'):
+            encoder = payload.get('encoder') or find_encoder()
+            if not encoder:
+                raise TranscodeError('Se necesita ffmpeg para segmentar archivos que no son MP3')
+            mp3_path = os.path.join(work_dir, 'fuente.mp3')
+            transcode_audio(encoder, src, mp3_path, payload['bitrate'], 'mp3')
+
+        segmentos = split_mp3(mp3_path, work_dir, payload['duration'])
+        if mp3_path != src:
+            os.unlink(mp3_path)
+        if not segmentos:
+            raise ValueError('No se encontraron tramas de audio MP3')
+
+        index = {
+            'duracion_segmento': payload['duration'],
+            'duracion': round(sum(s['duracion'] for s in segmentos), 3),
+            'segmentos': segmentos,
+        }
+        with open(os.path.join(work_dir, SEGMENTS_INDEX), 'w', encoding='utf-8') as f:
+            json.dump(index, f)
+
+        # Publicar la carpeta completa de una vez (nunca segmentos a medias)
+        try:
+            os.rename(work_dir, final_dir)
+        except OSError:
+            if not os.path.isdir(final_dir):
+                raise  # Si otro proceso ya la publicó, se usa la suya
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return {'segmentos': len(index['segmentos']), 'duracion': index['duracion']}
+
+
+def build_m3u8(index, segment_url):
+    """
+    Lista de reproducción HLS (VOD) a partir del índice
+
+    Args:
+        index: Índice de segmentos (load_segments_index)
+        segment_url: Función que recibe el nombre del segmento y devuelve su URL
+
+    Returns:
+        str: Contenido del manifiesto .m3u8
+    """
+    target = max(int(-(-s['duracion'] // 1)) for s in index['segmentos'])
+    lines = [
+        '#EXTM3U',
+        '#EXT-X-VERSION:3',
+        f'#EXT-X-TARGETDURATION:{target}',
+        '#EXT-X-PLAYLIST-TYPE:VOD',
+        '#EXT-X-MEDIA-SEQUENCE:0',
+    ]
+    for number, segmento in enumerate(index['segmentos']):
+        lines.append(f"#EXTINF:{segmento['duracion']:.3f},")
+        lines.append(segment_url(segment_name(number)))
+    lines.append('#EXT-X-ENDLIST')
+    return '\n'.join(lines) + '\n'
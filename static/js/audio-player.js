@@ -14,6 +14,23 @@ class AudioPlayer {
         this.isRepeat = false;
         this.volume = 0.8;
         
+        // Telemetría de reproducción (se envía en lotes)
+        this.currentPlayback = null;
+        this.pendingPlaybacks = [];
+        this.playbackFlushTimer = null;
+        this.playbackBatchSize = 10;
+        this.playbackFlushDelay = 30000;
+        
+        // Reproducción segmentada (segmented-stream.js, si está cargado)
+        this.segmented = null;
+        
+        // Búsqueda en el servidor (/stream?t=): segundos que faltan al inicio del audio cargado
+        this.streamUrl = null;
+        this.seekOffset = 0;
+        
+        // Radio personalizada (/api/radio): cola sin fin pedida por páginas
+        this.radio = null;
+        
         this.setupEventListeners();
         this.initializeUI();
         this.audio.volume = this.volume;
@@ -160,21 +177,14 @@ class AudioPlayer {
     loadSong(songId) {
         this.showLoading();
         
-        fetch(`/api/cancion/${songId}`)
+        fetch(`/api/cancion/${songId}${this.bandwidthQuery()}`)
             .then(response => {
                 if (!response.ok) {
                     throw new Error('Canción no encontrada');
                 }
                 return response.json();
             })
-            .then(song => {
-                this.currentSong = song;
-                this.audio.src = song.archivo;
-                this.updateSongInfo(song);
-                
-                // Registrar reproducción
-                this.registerPlayback(songId);
-            })
+            .then(song => this.startSong(song))
             .catch(error => {
                 console.error('Error al cargar canción:', error);
                 this.showError('Error al cargar la canción');
@@ -184,15 +194,149 @@ class AudioPlayer {
             });
     }
     
+    startSong(song) {
+        this.currentSong = song;
+        this.setSource(song);
+        this.updateSongInfo(song);
+        this.prefetchNext();
+        this.extendRadio();
+        
+        // Registrar reproducción
+        this.registerPlayback(song.id);
+    }
+    
+    playCurrent() {
+        // Las canciones de un manifiesto ya traen sus datos: sin petición por pista
+        const entry = this.playlist[this.currentIndex];
+        if (entry.stream) {
+            this.startSong(entry);
+        } else {
+            this.loadSong(entry.id);
+        }
+    }
+    
+    setSource(song) {
+        if (this.segmented) {
+            this.segmented.destroy();
+            this.segmented = null;
+        }
+        // /stream elige la versión según ?q=, la preferencia o el ancho de banda
+        const fallback = song.stream || song.archivo;
+        this.streamUrl = fallback;
+        this.seekOffset = 0;
+        if (song.manifiesto && typeof SegmentedStream !== 'undefined' &&
+                (SegmentedStream.isSupported() || SegmentedStream.playsNatively(this.audio))) {
+            this.segmented = new SegmentedStream(this.audio, song.manifiesto);
+            this.segmented.attach().catch(error => {
+                console.warn('Reproducción segmentada no disponible:', error);
+                this.segmented.destroy();
+                this.segmented = null;
+                this.audio.src = fallback;
+            });
+        } else {
+            this.audio.src = fallback;
+        }
+    }
+    
+    prefetchNext() {
+        // Solo el primer segmento: la siguiente canción empieza sin esperar
+        if (typeof SegmentedStream === 'undefined' || this.playlist.length < 2 || this.isShuffle) return;
+        const next = this.playlist[(this.currentIndex + 1) % this.playlist.length];
+        const song = next.stream ? Promise.resolve(next)
+            : fetch(`/api/cancion/${next.id}${this.bandwidthQuery()}`)
+                .then(response => response.ok ? response.json() : null);
+        song.then(data => data && data.manifiesto ? SegmentedStream.prefetch(data.manifiesto) : null)
+            .catch(() => {});
+    }
+    
+    bandwidthQuery() {
+        // Ancho de banda estimado por el navegador (Network Information API)
+        const connection = navigator.connection;
+        if (connection && connection.downlink) {
+            return `?bw=${Math.round(connection.downlink * 1000)}`;
+        }
+        return '';
+    }
+    
     loadPlaylist(songs, startIndex = 0) {
+        this.radio = null;
         this.playlist = songs;
         this.currentIndex = startIndex;
         
         if (this.playlist.length > 0) {
-            this.loadSong(this.playlist[this.currentIndex].id);
+            this.playCurrent();
         }
     }
     
+    loadPlaylistManifest(url, startIndex = 0) {
+        // Un solo JSON con todas las pistas (ETag: las siguientes cargas responden 304)
+        this.showLoading();
+        const separator = url.includes('?') ? '&' : '?';
+        const query = this.bandwidthQuery();
+        return fetch(query ? `${url}${separator}${query.slice(1)}` : url)
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error('Playlist no encontrada');
+                }
+                return response.json();
+            })
+            .then(manifest => this.loadPlaylist(manifest.canciones, startIndex))
+            .catch(error => {
+                console.error('Error al cargar playlist:', error);
+                this.showError('Error al cargar la playlist');
+            })
+            .finally(() => {
+                this.hideLoading();
+            });
+    }
+    
+    fetchRadioPage(url, from) {
+        const query = this.bandwidthQuery();
+        return fetch(`${url}?desde=${from}${query ? `&${query.slice(1)}` : ''}`)
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error('Radio no disponible');
+                }
+                return response.json();
+            });
+    }
+    
+    startRadio(songId) {
+        // Canciones parecidas a songId; se agregan más antes de llegar al final
+        const url = `/api/radio/${songId}`;
+        this.showLoading();
+        return this.fetchRadioPage(url, 0)
+            .then(page => {
+                this.loadPlaylist(page.canciones);
+                this.radio = {url: url, next: page.siguiente, loading: false};
+            })
+            .catch(error => {
+                console.error('Error al cargar la radio:', error);
+                this.showError('Error al cargar la radio');
+            })
+            .finally(() => {
+                this.hideLoading();
+            });
+    }
+    
+    extendRadio() {
+        const radio = this.radio;
+        if (!radio || radio.loading || radio.next === null ||
+                this.playlist.length - this.currentIndex > 3) return;
+        radio.loading = true;
+        this.fetchRadioPage(radio.url, radio.next)
+            .then(page => {
+                // Otra playlist reemplazó a la radio mientras tanto
+                if (this.radio !== radio) return;
+                this.playlist.push(...page.canciones);
+                radio.next = page.siguiente;
+            })
+            .catch(error => console.warn('No se pudo extender la radio:', error))
+            .finally(() => {
+                radio.loading = false;
+            });
+    }
+    
     updateSongInfo(song) {
         const titleEl = document.getElementById('song-title');
         const artistEl = document.getElementById('song-artist');
@@ -251,7 +395,7 @@ class AudioPlayer {
     
     stop() {
         this.audio.pause();
-        this.audio.currentTime = 0;
+        this.seekToTime(0);
         this.isPlaying = false;
         this.updatePlayButton();
         this.hideEqualizer();
@@ -266,20 +410,20 @@ class AudioPlayer {
             this.currentIndex = (this.currentIndex + 1) % this.playlist.length;
         }
         
-        this.loadSong(this.playlist[this.currentIndex].id);
+        this.playCurrent();
     }
     
     playPrevious() {
         if (this.playlist.length === 0) return;
         
-        if (this.audio.currentTime > 3) {
+        if (this.currentPosition() > 3) {
             // Si han pasado más de 3 segundos, reiniciar la canción actual
-            this.audio.currentTime = 0;
+            this.seekToTime(0);
         } else {
             // Ir a la canción anterior
             this.currentIndex = this.currentIndex === 0 ? 
                 this.playlist.length - 1 : this.currentIndex - 1;
-            this.loadSong(this.playlist[this.currentIndex].id);
+            this.playCurrent();
         }
     }
     
@@ -325,15 +469,52 @@ class AudioPlayer {
         const width = rect.width;
         const percentage = clickX / width;
         
-        if (this.audio.duration) {
-            this.audio.currentTime = this.audio.duration * percentage;
+        const total = this.totalDuration();
+        if (total) {
+            this.seekToTime(total * percentage);
+        }
+    }
+    
+    currentPosition() {
+        return this.seekOffset + (this.audio.currentTime || 0);
+    }
+    
+    totalDuration() {
+        return (this.currentSong && this.currentSong.duracion_segundos) || this.audio.duration;
+    }
+    
+    isBuffered(time) {
+        const buffered = this.audio.buffered;
+        for (let i = 0; i < buffered.length; i++) {
+            if (buffered.start(i) <= time && time <= buffered.end(i)) return true;
+        }
+        return false;
+    }
+    
+    seekToTime(seconds) {
+        const local = seconds - this.seekOffset;
+        const serverSeek = this.currentSong && this.currentSong.busqueda && !this.segmented && this.streamUrl;
+        if (!serverSeek || (local >= 0 && this.isBuffered(local)) || (seconds === 0 && this.seekOffset === 0)) {
+            this.audio.currentTime = Math.max(0, local);
+            return;
+        }
+        
+        // Fuera de lo descargado: el servidor empieza en la trama exacta (sin adivinar por bitrate)
+        const wasPlaying = this.isPlaying;
+        const separator = this.streamUrl.includes('?') ? '&' : '?';
+        this.seekOffset = seconds;
+        this.audio.src = seconds > 0 ? `${this.streamUrl}${separator}t=${seconds.toFixed(3)}` : this.streamUrl;
+        if (wasPlaying) {
+            this.play();
         }
     }
     
     updateProgress() {
-        if (!this.audio.duration) return;
+        const total = this.totalDuration();
+        if (!total) return;
         
-        const progress = (this.audio.currentTime / this.audio.duration) * 100;
+        const position = this.currentPosition();
+        const progress = (position / total) * 100;
         const progressBar = document.getElementById('progress-bar');
         const currentTimeEl = document.getElementById('current-time');
         const totalTimeEl = document.getElementById('total-time');
@@ -343,11 +524,11 @@ class AudioPlayer {
         }
         
         if (currentTimeEl) {
-            currentTimeEl.textContent = this.formatTime(this.audio.currentTime);
+            currentTimeEl.textContent = this.formatTime(position);
         }
         
         if (totalTimeEl) {
-            totalTimeEl.textContent = this.formatTime(this.audio.duration);
+            totalTimeEl.textContent = this.formatTime(total);
         }
     }
     
@@ -437,19 +618,56 @@ class AudioPlayer {
     }
     
     registerPlayback(songId) {
-        // Registrar la reproducción en el servidor
+        // Cerrar la reproducción anterior y empezar a medir la nueva
+        this.finishPlayback(false);
+        this.currentPlayback = {
+            cancion_id: songId,
+            timestamp: Date.now()
+        };
+    }
+    
+    finishPlayback(completed) {
+        if (!this.currentPlayback) return;
+        
+        this.pendingPlaybacks.push({
+            ...this.currentPlayback,
+            duracion_reproducida: Math.round(this.currentPosition()),
+            completada: completed
+        });
+        this.currentPlayback = null;
+        
+        if (this.pendingPlaybacks.length >= this.playbackBatchSize) {
+            this.flushPlaybacks();
+        } else if (!this.playbackFlushTimer) {
+            this.playbackFlushTimer = setTimeout(() => this.flushPlaybacks(), this.playbackFlushDelay);
+        }
+    }
+    
+    flushPlaybacks(useBeacon = false) {
+        clearTimeout(this.playbackFlushTimer);
+        this.playbackFlushTimer = null;
+        if (this.pendingPlaybacks.length === 0) return;
+        
+        // Enviar todas las reproducciones pendientes en una sola petición
+        const events = this.pendingPlaybacks;
+        this.pendingPlaybacks = [];
+        const body = JSON.stringify({ eventos: events });
+        
+        if (useBeacon && navigator.sendBeacon) {
+            navigator.sendBeacon('/api/reproduccion', new Blob([body], { type: 'application/json' }));
+            return;
+        }
+        
         fetch('/api/reproduccion', {
             method: 'POST',
+            keepalive: true,
             headers: {
                 'Content-Type': 'application/json',
                 'X-CSRFToken': this.getCSRFToken()
             },
-            body: JSON.stringify({
-                cancion_id: songId,
-                timestamp: Date.now()
-            })
+            body: body
         }).catch(error => {
-            console.error('Error al registrar reproducción:', error);
+            console.error('Error al registrar reproducciones:', error);
         });
     }
     
@@ -510,8 +728,11 @@ class AudioPlayer {
     }
     
     onSongEnd() {
+        this.finishPlayback(true);
+        
         if (this.isRepeat) {
-            this.audio.currentTime = 0;
+            this.registerPlayback(this.currentSong.id);
+            this.seekToTime(0);
             this.play();
         } else {
             this.playNext();
@@ -527,7 +748,12 @@ class AudioPlayer {
     
     // Destructor
     destroy() {
+        this.finishPlayback(false);
+        this.flushPlaybacks(true);
         this.audio.pause();
+        if (this.segmented) {
+            this.segmented.destroy();
+        }
         this.audio.src = '';
         document.removeEventListener('keydown', this.handleKeyPress);
     }
@@ -549,9 +775,19 @@ function playTSong(songId) {
     }
 }
 
-function playPlaylist(songs, startIndex = 0) {
+function playPlaylist(source, startIndex = 0) {
+    // Id de playlist (manifiesto) o lista de canciones ya conocida
+    if (!window.audioPlayer) return;
+    if (Array.isArray(source)) {
+        window.audioPlayer.loadPlaylist(source, startIndex);
+    } else {
+        window.audioPlayer.loadPlaylistManifest(`/api/playlist/${source}/manifiesto`, startIndex);
+    }
+}
+
+function playRadio(songId) {
     if (window.audioPlayer) {
-        window.audioPlayer.loadPlaylist(songs, startIndex);
+        window.audioPlayer.startRadio(songId);
     }
 }
 
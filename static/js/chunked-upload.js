@@ -0,0 +1,197 @@
+// Subidas reanudables por bloques - Spotify Picaflorino
+// I.E. 30012 Victor Alberto Gill Mallma
+//
+// Protocolo: POST /api/subidas (iniciar), PUT /api/subidas/<id> con
+// Upload-Offset y X-Chunk-Sha256 por cada bloque, y POST .../finalizar con
+// los datos del formulario. Si la conexión se corta, la subida continúa
+// desde el último bloque confirmado (también tras recargar la página).
+
+class ChunkedUploader {
+    constructor(file, options = {}) {
+        this.file = file;
+        this.baseUrl = options.baseUrl || '/api/subidas';
+        this.onProgress = options.onProgress || (() => {});
+        this.maxRetries = options.maxRetries || 8;
+        this.chunkSize = null;
+        this.uploadId = null;
+        this.offset = 0;
+        this.storageKey = `subida:${file.name}:${file.size}:${file.lastModified}`;
+    }
+
+    async upload(formData) {
+        await this.resumeOrStart();
+        await this.sendChunks();
+        return this.finalize(formData);
+    }
+
+    // Reanudar una subida guardada en localStorage o iniciar una nueva
+    async resumeOrStart() {
+        const saved = JSON.parse(localStorage.getItem(this.storageKey) || 'null');
+        if (saved) {
+            const response = await fetch(`${this.baseUrl}/${saved.id}`);
+            if (response.ok) {
+                const status = await response.json();
+                this.uploadId = saved.id;
+                this.chunkSize = saved.chunkSize;
+                this.offset = status.offset;
+                return;
+            }
+            localStorage.removeItem(this.storageKey);
+        }
+
+        const response = await fetch(this.baseUrl, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ nombre: this.file.name, tamano: this.file.size })
+        });
+        const data = await response.json();
+        if (!response.ok) {
+            throw new Error(data.error || 'No se pudo iniciar la subida');
+        }
+        this.uploadId = data.id;
+        this.chunkSize = data.tamano_bloque;
+        this.offset = 0;
+        localStorage.setItem(this.storageKey, JSON.stringify({ id: this.uploadId, chunkSize: this.chunkSize }));
+    }
+
+    async sendChunks() {
+        let retries = 0;
+        while (this.offset < this.file.size) {
+            this.onProgress(this.offset / this.file.size);
+            const chunk = await this.file.slice(this.offset, this.offset + this.chunkSize).arrayBuffer();
+
+            try {
+                const response = await fetch(`${this.baseUrl}/${this.uploadId}`, {
+                    method: 'PUT',
+                    headers: {
+                        'Content-Type': 'application/octet-stream',
+                        'Upload-Offset': String(this.offset),
+                        'X-Chunk-Sha256': await sha256Hex(chunk)
+                    },
+                    body: chunk
+                });
+                const data = await response.json();
+
+                if (response.ok) {
+                    this.offset = data.offset;
+                    retries = 0;
+                    continue;
+                }
+                if (data.offset === null || data.offset === undefined || response.status === 404) {
+                    // Error definitivo (subida expirada, tamaño inválido...)
+                    localStorage.removeItem(this.storageKey);
+                    throw new FatalUploadError(data.error || 'Error al subir el archivo');
+                }
+                // 409/422: el servidor indica desde dónde continuar
+                this.offset = data.offset;
+            } catch (error) {
+                if (error instanceof FatalUploadError || ++retries > this.maxRetries) {
+                    throw error;
+                }
+                // Red inestable: esperar y volver a preguntar el offset confirmado
+                await sleep(Math.min(30000, 1000 * 2 ** retries));
+                const status = await fetch(`${this.baseUrl}/${this.uploadId}`).catch(() => null);
+                if (status && status.ok) {
+                    this.offset = (await status.json()).offset;
+                }
+            }
+        }
+        this.onProgress(1);
+    }
+
+    async finalize(formData) {
+        const response = await fetch(`${this.baseUrl}/${this.uploadId}/finalizar`, {
+            method: 'POST',
+            body: formData
+        });
+        const data = await response.json();
+        if (response.ok || [404, 409, 422].includes(response.status)) {
+            // Guardada o rechazada para siempre; con datos inválidos (400) o un
+            // error del servidor (5xx) la subida se conserva para reintentar
+            localStorage.removeItem(this.storageKey);
+        }
+        if (!response.ok) {
+            const error = new Error(data.error || 'Error al guardar la canción');
+            error.fields = data.errores;
+            throw error;
+        }
+        return data;
+    }
+}
+
+class FatalUploadError extends Error {}
+
+function sleep(ms) {
+    return new Promise(resolve => setTimeout(resolve, ms));
+}
+
+async function sha256Hex(buffer) {
+    // crypto.subtle solo existe en contextos seguros (HTTPS o localhost)
+    if (window.crypto && window.crypto.subtle) {
+        const digest = await window.crypto.subtle.digest('SHA-256', buffer);
+        return toHex(new Uint8Array(digest));
+    }
+    return toHex(sha256Fallback(new Uint8Array(buffer)));
+}
+
+function toHex(bytes) {
+    return Array.from(bytes, b => b.toString(16).padStart(2, '0')).join('');
+}
+
+// SHA-256 en JavaScript para servidores de la red local sin HTTPS
+function sha256Fallback(data) {
+    const K = new Uint32Array([
+        0x428a2f98, 0x71374491, 0xb5c0fbcf, 0xe9b5dba5, 0x3956c25b, 0x59f111f1, 0x923f82a4, 0xab1c5ed5,
+        0xd807aa98, 0x12835b01, 0x243185be, 0x550c7dc3, 0x72be5d74, 0x80deb1fe, 0x9bdc06a7, 0xc19bf174,
+        0xe49b69c1, 0xefbe4786, 0x0fc19dc6, 0x240ca1cc, 0x2de92c6f, 0x4a7484aa, 0x5cb0a9dc, 0x76f988da,
+        0x983e5152, 0xa831c66d, 0xb00327c8, 0xbf597fc7, 0xc6e00bf3, 0xd5a79147, 0x06ca6351, 0x14292967,
+        0x27b70a85, 0x2e1b2138, 0x4d2c6dfc, 0x53380d13, 0x650a7354, 0x766a0abb, 0x81c2c92e, 0x92722c85,
+        0xa2bfe8a1, 0xa81a664b, 0xc24b8b70, 0xc76c51a3, 0xd192e819, 0xd6990624, 0xf40e3585, 0x106aa070,
+        0x19a4c116, 0x1e376c08, 0x2748774c, 0x34b0bcb5, 0x391c0cb3, 0x4ed8aa4a, 0x5b9cca4f, 0x682e6ff3,
+        0x748f82ee, 0x78a5636f, 0x84c87814, 0x8cc70208, 0x90befffa, 0xa4506ceb, 0xbef9a3f7, 0xc67178f2
+    ]);
+    const H = new Uint32Array([
+        0x6a09e667, 0xbb67ae85, 0x3c6ef372, 0xa54ff53a, 0x510e527f, 0x9b05688c, 0x1f83d9ab, 0x5be0cd19
+    ]);
+
+    // Relleno: 0x80, ceros y la longitud en bits (big-endian, 64 bits)
+    const length = data.length;
+    const padded = new Uint8Array(Math.ceil((length + 9) / 64) * 64);
+    padded.set(data);
+    padded[length] = 0x80;
+    const view = new DataView(padded.buffer);
+    view.setUint32(padded.length - 8, Math.floor(length / 0x20000000));
+    view.setUint32(padded.length - 4, (length << 3) >>> 0);
+
+    const W = new Uint32Array(64);
+    const rotr = (x, n) => (x >>> n) | (x << (32 - n));
+    for (let block = 0; block < padded.length; block += 64) {
+        for (let i = 0; i < 16; i++) {
+            W[i] = view.getUint32(block + i * 4);
+        }
+        for (let i = 16; i < 64; i++) {
+            const s0 = rotr(W[i - 15], 7) ^ rotr(W[i - 15], 18) ^ (W[i - 15] >>> 3);
+            const s1 = rotr(W[i - 2], 17) ^ rotr(W[i - 2], 19) ^ (W[i - 2] >>> 10);
+            W[i] = (W[i - 16] + s0 + W[i - 7] + s1) >>> 0;
+        }
+
+        let [a, b, c, d, e, f, g, h] = H;
+        for (let i = 0; i < 64; i++) {
+            const S1 = rotr(e, 6) ^ rotr(e, 11) ^ rotr(e, 25);
+            const ch = (e & f) ^ (~e & g);
+            const t1 = (h + S1 + ch + K[i] + W[i]) >>> 0;
+            const S0 = rotr(a, 2) ^ rotr(a, 13) ^ rotr(a, 22);
+            const maj = (a & b) ^ (a & c) ^ (b & c);
+            const t2 = (S0 + maj) >>> 0;
+            h = g; g = f; f = e; e = (d + t1) >>> 0;
+            d = c; c = b; b = a; a = (t1 + t2) >>> 0;
+        }
+        H[0] += a; H[1] += b; H[2] += c; H[3] += d;
+        H[4] += e; H[5] += f; H[6] += g; H[7] += h;
+    }
+
+    const out = new Uint8Array(32);
+    const outView = new DataView(out.buffer);
+    H.forEach((value, i) => outView.setUint32(i * 4, value));
+    return out;
+}
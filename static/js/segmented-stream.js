@@ -0,0 +1,162 @@
+// Reproducción segmentada (estilo HLS) - Spotify Picaflorino
+// I.E. 30012 Victor Alberto Gill Mallma
+//
+// Lee el manifiesto /stream/<id>/manifest.m3u8 y alimenta el <audio> con
+// Media Source Extensions segmento a segmento: para empezar a sonar basta
+// el primero, y los segmentos (URLs inmutables) quedan en la caché del
+// navegador y de los proxies. Safari reproduce el manifiesto de forma nativa.
+
+class SegmentedStream {
+    constructor(audio, manifestUrl, options = {}) {
+        this.audio = audio;
+        this.manifestUrl = manifestUrl;
+        this.bufferAhead = options.bufferAhead || 30;  // Segundos a descargar por delante
+        this.segments = [];
+        this.loading = false;
+        this.generation = 0;  // Cambia en cada salto: descarta descargas obsoletas
+        this.mediaSource = null;
+        this.sourceBuffer = null;
+        this.objectUrl = null;
+        this.onTimeUpdate = () => this.pump();
+        this.onSeeking = () => this.seek();
+    }
+
+    static isSupported() {
+        return Boolean(window.MediaSource && MediaSource.isTypeSupported('audio/mpeg'));
+    }
+
+    static playsNatively(audio) {
+        return audio.canPlayType('application/vnd.apple.mpegurl') !== '';
+    }
+
+    static parseManifest(text, baseUrl) {
+        const segments = [];
+        let start = 0;
+        let duration = null;
+        for (const rawLine of text.split('\n')) {
+            const line = rawLine.trim();
+            if (line.startsWith('#EXTINF:')) {
+                duration = parseFloat(line.slice(8));
+            } else if (line && !line.startsWith('#') && duration !== null) {
+                segments.push({ url: new URL(line, baseUrl).href, start, duration });
+                start += duration;
+                duration = null;
+            }
+        }
+        return segments;
+    }
+
+    static async loadManifest(manifestUrl) {
+        const response = await fetch(manifestUrl);
+        if (!response.ok) {
+            throw new Error('Manifiesto no disponible');
+        }
+        return SegmentedStream.parseManifest(await response.text(), new URL(manifestUrl, location.href));
+    }
+
+    // Precargar el primer segmento de la siguiente canción (queda en caché)
+    static async prefetch(manifestUrl) {
+        const segments = await SegmentedStream.loadManifest(manifestUrl);
+        if (segments.length) {
+            await fetch(segments[0].url);
+        }
+    }
+
+    async attach() {
+        if (SegmentedStream.playsNatively(this.audio)) {
+            this.audio.src = this.manifestUrl;
+            return;
+        }
+        this.segments = await SegmentedStream.loadManifest(this.manifestUrl);
+        if (!this.segments.length) {
+            throw new Error('Manifiesto vacío');
+        }
+
+        this.mediaSource = new MediaSource();
+        this.objectUrl = URL.createObjectURL(this.mediaSource);
+        this.audio.src = this.objectUrl;
+        await new Promise(resolve => this.mediaSource.addEventListener('sourceopen', resolve, { once: true }));
+
+        const last = this.segments[this.segments.length - 1];
+        this.mediaSource.duration = last.start + last.duration;
+        this.sourceBuffer = this.mediaSource.addSourceBuffer('audio/mpeg');
+        this.audio.addEventListener('timeupdate', this.onTimeUpdate);
+        this.audio.addEventListener('seeking', this.onSeeking);
+        this.pump();
+    }
+
+    bufferedAhead() {
+        const time = this.audio.currentTime;
+        const buffered = this.sourceBuffer.buffered;
+        for (let i = 0; i < buffered.length; i++) {
+            if (buffered.start(i) <= time + 0.1 && time <= buffered.end(i)) {
+                return buffered.end(i) - time;
+            }
+        }
+        return 0;
+    }
+
+    async pump() {
+        if (!this.sourceBuffer || this.loading || this.mediaSource.readyState === 'closed') return;
+        const ahead = this.bufferedAhead();
+        if (ahead > this.bufferAhead) return;
+
+        // Siguiente segmento: el que continúa el tramo ya descargado desde la posición actual
+        const edge = this.audio.currentTime + ahead;
+        const segment = this.segments.find(s => s.start + s.duration > edge + 0.05);
+        if (!segment) {
+            if (this.mediaSource.readyState === 'open' && !this.sourceBuffer.updating) {
+                this.mediaSource.endOfStream();
+            }
+            return;
+        }
+
+        const generation = this.generation;
+        this.loading = true;
+        try {
+            const response = await fetch(segment.url);
+            if (!response.ok) {
+                throw new Error(`Segmento no disponible (${response.status})`);
+            }
+            const data = await response.arrayBuffer();
+            if (generation !== this.generation || !this.sourceBuffer) return;
+
+            // Cada segmento se ubica en su tiempo: permite saltar a cualquier segmento
+            const sourceBuffer = this.sourceBuffer;
+            sourceBuffer.timestampOffset = segment.start;
+            sourceBuffer.appendBuffer(data);
+            await new Promise(resolve => sourceBuffer.addEventListener('updateend', resolve, { once: true }));
+            if (generation !== this.generation) return;
+        } catch (error) {
+            console.error('Error en la reproducción segmentada:', error);
+            return;
+        } finally {
+            if (generation === this.generation) {
+                this.loading = false;
+            }
+        }
+        this.pump();
+    }
+
+    seek() {
+        // Salto fuera de lo descargado: cancelar la descarga en curso y seguir desde ahí
+        if (!this.sourceBuffer || this.bufferedAhead() > 0) return;
+        this.generation++;
+        this.loading = false;
+        if (this.sourceBuffer.updating) {
+            this.sourceBuffer.abort();
+        }
+        this.pump();
+    }
+
+    destroy() {
+        this.generation++;
+        this.audio.removeEventListener('timeupdate', this.onTimeUpdate);
+        this.audio.removeEventListener('seeking', this.onSeeking);
+        if (this.objectUrl) {
+            URL.revokeObjectURL(this.objectUrl);
+        }
+        this.sourceBuffer = null;
+        this.mediaSource = null;
+    }
+}
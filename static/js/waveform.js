@@ -0,0 +1,83 @@
+// Forma de onda de la barra de búsqueda - Spotify Picaflorino
+// I.E. 30012 Victor Alberto Gill Mallma
+//
+// Dibuja en un <canvas> los picos precalculados de /api/cancion/<id>/peaks
+// (pares mín/máx en int8): unos pocos KB en lugar de descargar y decodificar
+// el audio completo en el navegador.
+
+class Waveform {
+    constructor(canvas, peaks, options = {}) {
+        this.canvas = canvas;
+        this.peaks = peaks;  // Int8Array [mín, máx, mín, máx, ...]
+        this.barWidth = options.barWidth || 2;
+        this.gap = options.gap || 1;
+        this.playedColor = options.playedColor || '#1db954';
+        this.pendingColor = options.pendingColor || '#4b5563';
+        this.bars = this.computeBars();
+        this.fraction = 0;
+    }
+
+    static async load(canvas, url, options = {}) {
+        // Pedir solo el nivel que cabe en el ancho de la barra
+        const step = (options.barWidth || 2) + (options.gap || 1);
+        const bars = Math.max(1, Math.floor(canvas.clientWidth / step));
+        const separator = url.includes('?') ? '&' : '?';
+        const response = await fetch(`${url}${separator}ancho=${bars}`);
+        if (!response.ok) {
+            throw new Error(`Picos no disponibles (${response.status})`);
+        }
+        const waveform = new Waveform(canvas, new Int8Array(await response.arrayBuffer()), options);
+        waveform.draw(0);
+        return waveform;
+    }
+
+    computeBars() {
+        // Agrupar los picos en tantas barras como quepan, normalizadas a [0, 1]
+        const step = this.barWidth + this.gap;
+        const count = Math.max(1, Math.floor(this.canvas.clientWidth / step));
+        const total = this.peaks.length / 2;
+        const bars = [];
+        let loudest = 1;
+        for (let i = 0; i < count && total; i++) {
+            const from = Math.floor((i * total) / count);
+            const to = Math.max(from + 1, Math.floor(((i + 1) * total) / count));
+            let low = 0;
+            let high = 0;
+            for (let j = from; j < to && j < total; j++) {
+                low = Math.min(low, this.peaks[2 * j]);
+                high = Math.max(high, this.peaks[2 * j + 1]);
+            }
+            bars.push([low, high]);
+            loudest = Math.max(loudest, -low, high);
+        }
+        return bars.map(([low, high]) => [low / loudest, high / loudest]);
+    }
+
+    draw(fraction) {
+        this.fraction = Math.min(1, Math.max(0, fraction || 0));
+        const ratio = window.devicePixelRatio || 1;
+        const width = this.canvas.clientWidth;
+        const height = this.canvas.clientHeight;
+        if (this.canvas.width !== Math.round(width * ratio)) {
+            this.canvas.width = Math.round(width * ratio);
+            this.canvas.height = Math.round(height * ratio);
+        }
+        const context = this.canvas.getContext('2d');
+        context.setTransform(ratio, 0, 0, ratio, 0, 0);
+        context.clearRect(0, 0, width, height);
+
+        const middle = height / 2;
+        const played = this.fraction * this.bars.length;
+        this.bars.forEach(([low, high], i) => {
+            const top = middle - Math.max(high, 0.02) * middle;
+            const bottom = middle - Math.min(low, -0.02) * middle;
+            context.fillStyle = i < played ? this.playedColor : this.pendingColor;
+            context.fillRect(i * (this.barWidth + this.gap), top, this.barWidth, bottom - top);
+        });
+    }
+
+    resize() {
+        this.bars = this.computeBars();
+        this.draw(this.fraction);
+    }
+}
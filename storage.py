@@ -0,0 +1,229 @@
+"""
+Almacenamiento direccionado por contenido para Spotify Picaflorino
+Cada audio se guarda una sola vez con el nombre de su hash SHA-256 en
+directorios de dos niveles (ab/cd/abcd....mp3); las canciones que
+comparten contenido comparten el mismo archivo. Reutilizar y eliminar un
+blob se excluyen con un bloqueo por hash, y cada reutilización renueva su
+"reserva" (.locks/ab/<blob>.lease), sin tocar el blob: su fecha sigue
+siendo la validación de ETag, Last-Modified y las exportaciones ZIP
+"""
+
+import os
+import re
+import time
+import uuid
+import shutil
+import hashlib
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo entre procesos
+    fcntl = None
+
+HASH_CHUNK_SIZE = 64 * 1024
+
+# ab/cd/<64 hex>.<ext>
+_BLOB_RE = re.compile(r'^[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(\.[a-z0-9]+)?$')
+
+
+def blob_relpath(sha256, ext=''):
+    """
+    Ruta relativa de un blob según su hash
+
+    Args:
+        sha256: Hash hexadecimal del contenido
+        ext: Extensión con punto (ej: '.mp3')
+
+    Returns:
+        str: Ruta relativa con separador '/' (ej: 'ab/cd/abcd...mp3')
+    """
+    return f'{sha256[:2]}/{sha256[2:4]}/{sha256}{ext.lower()}'
+
+
+def is_blob_path(relpath):
+    """Si un nombre de archivo ya sigue el esquema direccionado por contenido"""
+    return bool(relpath and _BLOB_RE.match(relpath))
+
+
+def blob_abspath(base_dir, relpath):
+    return os.path.join(base_dir, *relpath.split('/'))
+
+
+def hash_file(path, chunk_size=HASH_CHUNK_SIZE):
+    """Calcular el SHA-256 de un archivo por bloques"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def blob_sha256(relpath):
+    """Hash del contenido a partir de la ruta relativa de un blob"""
+    return relpath.rsplit('/', 1)[-1][:64]
+
+
+@contextmanager
+def blob_lock(base_dir, sha256):
+    """
+    Bloqueo exclusivo entre procesos de los blobs con este hash (no reentrante)
+
+    Se reparte en 256 archivos (.locks/ab.lock) para no dejar uno por blob
+    """
+    lock_dir = os.path.join(base_dir, '.locks')
+    os.makedirs(lock_dir, exist_ok=True)
+    with open(os.path.join(lock_dir, f'{sha256[:2]}.lock'), 'a') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        yield
+
+
+def _lease_path(base_dir, relpath):
+    """Reserva del blob, fuera de su directorio: .locks/ab/<sha>.<ext>.lease"""
+    name = relpath.rsplit('/', 1)[-1]
+    return os.path.join(base_dir, '.locks', name[:2], name + '.lease')
+
+
+def _renew_lease(base_dir, relpath):
+    """Marcar el blob como recién reutilizado; devuelve la reserva (distinta cada vez)"""
+    path = _lease_path(base_dir, relpath)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    lease = uuid.uuid4().hex
+    with open(path + '.tmp', 'w', encoding='ascii') as f:
+        f.write(lease)
+    os.replace(path + '.tmp', path)
+    return lease
+
+
+def blob_releasable(base_dir, relpath, lease=None, grace=0):
+    """
+    Si un blob sin referencias puede eliminarse (con blob_lock tomado)
+
+    Args:
+        base_dir: Raíz del almacén
+        relpath: Ruta relativa del blob
+        lease: Reserva de reserve_blob: solo se elimina si nadie reutilizó
+            el blob después
+        grace: Sin reserva, segundos desde la última reutilización en los que
+            se conserva (la fila que lo referencia puede no estar guardada aún)
+    """
+    if not os.path.exists(blob_abspath(base_dir, relpath)):
+        return False
+    try:
+        with open(_lease_path(base_dir, relpath), encoding='ascii') as f:
+            current = f.read()
+            renewed = os.fstat(f.fileno()).st_mtime
+    except FileNotFoundError:
+        return True  # Blob anterior a las reservas
+    if lease is not None:
+        return current == lease
+    return time.time() - renewed >= grace
+
+
+def store_blob(src_path, base_dir, sha256, ext='', mode='move'):
+    """
+    Guardar un archivo en el almacén, reutilizando el blob si ya existe
+
+    Args:
+        src_path: Archivo de origen (temporal de subida, importación...)
+        base_dir: Raíz del almacén (ej: uploads/music)
+        sha256: Hash del contenido de src_path
+        ext: Extensión con punto
+        mode: 'move' (el origen se consume), 'link' (hardlink o copia) o 'copy'
+
+    Returns:
+        tuple: (ruta relativa, creado) — creado es False si era un duplicado
+    """
+    relpath, created, _ = reserve_blob(src_path, base_dir, sha256, ext, mode)
+    return relpath, created
+
+
+def reserve_blob(src_path, base_dir, sha256, ext='', mode='move'):
+    """
+    store_blob que además devuelve la reserva del blob, para deshacer una
+    subida fallida sin borrar un blob que otra subida acaba de reutilizar
+
+    Returns:
+        tuple: (ruta relativa, creado, reserva)
+    """
+    relpath = blob_relpath(sha256, ext)
+    dest = blob_abspath(base_dir, relpath)
+    with blob_lock(base_dir, sha256):
+        created = not os.path.exists(dest)
+        if created:
+            _place_blob(src_path, dest, mode)
+        elif mode == 'move':
+            os.unlink(src_path)
+        return relpath, created, _renew_lease(base_dir, relpath)
+
+
+def _place_blob(src_path, dest, mode):
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    if mode == 'move':
+        try:
+            os.replace(src_path, dest)
+        except OSError:
+            # Origen en otro sistema de archivos: copiar y renombrar
+            tmp = f'{dest}.{os.getpid()}.tmp'
+            shutil.move(src_path, tmp)
+            os.replace(tmp, dest)
+    else:
+        # Copia a un temporal y renombrado atómico: nunca un blob a medias
+        tmp = f'{dest}.{os.getpid()}.tmp'
+        try:
+            if mode == 'link':
+                try:
+                    os.link(src_path, tmp)
+                except OSError:
+                    shutil.copy2(src_path, tmp)  # Otro sistema de archivos
+            else:
+                shutil.copy2(src_path, tmp)
+            os.replace(tmp, dest)
+        finally:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+
+
+def remove_blob(base_dir, relpath):
+    """
+    Eliminar un blob sin referencias y los directorios de shard vacíos
+    (quien comprueba las referencias debe tener blob_lock tomado)
+
+    Returns:
+        bool: True si se eliminó el archivo
+    """
+    path = blob_abspath(base_dir, relpath)
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        return False
+    try:
+        os.unlink(_lease_path(base_dir, relpath))
+    except FileNotFoundError:
+        pass
+    for directory in (os.path.dirname(path), os.path.dirname(os.path.dirname(path))):
+        try:
+            os.rmdir(directory)
+        except OSError:
+            break  # No está vacío
+    return True
+
+
+def migrate_file(base_dir, filename):
+    """
+    Copiar (hardlink) un archivo del esquema plano antiguo al almacén por
+    contenido; el original se elimina después de actualizar la base de datos
+
+    Args:
+        base_dir: Raíz del almacén (ej: uploads/music)
+        filename: Nombre plano actual (ej: audio_20240101_120000_ab12cd34.mp3)
+
+    Returns:
+        tuple: (ruta relativa nueva, creado) o (None, False) si el archivo no existe
+    """
+    path = os.path.join(base_dir, filename)
+    if not os.path.isfile(path):
+        return None, False
+    _, ext = os.path.splitext(filename)
+    return store_blob(path, base_dir, hash_file(path), ext, mode='link')
@@ -0,0 +1,360 @@
+"""
+Motor de streaming de audio para Spotify Picaflorino
+Soporte de peticiones HTTP Range (206 Partial Content), validadores
+condicionales (ETag / Last-Modified / If-Range) y transferencia zero-copy
+"""
+
+import os
+import uuid
+import mimetypes
+from collections import namedtuple
+from datetime import datetime, timezone
+from flask import Response, request
+from werkzeug.http import http_date, is_resource_modified, parse_date, unquote_etag
+from werkzeug.wsgi import wrap_file
+
+# Tamaño de bloque para lectura de archivos cuando no hay sendfile
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Máximo de rangos aceptados en una sola petición multi-range
+STREAM_MAX_RANGES = 16
+
+# Datos resueltos de un archivo servible (se guardan en caché por canción)
+StreamFileInfo = namedtuple('StreamFileInfo', ['path', 'size', 'mtime', 'mimetype', 'etag'])
+
+
+def make_etag(size, mtime):
+    """
+    Generar un ETag fuerte a partir del tamaño y fecha de modificación
+
+    Args:
+        size: Tamaño del archivo en bytes
+        mtime: Fecha de modificación (timestamp)
+
+    Returns:
+        str: ETag sin comillas
+    """
+    return f"{int(mtime * 1000000):x}-{size:x}"
+
+
+def stat_stream_file(file_path):
+    """
+    Resolver tamaño, fecha, tipo MIME y ETag de un archivo de audio
+
+    Args:
+        file_path: Ruta absoluta del archivo
+
+    Returns:
+        StreamFileInfo | None: Información del archivo, o None si no existe
+    """
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    mimetype = mimetypes.guess_type(file_path)[0] or 'application/octet-stream'
+    return StreamFileInfo(file_path, stat.st_size, stat.st_mtime, mimetype,
+                          make_etag(stat.st_size, stat.st_mtime))
+
+
+def parse_byte_ranges(header, size, max_ranges=STREAM_MAX_RANGES):
+    """
+    Interpretar la cabecera Range para un recurso de tamaño conocido
+
+    Args:
+        header: Valor de la cabecera Range (ej: "bytes=0-499,1000-")
+        size: Tamaño total del recurso en bytes
+        max_ranges: Número máximo de rangos permitidos
+
+    Returns:
+        list | None: Lista ordenada de tuplas (inicio, fin) inclusivas,
+        lista vacía si ningún rango es satisfacible, o None si la
+        cabecera es inválida y debe ignorarse
+    """
+    if not header or '=' not in header:
+        return None
+
+    unit, _, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes':
+        return None
+
+    ranges = []
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        start, sep, end = part.partition('-')
+        if not sep:
+            return None
+        start, end = start.strip(), end.strip()
+        try:
+            if start == '':
+                # Rango sufijo: últimos N bytes
+                length = int(end)
+                if length <= 0:
+                    continue
+                ranges.append((max(size - length, 0), size - 1))
+            else:
+                first = int(start)
+                last = int(end) if end else None
+                if last is not None and first > last:
+                    return None
+                if first >= size:
+                    continue
+                if last is None:
+                    last = size - 1
+                ranges.append((first, min(last, size - 1)))
+        except ValueError:
+            return None
+
+    if len(ranges) > max_ranges:
+        return None
+
+    # Ordenar y fusionar rangos solapados o contiguos
+    ranges.sort()
+    merged = []
+    for first, last in ranges:
+        if merged and first <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+        else:
+            merged.append((first, last))
+    return merged
+
+
+def if_range_matches(header, etag, last_modified):
+    """
+    Evaluar la cabecera If-Range contra los validadores actuales
+
+    Args:
+        header: Valor de la cabecera If-Range
+        etag: ETag actual del recurso (sin comillas)
+        last_modified: Fecha de modificación actual (datetime UTC)
+
+    Returns:
+        bool: True si el rango solicitado sigue siendo válido
+    """
+    if not header:
+        return True
+
+    header = header.strip()
+    if header.startswith('"') or header.startswith('W/'):
+        value, weak = unquote_etag(header)
+        # If-Range exige comparación fuerte
+        return not weak and value == etag
+
+    fecha = parse_date(header)
+    if fecha is None or last_modified is None:
+        return False
+    # La fecha debe coincidir exactamente (RFC 9110 §13.1.5), con precisión de segundos
+    return int(last_modified.timestamp()) == int(fecha.timestamp())
+
+
+def _iter_file_range(file_path, start, length, chunk_size=STREAM_CHUNK_SIZE):
+    """Generador que lee `length` bytes del archivo desde `start`"""
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            data = f.read(min(chunk_size, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+
+
+def _map_range(start, end, prefix, offset):
+    """
+    Traducir un rango del recurso servido (prefijo + archivo desde `offset`)
+    a trozos: bytes del prefijo o tuplas (inicio en el archivo, longitud)
+    """
+    spans = []
+    if start < len(prefix):
+        spans.append(prefix[start:min(end + 1, len(prefix))])
+    if end >= len(prefix):
+        first = max(start, len(prefix))
+        spans.append((offset + first - len(prefix), end - first + 1))
+    return spans
+
+
+def _iter_spans(f, spans, chunk_size=STREAM_CHUNK_SIZE):
+    for span in spans:
+        if isinstance(span, bytes):
+            yield span
+            continue
+        start, remaining = span
+        f.seek(start)
+        while remaining > 0:
+            data = f.read(min(chunk_size, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+
+
+def _iter_file_spans(file_path, spans, chunk_size=STREAM_CHUNK_SIZE):
+    """Generador que lee los trozos de `_map_range` en orden"""
+    with open(file_path, 'rb') as f:
+        yield from _iter_spans(f, spans, chunk_size)
+
+
+def _iter_multipart(file_path, parts, boundary, chunk_size=STREAM_CHUNK_SIZE):
+    """Generador del cuerpo multipart/byteranges"""
+    with open(file_path, 'rb') as f:
+        for header, spans in parts:
+            yield header
+            yield from _iter_spans(f, spans, chunk_size)
+        yield f"\r\n--{boundary}--\r\n".encode('ascii')
+
+
+def _open_for_sendfile(file_path, start):
+    """
+    Abrir el archivo posicionado en `start` y envolverlo con el
+    wsgi.file_wrapper del servidor (gunicorn usa os.sendfile)
+    """
+    f = open(file_path, 'rb')
+    if start:
+        f.seek(start)
+    return wrap_file(request.environ, f, STREAM_CHUNK_SIZE)
+
+
+def build_stream_response(file_path, mimetype, size=None, mtime=None, etag=None,
+                          cache_timeout=0, offset=0, prefix=b''):
+    """
+    Construir la respuesta HTTP para servir un archivo de audio
+
+    Maneja 200 / 206 (rango simple y multi-range) / 304 / 416 según las
+    cabeceras Range, If-Range, If-None-Match e If-Modified-Since.
+
+    Args:
+        file_path: Ruta absoluta del archivo
+        mimetype: Tipo MIME a anunciar
+        size: Tamaño en bytes (se obtiene con stat si no se indica)
+        mtime: Fecha de modificación (timestamp)
+        etag: ETag precalculado (sin comillas)
+        cache_timeout: Segundos de max-age para Cache-Control
+        offset: Servir el archivo desde este byte (búsqueda por tiempo)
+        prefix: Bytes que preceden al archivo recortado (cabeceras del códec)
+
+    Returns:
+        Response: Respuesta lista para devolver desde la vista
+    """
+    if size is None or mtime is None:
+        stat = os.stat(file_path)
+        size, mtime = stat.st_size, stat.st_mtime
+    if etag is None:
+        etag = make_etag(size, mtime)
+    if offset or prefix:
+        # El recurso servido es otro: prefijo + archivo desde offset
+        etag = f"{etag}-{offset:x}"
+        size = len(prefix) + size - offset
+
+    last_modified = datetime.fromtimestamp(int(mtime), tz=timezone.utc)
+    headers = {
+        'Accept-Ranges': 'bytes',
+        'ETag': f'"{etag}"',
+        'Last-Modified': http_date(last_modified),
+        'Cache-Control': f'private, max-age={cache_timeout}',
+    }
+
+    # Petición condicional: el cliente ya tiene la versión actual
+    if request.method in ('GET', 'HEAD') and not is_resource_modified(
+            request.environ, etag=etag, last_modified=last_modified):
+        return Response(status=304, headers=headers)
+
+    ranges = None
+    range_header = request.headers.get('Range')
+    if range_header and if_range_matches(request.headers.get('If-Range'), etag, last_modified):
+        ranges = parse_byte_ranges(range_header, size)
+
+    # Sin rango (o rango ignorado): archivo completo
+    if ranges is None:
+        headers['Content-Length'] = str(size)
+        if prefix:
+            body = _iter_file_spans(file_path, _map_range(0, size - 1, prefix, offset))
+        else:
+            body = _open_for_sendfile(file_path, offset)
+        return Response(body, status=200, mimetype=mimetype, headers=headers,
+                        direct_passthrough=True)
+
+    if not ranges:
+        headers['Content-Range'] = f'bytes */{size}'
+        return Response(status=416, headers=headers)
+
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        length = end - start + 1
+        headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+        headers['Content-Length'] = str(length)
+        if start >= len(prefix) and end == size - 1:
+            # El rango llega hasta EOF: se puede delegar en sendfile
+            body = _open_for_sendfile(file_path, offset + start - len(prefix))
+        elif prefix or offset:
+            body = _iter_file_spans(file_path, _map_range(start, end, prefix, offset))
+        else:
+            body = _iter_file_range(file_path, start, length)
+        return Response(body, status=206, mimetype=mimetype, headers=headers,
+                        direct_passthrough=True)
+
+    # Multi-range: multipart/byteranges con longitud calculada de antemano
+    boundary = uuid.uuid4().hex
+    parts = []
+    total = 0
+    for start, end in ranges:
+        part_header = (
+            f"\r\n--{boundary}\r\n"
+            f"Content-Type: {mimetype}\r\n"
+            f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+        ).encode('ascii')
+        parts.append((part_header, _map_range(start, end, prefix, offset)))
+        total += len(part_header) + (end - start + 1)
+    total += len(f"\r\n--{boundary}--\r\n")
+
+    headers['Content-Length'] = str(total)
+    return Response(_iter_multipart(file_path, parts, boundary), status=206,
+                    content_type=f'multipart/byteranges; boundary={boundary}',
+                    headers=headers, direct_passthrough=True)
+
+
+def build_range_response(size, etag, iter_range, mimetype, headers=None):
+    """
+    Servir un recurso generado al vuelo (sin archivo propio) con soporte de Range
+
+    Solo admite un rango por petición (suficiente para reanudar descargas);
+    con varios rangos se responde el recurso completo.
+
+    Args:
+        size: Tamaño total del recurso, conocido de antemano
+        etag: ETag fuerte del contenido (sin comillas)
+        iter_range: Función (inicio, fin inclusivo) -> generador de bytes
+        mimetype: Tipo MIME a anunciar
+        headers: Cabeceras adicionales (p. ej. Content-Disposition)
+
+    Returns:
+        Response: 200 / 206 / 304 / 416
+    """
+    headers = dict(headers or {})
+    headers.update({'Accept-Ranges': 'bytes', 'ETag': f'"{etag}"'})
+    headers.setdefault('Cache-Control', 'private, no-cache')
+
+    if request.method in ('GET', 'HEAD') and not is_resource_modified(request.environ, etag=etag):
+        return Response(status=304, headers=headers)
+
+    ranges = None
+    range_header = request.headers.get('Range')
+    if range_header and if_range_matches(request.headers.get('If-Range'), etag, None):
+        ranges = parse_byte_ranges(range_header, size)
+
+    if ranges is None or len(ranges) > 1:
+        headers['Content-Length'] = str(size)
+        body = iter_range(0, size - 1) if size else iter(())
+        return Response(body, status=200, mimetype=mimetype, headers=headers,
+                        direct_passthrough=True)
+
+    if not ranges:
+        headers['Content-Range'] = f'bytes */{size}'
+        return Response(status=416, headers=headers)
+
+    start, end = ranges[0]
+    headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+    headers['Content-Length'] = str(end - start + 1)
+    return Response(iter_range(start, end), status=206, mimetype=mimetype, headers=headers,
+                    direct_passthrough=True)
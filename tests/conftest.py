@@ -1,5 +1,7 @@
+import io
 import os
 import sys
+import wave
 import pytest
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
@@ -7,14 +9,29 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")
 import config as app_config
 app_config.config['development'] = app_config.TestingConfig
 
-from app import app, db, Usuario, Cancion
+from app import app, db, playback_buffer, subidas, Usuario, Cancion
 from utils import create_audio_placeholder_files
 
+@pytest.fixture(scope='session', autouse=True)
+def directorios_de_trabajo(tmp_path_factory):
+    # Registros y subidas a medio terminar fuera del árbol del proyecto
+    base = tmp_path_factory.mktemp('trabajo')
+    app.config['PLAYBACK_LOG_DIR'] = playback_buffer.log_dir = str(base / 'logs')
+    app.config['RESUMABLE_UPLOAD_DIR'] = subidas.base_dir = str(base / 'subidas')
+    app.config['IMPORT_PROGRESS_DIR'] = str(base / 'logs')
+
+@pytest.fixture(autouse=True)
+def directorio_de_subidas(tmp_path):
+    # Cada prueba con su propio directorio de subidas (blobs, picos, índices)
+    app.config['UPLOAD_FOLDER'] = str(tmp_path / 'uploads')
+    for subdirectorio in ('music', 'covers', 'avatars'):
+        (tmp_path / 'uploads' / subdirectorio).mkdir(parents=True)
+
 @pytest.fixture
 def client():
     with app.app_context():
         db.create_all()
-        create_audio_placeholder_files()
+        create_audio_placeholder_files(app.config['UPLOAD_FOLDER'])
         yield app.test_client()
         db.session.remove()
         db.drop_all()
@@ -49,3 +66,45 @@ def canciones(client, usuario):
     db.session.add_all([song1, song2])
     db.session.commit()
     return song1, song2
+
+@pytest.fixture
+def docente(client):
+    user = Usuario(email='docente@example.com', nombre='Ana', apellidos='Docente', rol='docente')
+    user.set_password('password123')
+    db.session.add(user)
+    db.session.commit()
+    client.post('/login', data={'email': user.email, 'password': 'password123'})
+    return user
+
+# Contenido de audio mínimo y subidas para las pruebas (from conftest import ...)
+def wav_bytes(segundos=2, frecuencia=8000):
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(frecuencia)
+        wav.writeframes(b'\x00\x00' * frecuencia * segundos)
+    return buffer.getvalue()
+
+# MPEG1 capa III, 128 kbps, 44100 Hz: 417 bytes y 1152 muestras por trama
+CABECERA_MP3 = b'\xff\xfb\x90\x00'
+TAMANO_TRAMA = 417
+
+def mp3_bytes(tramas=500):
+    trama = CABECERA_MP3 + bytes(TAMANO_TRAMA - 4)
+    return trama * tramas
+
+def id3_bytes(contenido=b'\x00' * 20):
+    size = len(contenido)
+    syncsafe = bytes([(size >> 21) & 0x7F, (size >> 14) & 0x7F, (size >> 7) & 0x7F, size & 0x7F])
+    return b'ID3\x04\x00\x00' + syncsafe + contenido
+
+def subir(client, contenido, nombre='tema.wav', portada=None):
+    datos = {
+        'titulo': 'Tema de prueba', 'artista': 'Coro', 'genero': '', 'materia': '',
+        'grado_objetivo': '', 'año': '2024',
+        'archivo_audio': (io.BytesIO(contenido), nombre),
+    }
+    if portada is not None:
+        datos['cover_image'] = (io.BytesIO(portada), 'portada.png')
+    return client.post('/subir', data=datos, content_type='multipart/form-data')
@@ -0,0 +1,71 @@
+import os
+
+from app import app, db, Cancion, liberar_audio_si_huerfano
+from storage import blob_relpath, hash_file, is_blob_path, migrate_file, reserve_blob
+from conftest import subir, wav_bytes
+
+
+def ruta_musica(archivo):
+    return os.path.join(app.config['UPLOAD_FOLDER'], 'music', *archivo.split('/'))
+
+
+def test_subida_duplicada_reutiliza_el_blob(client, docente):
+    subir(client, wav_bytes())
+    subir(client, wav_bytes(), nombre='otra_copia.wav')
+
+    primera, segunda = Cancion.query.order_by(Cancion.id).all()
+    assert is_blob_path(primera.archivo_audio)
+    assert primera.archivo_audio == segunda.archivo_audio
+    ruta = ruta_musica(primera.archivo_audio)
+    assert hash_file(ruta) in primera.archivo_audio
+
+    # El archivo se conserva mientras alguna canción lo referencie
+    db.session.delete(primera)
+    db.session.commit()
+    assert os.path.exists(ruta)
+
+    db.session.delete(segunda)
+    db.session.commit()
+    assert not os.path.exists(ruta)
+
+
+def test_migrar_archivo_plano(client, tmp_path):
+    plano = tmp_path / 'audio_20240101_120000_ab12cd34.mp3'
+    plano.write_bytes(b'contenido de prueba')
+
+    relpath, creado = migrate_file(str(tmp_path), plano.name)
+    assert creado
+    assert relpath == blob_relpath(hash_file(str(plano)), '.mp3')
+    assert (tmp_path / relpath).read_bytes() == b'contenido de prueba'
+    assert migrate_file(str(tmp_path), 'no_existe.mp3') == (None, False)
+
+
+def test_archivos_planos_no_se_eliminan(client):
+    assert liberar_audio_si_huerfano('tablas_multiplicar.mp3') is False
+
+
+def test_blob_reutilizado_no_se_elimina(client, tmp_path):
+    music_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'music')
+    origen = tmp_path / 'tablas.wav'
+    origen.write_bytes(wav_bytes())
+    sha = hash_file(str(origen))
+    archivo, creado, reserva = reserve_blob(str(origen), music_dir, sha, '.wav', mode='copy')
+    assert creado
+
+    # Otra subida idéntica lo reutiliza antes de que la primera deshaga la suya;
+    # el blob no cambia (su fecha es la ETag y el Last-Modified de /stream)
+    mtime = os.stat(ruta_musica(archivo)).st_mtime_ns
+    _, creado, _ = reserve_blob(str(origen), music_dir, sha, '.wav', mode='copy')
+    assert not creado
+    assert os.stat(ruta_musica(archivo)).st_mtime_ns == mtime
+    assert liberar_audio_si_huerfano(archivo, reserva) is False
+    assert os.path.exists(ruta_musica(archivo))
+
+    # Sin reserva se respeta el periodo de gracia (su canción aún no se guarda)
+    app.config['AUDIO_BLOB_GRACE'] = 3600
+    try:
+        assert liberar_audio_si_huerfano(archivo) is False
+    finally:
+        app.config['AUDIO_BLOB_GRACE'] = 0
+    assert liberar_audio_si_huerfano(archivo) is True
+    assert not os.path.exists(ruta_musica(archivo))
@@ -32,3 +32,29 @@ def test_login_credenciales_invalidas(client, usuario):
     assert b'Email o contrase' in resp.data
     with client.session_transaction() as sess:
         assert '_user_id' not in sess
+
+
+def test_usuario_cacheado_y_desactivacion(client, usuario, canciones):
+    from flask import g
+    from sqlalchemy import event
+    client.post('/login', data={'email': usuario.email, 'password': 'password123'})
+    # El contexto de aplicación del fixture se comparte entre peticiones:
+    # quitar el usuario de g obliga a Flask-Login a usar el user_loader
+    g.pop('_login_user', None)
+    client.get(f'/stream/{canciones[0].id}')
+    g.pop('_login_user', None)
+
+    consultas = []
+    registrar = lambda conn, cursor, statement, *args: consultas.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', registrar)
+    try:
+        assert client.get(f'/stream/{canciones[0].id}').status_code == 200
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', registrar)
+    assert consultas == []
+
+    usuario.activo = False
+    db.session.commit()
+    g.pop('_login_user', None)
+    resp = client.get(f'/stream/{canciones[0].id}')
+    assert resp.status_code == 302 and '/login' in resp.headers['Location']
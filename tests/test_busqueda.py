@@ -0,0 +1,49 @@
+from app import db, Cancion, search_backend
+from sqlalchemy.dialects import mysql
+from search import InvertedIndexSearch, MySQLFulltextSearch, tokenize
+
+
+def login(client, email, password):
+    return client.post('/login', data={'email': email, 'password': password}, follow_redirects=True)
+
+
+def test_tokenize_ignora_tildes_y_mayusculas():
+    assert tokenize('Canción del NIÑO') == ['cancion', 'del', 'nino']
+
+
+def test_biblioteca_busca_sin_tildes_por_relevancia(client, usuario, canciones):
+    assert search_backend.name == 'fts5'
+    login(client, usuario.email, 'password123')
+    db.session.add_all([
+        Cancion(titulo='Canción de la Tierra', artista='Coro Andino',
+                archivo_audio='alfabeto.mp3', subido_por=usuario.id),
+        Cancion(titulo='Himno', artista='Banda Canciones Unidas',
+                archivo_audio='alfabeto.mp3', subido_por=usuario.id),
+    ])
+    db.session.commit()
+
+    html = client.get('/biblioteca?buscar=cancion').get_data(as_text=True)
+    assert 'Canción de la Tierra' in html and 'Banda Canciones Unidas' in html
+    assert html.index('Canción de la Tierra') < html.index('Banda Canciones Unidas')
+    assert 'Las Tablas' not in html
+
+    tierra = Cancion.query.filter_by(titulo='Canción de la Tierra').one()
+    tierra.activo = False
+    db.session.commit()
+    html = client.get('/biblioteca?buscar=tierra').get_data(as_text=True)
+    assert 'Canción de la Tierra' not in html
+
+
+def test_indice_invertido_en_memoria():
+    filas = [(1, 'Los Números', 'Coro', None), (2, 'Numeros Romanos', 'Profe Ana', 'Matemática')]
+    indice = InvertedIndexSearch(Cancion, loader=lambda: filas)
+    assert indice.search('números') == [2, 1]
+    assert indice.search('rom') == [2]
+    assert indice.search('coro num') == [1]
+    assert indice.search('inexistente') == []
+
+
+def test_mysql_exige_los_terminos_cortos_con_like(client):
+    consulta = MySQLFulltextSearch(Cancion).apply(Cancion.query, 'la tierra')
+    sql = str(consulta.statement.compile(dialect=mysql.dialect()))
+    assert 'MATCH' in sql and 'LIKE' in sql
@@ -0,0 +1,94 @@
+from datetime import datetime
+
+from app import app, db, guardar_reproducciones, reservar_versiones_catalogo, Cancion
+
+
+def login(client, email, password):
+    return client.post('/login', data={'email': email, 'password': password}, follow_redirects=True)
+
+
+def test_lote_por_ids_con_etag(client, usuario, canciones):
+    song1, song2 = canciones
+    login(client, usuario.email, 'password123')
+
+    resp = client.get(f'/api/canciones?ids={song2.id},{song1.id},999')
+    assert resp.status_code == 200
+    datos = resp.get_json()
+    assert [c['id'] for c in datos['canciones']] == [song2.id, song1.id]
+    assert datos['canciones'][1]['titulo'] == 'Las Tablas'
+    assert datos['version'] == max(song1.version_catalogo, song2.version_catalogo)
+
+    etag = {'If-None-Match': resp.headers['ETag']}
+    assert client.get(f'/api/canciones?ids={song2.id},{song1.id},999', headers=etag).status_code == 304
+
+    # Las reproducciones no cambian el catálogo
+    guardar_reproducciones([{'usuario_id': usuario.id, 'cancion_id': song1.id,
+                             'fecha_reproduccion': datetime(2024, 1, 1),
+                             'duracion_reproducida': 10, 'completada': False}])
+    assert client.get(f'/api/canciones?ids={song2.id},{song1.id},999', headers=etag).status_code == 304
+
+    song1.titulo = 'Las Tablas del 2'
+    db.session.commit()
+    resp = client.get(f'/api/canciones?ids={song2.id},{song1.id},999', headers=etag)
+    assert resp.status_code == 200
+    assert resp.get_json()['canciones'][1]['titulo'] == 'Las Tablas del 2'
+
+    assert client.get('/api/canciones').status_code == 400
+    assert client.get('/api/canciones?ids=1,x').status_code == 400
+
+
+def test_delta_desde_una_version(client, usuario, canciones):
+    song1, song2 = canciones
+    login(client, usuario.email, 'password123')
+
+    inicial = client.get('/api/canciones?since=0').get_json()
+    assert inicial['completo'] is True
+    assert {c['id'] for c in inicial['canciones']} == {song1.id, song2.id}
+    version = inicial['version']
+
+    resp = client.get(f'/api/canciones?since={version}')
+    assert resp.get_json()['canciones'] == []
+    assert client.get(f'/api/canciones?since={version}',
+                      headers={'If-None-Match': resp.headers['ETag']}).status_code == 304
+
+    song1.activo = False
+    song2.album = 'Abecedario'
+    db.session.commit()
+    delta = client.get(f'/api/canciones?since={version}').get_json()
+    assert delta['eliminadas'] == [song1.id]
+    assert [(c['id'], c['album']) for c in delta['canciones']] == [(song2.id, 'Abecedario')]
+    assert delta['version'] > version
+
+    # Por páginas: la versión devuelta es hasta dónde se sincronizó
+    app.config['CATALOG_DELTA_LIMIT'] = 1
+    try:
+        primera = client.get(f'/api/canciones?since={version}').get_json()
+        assert primera['completo'] is False
+        segunda = client.get(f"/api/canciones?since={primera['version']}").get_json()
+        assert segunda['completo'] is True and segunda['version'] == delta['version']
+        assert len(primera['canciones'] + primera['eliminadas'] + segunda['canciones'] + segunda['eliminadas']) == 2
+    finally:
+        app.config['CATALOG_DELTA_LIMIT'] = 1000
+
+
+def test_versiones_del_contador(client, usuario, canciones):
+    song1, song2 = canciones
+    login(client, usuario.email, 'password123')
+    assert sorted((song1.version_catalogo, song2.version_catalogo)) == [1, 2]
+
+    # Bloques consecutivos sin solaparse, también para las inserciones masivas
+    primera = reservar_versiones_catalogo(db.session, 3)
+    assert primera == 3 and reservar_versiones_catalogo(db.session) == 6
+    db.session.execute(db.insert(Cancion), [{
+        'titulo': 'Importada', 'artista': 'Coro', 'archivo_audio': 'importada.mp3',
+        'subido_por': usuario.id, 'version_catalogo': reservar_versiones_catalogo(db.session)}])
+    db.session.commit()
+    delta = client.get('/api/canciones?since=6').get_json()
+    assert [c['titulo'] for c in delta['canciones']] == ['Importada'] and delta['version'] == 7
+
+    # Una baja también cambia la ETag aunque la versión máxima de las filas no cambie
+    resp = client.get(f'/api/canciones?ids={song1.id}')
+    db.session.delete(song2)
+    db.session.commit()
+    assert client.get(f'/api/canciones?ids={song1.id}',
+                      headers={'If-None-Match': resp.headers['ETag']}).status_code == 200
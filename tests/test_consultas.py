@@ -0,0 +1,89 @@
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from app import db, count_cache, Cancion, Playlist, PlaylistCancion, Usuario
+
+
+def login(client, email, password):
+    return client.post('/login', data={'email': email, 'password': password}, follow_redirects=True)
+
+
+@contextmanager
+def contar_consultas():
+    consultas = []
+
+    def registrar(conn, cursor, statement, *args):
+        consultas.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', registrar)
+    try:
+        yield consultas
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', registrar)
+
+
+def crear_playlists(docente, cantidad, canciones):
+    for i in range(cantidad):
+        playlist = Playlist(nombre=f'Lista {docente.id}-{i}', publica=True, creado_por=docente.id)
+        db.session.add(playlist)
+        db.session.flush()
+        for orden, cancion in enumerate(canciones, 1):
+            db.session.add(PlaylistCancion(playlist_id=playlist.id, cancion_id=cancion.id, orden=orden))
+    db.session.commit()
+
+
+def nuevo_docente(email):
+    docente = Usuario(email=email, nombre='Ana', apellidos='Docente', rol='docente')
+    docente.set_password('password123')
+    db.session.add(docente)
+    db.session.commit()
+    return docente
+
+
+def test_vistas_con_numero_constante_de_consultas(client, usuario, canciones):
+    for cancion in canciones:
+        cancion.duracion = 90
+    login(client, usuario.email, 'password123')
+
+    crear_playlists(nuevo_docente('a@example.com'), 2, canciones)
+    count_cache.clear()
+    with contar_consultas() as pocas:
+        for ruta in ('/', '/playlists', '/biblioteca'):
+            assert client.get(ruta).status_code == 200
+
+    crear_playlists(nuevo_docente('b@example.com'), 4, canciones)
+    for i in range(6):
+        db.session.add(Cancion(titulo=f'Extra {i}', artista='Coro', archivo_audio='alfabeto.mp3',
+                               subido_por=usuario.id))
+    db.session.commit()
+    count_cache.clear()
+    with contar_consultas() as muchas:
+        for ruta in ('/', '/playlists', '/biblioteca'):
+            assert client.get(ruta).status_code == 200
+
+    assert len(muchas) == len(pocas)
+    assert '2 canciones' in client.get('/playlists').get_data(as_text=True)
+
+
+def test_portada_en_cache_se_invalida(client, usuario, canciones):
+    assert b'Las Tablas' in client.get('/').data
+
+    with contar_consultas() as consultas:
+        client.get('/')
+    assert consultas == []
+
+    # Un flush sin commit (o deshecho) no invalida: la portada no ve datos sin confirmar
+    db.session.add(Cancion(titulo='Borrador', artista='Coro', archivo_audio='alfabeto.mp3',
+                           subido_por=usuario.id))
+    db.session.flush()
+    with contar_consultas() as consultas:
+        client.get('/')
+    assert consultas == []
+    db.session.rollback()
+    assert 'portada_sucia' not in db.session.info
+
+    db.session.add(Cancion(titulo='Nueva Canción', artista='Coro', archivo_audio='alfabeto.mp3',
+                           subido_por=usuario.id))
+    db.session.commit()
+    assert 'Nueva Canción' in client.get('/').get_data(as_text=True)
@@ -0,0 +1,102 @@
+import io
+import json
+import os
+import zipfile
+import zlib
+
+from app import app, db, Cancion, Playlist, PlaylistCancion, Usuario
+from storage import blob_abspath, hash_file, store_blob
+from zipstream import ZipLayout, crc_path, data_member, read_crc32, safe_member_name
+from conftest import subir, wav_bytes
+
+
+def login(client, email, password):
+    return client.post('/login', data={'email': email, 'password': password}, follow_redirects=True)
+
+
+def guardar(contenido, ext, tmp_path):
+    origen = tmp_path / f'original{ext}'
+    origen.write_bytes(contenido)
+    music_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'music')
+    archivo, _ = store_blob(str(origen), music_dir, hash_file(str(origen)), ext)
+    return archivo, blob_abspath(music_dir, archivo)
+
+
+def playlist_con_audios(usuario, canciones, tmp_path, publica=True):
+    song1, song2 = canciones
+    song1.archivo_audio, _ = guardar(b'tablas' * 5000, '.mp3', tmp_path)
+    song2.archivo_audio, _ = guardar(b'alfabeto' * 3000, '.ogg', tmp_path)
+    playlist = Playlist(nombre='Repaso: 2° grado', creado_por=usuario.id, publica=publica)
+    db.session.add(playlist)
+    db.session.flush()
+    db.session.add_all([
+        PlaylistCancion(playlist_id=playlist.id, cancion_id=song2.id, orden=1024),
+        PlaylistCancion(playlist_id=playlist.id, cancion_id=song1.id, orden=2048),
+    ])
+    db.session.commit()
+    return playlist
+
+
+def test_zip_sin_compresion_y_por_rangos():
+    layout = ZipLayout([data_member('á.txt', b'hola' * 100, 0), data_member('b.txt', b'', 0)])
+    cuerpo = b''.join(layout.iter_range(0, layout.size - 1))
+    assert len(cuerpo) == layout.size
+    with zipfile.ZipFile(io.BytesIO(cuerpo)) as z:
+        assert z.testzip() is None
+        assert z.read('á.txt') == b'hola' * 100
+    assert b''.join(layout.iter_range(37, 150)) == cuerpo[37:151]
+    assert safe_member_name('a/b: c?') == 'a_b_ c_'
+
+
+def test_descarga_de_playlist(client, usuario, canciones, tmp_path):
+    playlist = playlist_con_audios(usuario, canciones, tmp_path)
+    login(client, usuario.email, 'password123')
+    rutas = [os.path.join(app.config['UPLOAD_FOLDER'], 'music', c.archivo_audio) for c in canciones]
+    assert not any(os.path.exists(crc_path(ruta)) for ruta in rutas)
+
+    resp = client.get(f'/playlist/{playlist.id}/download')
+    assert resp.status_code == 200
+    assert resp.mimetype == 'application/zip'
+    assert int(resp.headers['Content-Length']) == len(resp.data)
+    assert 'attachment' in resp.headers['Content-Disposition']
+    with zipfile.ZipFile(io.BytesIO(resp.data)) as z:
+        assert z.testzip() is None
+        assert all(info.compress_type == zipfile.ZIP_STORED for info in z.infolist())
+        assert z.namelist() == ['1 - Grupo Infantil - El Alfabeto.ogg',
+                                '2 - Coro Escolar - Las Tablas.mp3',
+                                'playlist.m3u', 'playlist.json']
+        assert z.read(z.namelist()[0]) == b'alfabeto' * 3000
+        assert z.read('playlist.m3u').decode('utf-8').splitlines()[3] == z.namelist()[0]
+        manifiesto = json.loads(z.read('playlist.json'))
+        assert manifiesto['playlist']['nombre'] == 'Repaso: 2° grado'
+        assert [c['titulo'] for c in manifiesto['canciones']] == ['El Alfabeto', 'Las Tablas']
+
+    # Reanudar: el mismo contenido byte a byte desde cualquier posición
+    parcial = client.get(f'/playlist/{playlist.id}/download',
+                         headers={'Range': 'bytes=1000-', 'If-Range': resp.headers['ETag']})
+    assert parcial.status_code == 206
+    assert parcial.data == resp.data[1000:]
+    # Los audios anteriores a la cola de CRC lo guardan la primera vez
+    assert read_crc32(rutas[1]) == zlib.crc32(b'alfabeto' * 3000)
+    assert client.get(f'/playlist/{playlist.id}/download',
+                      headers={'If-None-Match': resp.headers['ETag']}).status_code == 304
+
+
+def test_descarga_de_playlist_privada(client, usuario, canciones, tmp_path):
+    playlist = playlist_con_audios(usuario, canciones, tmp_path, publica=False)
+    otro = Usuario(email='otro@example.com', nombre='Otro', apellidos='Usuario', rol='estudiante')
+    otro.set_password('password123')
+    db.session.add(otro)
+    db.session.commit()
+    login(client, otro.email, 'password123')
+
+    assert client.get(f'/playlist/{playlist.id}/download').status_code == 403
+    assert client.get('/playlist/999/download').status_code == 404
+
+
+def test_crc_se_guarda_al_subir(client, docente):
+    subir(client, wav_bytes())
+    cancion = Cancion.query.one()
+    ruta = os.path.join(app.config['UPLOAD_FOLDER'], 'music', cancion.archivo_audio)
+    assert read_crc32(ruta) == zlib.crc32(wav_bytes())
+    assert cancion.estado == 'listo'
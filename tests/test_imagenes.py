@@ -0,0 +1,35 @@
+import os
+
+from PIL import Image
+
+from utils import IMAGE_SIZES, generate_image_derivatives, image_derivative_name
+
+
+def test_derivados_de_jpeg_grande(tmp_path):
+    original = tmp_path / 'portada.jpg'
+    Image.new('RGB', (4000, 3000), (10, 120, 200)).save(original, 'JPEG')
+    destino = tmp_path / 'd'
+
+    resultado = generate_image_derivatives(str(original), str(destino))
+
+    for tamano, lado in IMAGE_SIZES.items():
+        for formato in ('webp', 'jpg'):
+            ruta = destino / image_derivative_name(resultado['key'], tamano, formato)
+            with Image.open(ruta) as img:
+                assert img.size == (lado, lado * 3 // 4)
+    assert len(resultado['placeholder']) < 1000
+
+    # Mismo contenido, misma clave: no se regeneran los archivos
+    antes = os.stat(destino / image_derivative_name(resultado['key'], 'card', 'webp')).st_mtime_ns
+    assert generate_image_derivatives(str(original), str(destino))['key'] == resultado['key']
+    assert os.stat(destino / image_derivative_name(resultado['key'], 'card', 'webp')).st_mtime_ns == antes
+
+
+def test_imagen_pequena_no_se_agranda(tmp_path):
+    original = tmp_path / 'logo.png'
+    Image.new('RGBA', (100, 50), (0, 0, 0, 0)).save(original, 'PNG')
+
+    resultado = generate_image_derivatives(str(original), str(tmp_path / 'd'))
+
+    with Image.open(tmp_path / 'd' / image_derivative_name(resultado['key'], 'full', 'jpg')) as img:
+        assert img.size == (100, 50)
@@ -0,0 +1,86 @@
+import os
+import zipfile
+
+import pytest
+
+from app import db, Cancion
+import importer
+from importer import import_catalog, read_audio_tags
+from conftest import wav_bytes
+
+
+@pytest.fixture
+def carpeta(tmp_path):
+    origen = tmp_path / 'origen'
+    (origen / 'sub').mkdir(parents=True)
+    (origen / 'tablas_del_dos.wav').write_bytes(wav_bytes(2))
+    (origen / 'sub' / 'vocales.wav').write_bytes(wav_bytes(1))
+    (origen / 'sub' / 'vocales_copia.wav').write_bytes(wav_bytes(1))
+    (origen / 'roto.mp3').write_bytes(b'no es audio' * 50)
+    (origen / 'notas.txt').write_text('ignorado')
+    return origen
+
+
+def archivos_en(directorio):
+    # Solo blobs: los bloqueos por hash (.locks/) no cuentan
+    return [f for raiz, _, files in os.walk(directorio) if '.locks' not in raiz for f in files]
+
+
+def insertar(filas):
+    db.session.execute(db.insert(Cancion), filas)
+    db.session.commit()
+
+
+def test_importar_carpeta_y_reanudar(client, usuario, carpeta, tmp_path):
+    destino = tmp_path / 'music'
+    progreso = tmp_path / 'importacion.progress'
+
+    resumen = import_catalog(str(carpeta), str(destino), insertar, progress_path=str(progreso),
+                             workers=2, batch_size=1, defaults={'subido_por': usuario.id})
+    assert resumen['importadas'] == 3
+    assert [archivo for archivo, _ in resumen['errores']] == ['roto.mp3']
+
+    canciones = {c.titulo: c for c in Cancion.query.all()}
+    assert set(canciones) == {'tablas del dos', 'vocales', 'vocales copia'}
+    assert canciones['tablas del dos'].duracion == 2
+    assert canciones['tablas del dos'].artista == 'Desconocido'
+    assert all(os.path.exists(destino / c.archivo_audio) for c in canciones.values())
+    # El contenido repetido se guarda una sola vez
+    assert canciones['vocales'].archivo_audio == canciones['vocales copia'].archivo_audio
+    assert len(archivos_en(destino)) == 2
+
+    # Una segunda ejecución no duplica lo ya importado
+    resumen = import_catalog(str(carpeta), str(destino), insertar, progress_path=str(progreso),
+                             workers=2, defaults={'subido_por': usuario.id})
+    assert resumen['importadas'] == 0
+    assert resumen['ya_importadas'] == 3
+    assert Cancion.query.count() == 3
+
+
+def test_importar_zip_en_modo_prueba(client, usuario, carpeta, tmp_path):
+    archivo_zip = tmp_path / 'canciones.zip'
+    with zipfile.ZipFile(archivo_zip, 'w') as zf:
+        zf.write(carpeta / 'tablas_del_dos.wav', 'album/tablas_del_dos.wav')
+        zf.write(carpeta / 'sub' / 'vocales.wav', '../vocales.wav')
+    destino = tmp_path / 'music'
+
+    resumen = import_catalog(str(archivo_zip), str(destino), insertar, dry_run=True,
+                             workers=1, defaults={'subido_por': usuario.id})
+    assert sorted(f['titulo'] for f in resumen['filas']) == ['tablas del dos', 'vocales']
+    assert Cancion.query.count() == 0
+    assert archivos_en(destino) == []
+
+    resumen = import_catalog(str(archivo_zip), str(destino), insertar,
+                             workers=1, defaults={'subido_por': usuario.id})
+    assert resumen['importadas'] == 2
+    assert len(archivos_en(destino)) == 2
+    assert not os.path.exists(tmp_path / 'vocales.wav')
+
+
+def test_archivo_ilegible_no_detiene_la_importacion(carpeta, monkeypatch):
+    def ilegible(path):
+        raise PermissionError(13, 'Permiso denegado', path)
+
+    monkeypatch.setattr(importer, 'hash_file', ilegible)
+    resultado = read_audio_tags(str(carpeta / 'sub' / 'vocales.wav'))
+    assert resultado == {'error': f"[Errno 13] Permiso denegado: '{carpeta / 'sub' / 'vocales.wav'}'"}
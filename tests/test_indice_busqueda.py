@@ -0,0 +1,123 @@
+import os
+import struct
+
+from app import app, db, seek_cache, Cancion, TrabajoMedia
+from seekindex import (SeekIndex, build_seek_index, build_seek_index_task, load_seek_index,
+                       seek_index_path, seek_position)
+from storage import blob_abspath, hash_file, store_blob
+from conftest import TAMANO_TRAMA, id3_bytes, mp3_bytes, subir
+
+DURACION_TRAMA = 1152 / 44100
+
+
+def login(client, email, password):
+    return client.post('/login', data={'email': email, 'password': password}, follow_redirects=True)
+
+
+def pagina_ogg(granule, cuerpo, continua=False):
+    tabla = bytes([255] * (len(cuerpo) // 255) + [len(cuerpo) % 255])
+    return (struct.pack('<4sBBqIIIB', b'OggS', 0, 1 if continua else 0, granule, 7, 0, 0, len(tabla))
+            + tabla + cuerpo)
+
+
+def ogg_bytes(paginas_audio=10, muestras_por_pagina=22050):
+    ident = b'\x01vorbis' + struct.pack('<IBI', 0, 2, 44100) + bytes(14)
+    cabeceras = pagina_ogg(0, ident) + pagina_ogg(0, b'\x03vorbis' + bytes(40))
+    audio = b''.join(pagina_ogg(muestras_por_pagina * (n + 1), bytes([n]) * 200)
+                     for n in range(paginas_audio))
+    return cabeceras, audio
+
+
+def flac_bytes(puntos):
+    campos = (44100 << 44) | (1 << 41) | (15 << 36) | (44100 * 30)
+    streaminfo = bytes(10) + campos.to_bytes(8, 'big') + bytes(16)
+    seektable = b''.join(struct.pack('>QQH', muestra, offset, 4096) for muestra, offset in puntos)
+    seektable += struct.pack('>QQH', 0xFFFFFFFFFFFFFFFF, 0, 0)  # Punto de reserva
+    return (b'fLaC' + b'\x00' + (34).to_bytes(3, 'big') + streaminfo
+            + b'\x83' + len(seektable).to_bytes(3, 'big') + seektable + bytes(5000))
+
+
+def guardar(contenido, ext, tmp_path):
+    origen = tmp_path / f'original{ext}'
+    origen.write_bytes(contenido)
+    music_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'music')
+    archivo, _ = store_blob(str(origen), music_dir, hash_file(str(origen)), ext)
+    return archivo, blob_abspath(music_dir, archivo)
+
+
+def test_indice_mp3_y_trama_exacta(tmp_path):
+    ruta = tmp_path / 'tema.mp3'
+    ruta.write_bytes(id3_bytes() + mp3_bytes())
+    indice = build_seek_index(str(ruta))
+    assert len(indice) == 13  # Un punto por segundo en ~13 s
+    assert SeekIndex.from_bytes(indice.to_bytes()).offsets == indice.offsets
+
+    inicio, offset = seek_position(str(ruta), indice, 5.0)
+    trama = int(5.0 / DURACION_TRAMA)
+    assert offset == len(id3_bytes()) + trama * TAMANO_TRAMA
+    assert abs(inicio - trama * DURACION_TRAMA) < 0.001
+
+
+def test_indice_flac_usa_la_seektable(tmp_path):
+    ruta = tmp_path / 'tema.flac'
+    ruta.write_bytes(flac_bytes([(0, 0), (441000, 2000), (882000, 4000)]))
+    indice = build_seek_index(str(ruta))
+    inicio_audio = indice.offsets[0]
+    assert list(indice.times) == [0, 10000, 20000]
+    assert seek_position(str(ruta), indice, 15) == (10.0, inicio_audio + 2000)
+    # El prefijo solo conserva STREAMINFO, marcado como último bloque
+    assert indice.prefix[:5] == b'fLaC\x80' and len(indice.prefix) == 4 + 4 + 34
+
+
+def test_stream_desde_un_tiempo(client, usuario, tmp_path):
+    login(client, usuario.email, 'password123')
+    cabeceras, audio = ogg_bytes()
+    archivo, ruta = guardar(cabeceras + audio, '.ogg', tmp_path)
+    cancion = Cancion(titulo='Ogg', artista='Coro', archivo_audio=archivo, subido_por=usuario.id)
+    db.session.add(cancion)
+    db.session.commit()
+
+    # Sin índice ?t= se ignora
+    assert client.get(f'/stream/{cancion.id}?t=3').data == cabeceras + audio
+
+    assert build_seek_index_task({'path': ruta}) == {'entradas': 10}
+    assert load_seek_index(ruta).prefix == cabeceras
+    seek_cache.pop(ruta)  # Lo que hace indice_procesado al terminar el trabajo
+
+    # Cada página dura 0,5 s: t=3,2 empieza en la séptima página de audio
+    pagina = len(audio) // 10
+    resp = client.get(f'/stream/{cancion.id}?t=3.2')
+    assert resp.headers['X-Seek-Time'] == '3.000'
+    assert resp.data == cabeceras + audio[6 * pagina:]
+    assert int(resp.headers['Content-Length']) == len(resp.data)
+
+    # Los rangos se calculan sobre el recurso recortado
+    resp = client.get(f'/stream/{cancion.id}?t=3.2', headers={'Range': 'bytes=0-9'})
+    assert resp.status_code == 206
+    assert resp.data == cabeceras[:10]
+    resp = client.get(f'/stream/{cancion.id}?t=3.2', headers={'Range': f'bytes={len(cabeceras) - 5}-'})
+    assert resp.data == cabeceras[-5:] + audio[6 * pagina:]
+    assert resp.headers['ETag'] != client.get(f'/stream/{cancion.id}').headers['ETag']
+
+    db.session.delete(cancion)
+    db.session.commit()
+    assert not os.path.exists(seek_index_path(ruta))
+
+
+def test_indice_se_crea_al_subir(client, docente):
+    subir(client, mp3_bytes(), nombre='tema.mp3')
+
+    cancion = Cancion.query.one()
+    assert {t.tipo for t in TrabajoMedia.query} == {'indice_busqueda', 'segmentos', 'crc'}
+    assert cancion.estado == 'listo'
+    assert cancion.segmentos == 3
+    ruta = os.path.join(app.config['UPLOAD_FOLDER'], 'music', cancion.archivo_audio)
+    assert os.path.exists(seek_index_path(ruta))
+    assert client.get(f'/api/cancion/{cancion.id}').get_json()['busqueda'] is True
+
+    resp = client.get(f'/stream/{cancion.id}?t=5')
+    assert resp.data == mp3_bytes()[int(5.0 / DURACION_TRAMA) * TAMANO_TRAMA:]
+
+    db.session.delete(cancion)
+    db.session.commit()
+    assert not os.path.exists(ruta)
@@ -0,0 +1,56 @@
+from datetime import datetime, timedelta
+
+from app import app, db, Cancion, Playlist, Usuario
+from pagination import decode_cursor, encode_cursor
+
+
+def login(client, email, password):
+    return client.post('/login', data={'email': email, 'password': password}, follow_redirects=True)
+
+
+def test_cursor_opaco_ida_y_vuelta():
+    fecha = datetime(2024, 5, 1, 10, 30)
+    assert decode_cursor(encode_cursor('next', fecha, 42)) == ('next', fecha, 42)
+    assert decode_cursor('basura') is None
+
+
+def test_biblioteca_paginada_por_cursor(client, usuario, monkeypatch):
+    monkeypatch.setitem(app.config, 'CANCIONES_PER_PAGE', 2)
+    base = datetime(2024, 1, 1)
+    # Dos canciones con la misma fecha para probar el desempate por id
+    for i, minutos in enumerate([0, 1, 2, 2, 3]):
+        db.session.add(Cancion(titulo=f'Tema {i}', artista='Coro', archivo_audio='alfabeto.mp3',
+                               subido_por=usuario.id, fecha_subida=base + timedelta(minutes=minutos)))
+    db.session.commit()
+    login(client, usuario.email, 'password123')
+
+    from pagination import keyset_paginate
+    query = Cancion.query.filter_by(activo=True)
+    vistos = []
+    cursor = None
+    while True:
+        pagina = keyset_paginate(query, Cancion.fecha_subida, Cancion.id, 2, cursor=cursor)
+        vistos.extend(c.titulo for c in pagina.items)
+        if not pagina.has_next:
+            break
+        cursor = pagina.next_cursor
+    assert vistos == ['Tema 4', 'Tema 3', 'Tema 2', 'Tema 1', 'Tema 0']
+
+    atras = keyset_paginate(query, Cancion.fecha_subida, Cancion.id, 2, cursor=pagina.prev_cursor)
+    assert [c.titulo for c in atras.items] == ['Tema 2', 'Tema 1']
+
+    html = client.get('/biblioteca').get_data(as_text=True)
+    assert 'Tema 4' in html and 'Tema 2' not in html and 'cursor=' in html
+
+
+def test_playlists_paginadas_por_cursor(client, usuario):
+    docente = Usuario(email='docente@example.com', nombre='Ana', apellidos='Docente', rol='docente')
+    docente.set_password('password123')
+    db.session.add(docente)
+    db.session.flush()
+    db.session.add(Playlist(nombre='Pública de prueba', publica=True, creado_por=docente.id))
+    db.session.commit()
+    login(client, usuario.email, 'password123')
+    resp = client.get('/playlists')
+    assert resp.status_code == 200
+    assert 'Pública de prueba' in resp.get_data(as_text=True)
@@ -0,0 +1,68 @@
+import io
+import os
+import wave
+
+import numpy as np
+
+from app import app, db, Cancion, TrabajoMedia
+from peaks import _wav_frames, build_peaks, peaks_path
+from conftest import subir
+
+
+def wav_bytes(muestras, frecuencia=8000, canales=1):
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(canales)
+        wav.setsampwidth(2)
+        wav.setframerate(frecuencia)
+        wav.writeframes(np.asarray(muestras, dtype='<i2').tobytes())
+    return buffer.getvalue()
+
+
+def test_picos_por_nivel(tmp_path):
+    # Estéreo: silencio la primera mitad; después ±0,5 en un canal y ±0,25 en el otro
+    mitad = np.zeros((4000, 2), dtype=np.int16)
+    onda = np.tile([[16384, 8192], [-16384, -8192]], (2000, 1))
+    ruta = tmp_path / 'tema.wav'
+    ruta.write_bytes(wav_bytes(np.concatenate((mitad, onda)), canales=2))
+
+    duracion, niveles = build_peaks(str(ruta), (16, 4))
+    assert duracion == 1.0
+    assert [len(nivel) // 2 for nivel in niveles] == [4, 16]
+    assert niveles[0].tolist() == [0, 0, 0, 0, -64, 64, -64, 64]
+    # Un segundo a bloques de 10 ms: nunca más picos que bloques
+    assert len(build_peaks(str(ruta), (4096,))[1][0]) // 2 == 100
+
+
+def test_wav_de_24_bits():
+    crudo = b'\xff\xff\x7f' + b'\x00\x00\x80' + b'\x00\x00\x00'
+    assert _wav_frames(crudo, 3, 1)[:, 0].tolist() == [(2 ** 23 - 1) / 2 ** 23, -1.0, 0.0]
+
+
+def test_picos_al_subir_y_endpoint(client, docente):
+    tiempo = np.arange(8000 * 60) / 8000
+    subir(client, wav_bytes(np.sin(2 * np.pi * 440 * tiempo) * 20000))
+
+    cancion = Cancion.query.one()
+    assert TrabajoMedia.query.filter_by(tipo='picos').one().estado == 'completado'
+    assert cancion.estado == 'listo'
+    url = client.get(f'/api/cancion/{cancion.id}').get_json()['picos']
+    assert url == f'/api/cancion/{cancion.id}/peaks'
+
+    # El nivel más pequeño que cubre el ancho pedido
+    resp = client.get(url, query_string={'ancho': 300})
+    assert resp.status_code == 200
+    assert resp.mimetype == 'application/octet-stream'
+    assert resp.headers['X-Peaks-Count'] == '1024'
+    picos = np.frombuffer(resp.data, dtype=np.int8)
+    assert len(picos) == 2048
+    assert picos[0::2].min() < -70 and picos[1::2].max() > 70
+    assert client.get(url).headers['X-Peaks-Count'] == '4096'
+
+    assert client.get(url, query_string={'ancho': 300},
+                      headers={'If-None-Match': resp.headers['ETag']}).status_code == 304
+
+    ruta = os.path.join(app.config['UPLOAD_FOLDER'], 'music', cancion.archivo_audio)
+    db.session.delete(cancion)
+    db.session.commit()
+    assert not os.path.exists(peaks_path(ruta))
@@ -0,0 +1,153 @@
+from app import db, Cancion, Playlist, PlaylistCancion, Usuario, recalcular_agregados_playlists
+from ordering import rank_between
+
+
+def login(client, email, password):
+    return client.post('/login', data={'email': email, 'password': password}, follow_redirects=True)
+
+
+def test_agregados_de_playlist_se_mantienen(client, usuario, canciones):
+    song1, song2 = canciones
+    song1.duracion, song2.duracion = 100, 50
+    playlist = Playlist(nombre='Repaso', creado_por=usuario.id)
+    db.session.add(playlist)
+    db.session.flush()
+    db.session.add_all([
+        PlaylistCancion(playlist_id=playlist.id, cancion_id=song1.id, orden=1),
+        PlaylistCancion(playlist_id=playlist.id, cancion_id=song2.id, orden=2),
+    ])
+    db.session.commit()
+    assert (playlist.total_canciones, playlist.duracion_total) == (2, 150)
+
+    song1.duracion = 130
+    db.session.commit()
+    assert playlist.duracion_total == 180
+
+    db.session.delete(PlaylistCancion.query.filter_by(cancion_id=song2.id).one())
+    db.session.commit()
+    assert (playlist.total_canciones, playlist.duracion_total) == (1, 130)
+
+    # Reparación en bloque tras un desajuste
+    db.session.execute(db.update(Playlist).values(total_canciones=99, duracion_total=0))
+    db.session.commit()
+    assert recalcular_agregados_playlists() == 1
+    db.session.expire_all()
+    assert (playlist.total_canciones, playlist.duracion_total) == (1, 130)
+
+
+def test_manifiesto_de_playlist(client, usuario, canciones):
+    song1, song2 = canciones
+    login(client, usuario.email, 'password123')
+    playlist = Playlist(nombre='Repaso', creado_por=usuario.id)
+    db.session.add(playlist)
+    db.session.flush()
+    db.session.add_all([
+        PlaylistCancion(playlist_id=playlist.id, cancion_id=song2.id, orden=1),
+        PlaylistCancion(playlist_id=playlist.id, cancion_id=song1.id, orden=2),
+    ])
+    db.session.commit()
+
+    resp = client.get(f'/api/playlist/{playlist.id}/manifiesto')
+    assert resp.status_code == 200
+    datos = resp.get_json()
+    assert datos['playlist']['total_canciones'] == 2
+    assert [c['id'] for c in datos['canciones']] == [song2.id, song1.id]
+    # Mismos datos que /api/cancion: el reproductor no pide nada más por pista
+    assert datos['canciones'][0] == client.get(f'/api/cancion/{song2.id}').get_json()
+    assert resp.headers['Link'] == f"<{datos['canciones'][0]['stream']}>; rel=preload; as=audio"
+    assert 'no-cache' in resp.headers['Cache-Control']
+
+    assert client.get(f'/api/playlist/{playlist.id}/manifiesto',
+                      headers={'If-None-Match': resp.headers['ETag']}).status_code == 304
+    song2.titulo = 'El Alfabeto (versión corta)'
+    db.session.commit()
+    assert client.get(f'/api/playlist/{playlist.id}/manifiesto',
+                      headers={'If-None-Match': resp.headers['ETag']}).status_code == 200
+
+
+def test_manifiesto_privado_y_ad_hoc(client, usuario, canciones):
+    song1, song2 = canciones
+    otro = Usuario(email='otro@example.com', nombre='Otro', apellidos='Usuario', rol='estudiante')
+    otro.set_password('password123')
+    db.session.add(otro)
+    db.session.flush()
+    privada = Playlist(nombre='Privada', creado_por=otro.id, publica=False)
+    db.session.add(privada)
+    song1.activo = False
+    db.session.commit()
+    login(client, usuario.email, 'password123')
+
+    assert client.get(f'/api/playlist/{privada.id}/manifiesto').status_code == 403
+    assert client.get('/api/playlist/999/manifiesto').status_code == 404
+
+    # Orden pedido, sin inactivas ni inexistentes
+    resp = client.get(f'/api/canciones/manifiesto?ids={song2.id},{song1.id},999')
+    assert [c['id'] for c in resp.get_json()['canciones']] == [song2.id]
+    assert client.get('/api/canciones/manifiesto?ids=1,a').status_code == 400
+    assert client.get('/api/canciones/manifiesto').status_code == 400
+
+
+def test_posiciones_dispersas():
+    assert rank_between(None, None) == 1024
+    assert rank_between(1024, None) == 2048
+    assert rank_between(None, 1024) == 0
+    assert rank_between(1024, 2048) == 1536
+    assert rank_between(1, 2) is None
+
+
+def test_operaciones_en_lote(client, usuario, canciones):
+    song1, song2 = canciones
+    login(client, usuario.email, 'password123')
+    playlist = Playlist(nombre='Repaso', creado_por=usuario.id)
+    db.session.add(playlist)
+    db.session.commit()
+    url = f'/api/playlist/{playlist.id}/canciones'
+
+    resp = client.post(url, json={'operaciones': [{'agregar': song1.id}, {'agregar': song2.id},
+                                                  {'agregar': song1.id}]})
+    assert resp.status_code == 200
+    a, b, c = resp.get_json()['agregados']
+    assert resp.get_json()['orden'] == [a, b, c]
+    assert [e.orden for e in PlaylistCancion.query.order_by(PlaylistCancion.id)] == [1024, 2048, 3072]
+    assert playlist.total_canciones == 3
+
+    # Mover solo cambia la fila movida
+    resp = client.post(url, json={'operaciones': [{'mover': c, 'despues_de': None},
+                                                  {'mover': a, 'despues_de': b}]})
+    assert resp.get_json()['orden'] == [c, b, a]
+    assert db.session.get(PlaylistCancion, b).orden == 2048
+
+    # Una operación inválida cancela el lote completo
+    resp = client.post(url, json={'operaciones': [{'quitar': b}, {'mover': 999}]})
+    assert resp.status_code == 400
+    assert client.post(url, json={'operaciones': [{'quitar': c}]}).get_json()['orden'] == [b, a]
+    db.session.expire_all()
+    assert playlist.total_canciones == 2
+
+
+def test_sin_hueco_se_renumera(client, usuario, canciones):
+    song1, song2 = canciones
+    login(client, usuario.email, 'password123')
+    playlist = Playlist(nombre='Densa', creado_por=usuario.id)
+    db.session.add(playlist)
+    db.session.flush()
+    primero = PlaylistCancion(playlist_id=playlist.id, cancion_id=song1.id, orden=1)
+    segundo = PlaylistCancion(playlist_id=playlist.id, cancion_id=song2.id, orden=2)
+    db.session.add_all([primero, segundo])
+    db.session.commit()
+
+    resp = client.post(f'/api/playlist/{playlist.id}/canciones',
+                       json={'operaciones': [{'agregar': song2.id, 'despues_de': primero.id}]})
+    nuevo = resp.get_json()['agregados'][0]
+    assert resp.get_json()['orden'] == [primero.id, nuevo, segundo.id]
+    db.session.expire_all()
+    assert (primero.orden, segundo.orden) == (1024, 2048)
+
+    otro = Usuario(email='otro@example.com', nombre='Otro', apellidos='Usuario', rol='estudiante')
+    otro.set_password('password123')
+    db.session.add(otro)
+    db.session.commit()
+    client.get('/logout')
+    login(client, otro.email, 'password123')
+    assert client.post(f'/api/playlist/{playlist.id}/canciones',
+                       json={'operaciones': [{'quitar': nuevo}]}).status_code == 403
@@ -0,0 +1,109 @@
+from datetime import timedelta
+
+import numpy as np
+
+from app import (app, db, radio_cache, actualizar_radio, Cancion, CancionSimilar, EstadoRadio, Reproduccion,
+                 Usuario)
+from recommend import cooccurrence_delta, sum_pairs
+
+
+def login(client, email, password):
+    return client.post('/login', data={'email': email, 'password': password}, follow_redirects=True)
+
+
+def escuchar(usuarios, *canciones):
+    db.session.add_all(Reproduccion(usuario_id=usuario.id, cancion_id=cancion.id)
+                       for usuario in usuarios for cancion in canciones)
+    db.session.commit()
+
+
+def similares(cancion):
+    return [fila.similar_id for fila in CancionSimilar.query.filter_by(cancion_id=cancion.id)
+                                                             .order_by(CancionSimilar.posicion)]
+
+
+def test_coocurrencias_incrementales_igual_que_desde_cero():
+    rng = np.random.default_rng(7)
+    pares = np.unique(np.column_stack((rng.integers(0, 40, 600), rng.integers(0, 30, 600))), axis=0)
+    usuarios, canciones = pares.T
+    antes = rng.random(len(pares)) < 0.5
+
+    completo = cooccurrence_delta(usuarios, canciones, np.ones(len(pares), dtype=bool))
+    primera = cooccurrence_delta(usuarios[antes], canciones[antes], np.ones(int(antes.sum()), dtype=bool))
+    segunda = cooccurrence_delta(usuarios, canciones, ~antes)
+    sumado = sum_pairs(*(np.concatenate(partes) for partes in zip(primera, segunda)))
+    for esperado, obtenido in zip(completo, sumado):
+        assert np.array_equal(esperado, obtenido)
+
+    # La diagonal cuenta los usuarios de cada canción
+    a, b, usuarios_por_cancion = completo
+    assert np.array_equal(usuarios_por_cancion[a == b], np.bincount(canciones)[a[a == b]])
+
+
+def test_radio_personalizada(client, usuario, canciones):
+    tablas, alfabeto = canciones
+    colores = Cancion(titulo='Los Colores', artista='Coro Escolar', archivo_audio='colores.mp3',
+                      subido_por=usuario.id, materia='Arte')
+    himno = Cancion(titulo='Himno', artista='Coro Escolar', archivo_audio='himno.mp3',
+                    subido_por=usuario.id, reproducciones_totales=10)
+    alumnos = [Usuario(email=f'alumno{n}@example.com', nombre='Alumno', apellidos=str(n), rol='estudiante')
+               for n in range(4)]
+    for alumno in alumnos:
+        alumno.set_password('password123')
+    db.session.add_all([colores, himno, *alumnos])
+    db.session.commit()
+
+    escuchar(alumnos[:2], tablas, alfabeto)
+    escuchar(alumnos[2:3], tablas, colores)
+    assert actualizar_radio() == {'reproducciones': 6, 'pares': 5, 'canciones': 3}
+    assert similares(tablas) == [alfabeto.id, colores.id]
+
+    # Solo se leen los usuarios con reproducciones nuevas
+    escuchar([usuario, alumnos[3]], tablas, colores)
+    escuchar(alumnos[:1], tablas)
+    assert actualizar_radio()['reproducciones'] == 5
+    assert similares(tablas) == [colores.id, alfabeto.id]
+    incremental = [(f.cancion_id, f.similar_id, f.puntaje) for f in CancionSimilar.query.order_by(
+        CancionSimilar.cancion_id, CancionSimilar.posicion)]
+    actualizar_radio(completo=True)
+    assert incremental == [(f.cancion_id, f.similar_id, f.puntaje) for f in CancionSimilar.query.order_by(
+        CancionSimilar.cancion_id, CancionSimilar.posicion)]
+
+    # Cola sin fin: similares primero, luego lo más escuchado; al terminar vuelve a empezar
+    radio_cache.pop(tablas.id)
+    login(client, usuario.email, 'password123')
+    resp = client.get(f'/api/radio/{tablas.id}?limite=2')
+    datos = resp.get_json()
+    assert resp.status_code == 200
+    assert [c['id'] for c in datos['canciones']] == [colores.id, alfabeto.id]
+    assert datos['canciones'][0]['stream'].startswith(f'/stream/{colores.id}')
+    datos = client.get(f"/api/radio/{tablas.id}?limite=2&desde={datos['siguiente']}").get_json()
+    assert [c['id'] for c in datos['canciones']] == [himno.id, colores.id]
+
+    assert client.get(f'/api/radio/{tablas.id}?limite=x').status_code == 400
+    assert client.get('/api/radio/999').status_code == 404
+
+
+def test_reproducciones_confirmadas_tarde_no_se_pierden(client, usuario, canciones, monkeypatch):
+    tablas, alfabeto = canciones
+    monkeypatch.setitem(app.config, 'RADIO_WATERMARK_LAG', 120)
+
+    def envejecer_tope():
+        estado = db.session.get(EstadoRadio, 1)
+        estado.fecha_tope -= timedelta(seconds=121)
+        db.session.commit()
+
+    # El id 2 pertenece a un lote que aún no se confirmó cuando ya existe el 3
+    db.session.add_all([Reproduccion(id=1, usuario_id=usuario.id, cancion_id=tablas.id),
+                        Reproduccion(id=3, usuario_id=usuario.id, cancion_id=tablas.id)])
+    db.session.commit()
+    assert actualizar_radio()['reproducciones'] == 0
+
+    db.session.add(Reproduccion(id=2, usuario_id=usuario.id, cancion_id=alfabeto.id))
+    db.session.commit()
+    envejecer_tope()
+    assert actualizar_radio()['reproducciones'] == 3
+    assert db.session.get(EstadoRadio, 1).ultima_reproduccion == 3
+
+    # El par del id 2 entró en la matriz aunque se confirmó después del 3
+    assert similares(tablas) == [alfabeto.id]
@@ -0,0 +1,75 @@
+import os
+import json
+
+from app import db, Cancion, Reproduccion, playback_buffer
+from playback import PlaybackBuffer
+
+
+def login(client, email, password):
+    return client.post('/login', data={'email': email, 'password': password}, follow_redirects=True)
+
+
+def test_reproductor_registra_en_lote(client, usuario, canciones):
+    login(client, usuario.email, 'password123')
+    song1, _ = canciones
+
+    for _ in range(3):
+        assert client.get(f'/reproductor/{song1.id}').status_code == 200
+    assert Reproduccion.query.count() == 0
+
+    assert playback_buffer.flush() == 3
+    db.session.expire_all()
+    assert Reproduccion.query.filter_by(cancion_id=song1.id).count() == 3
+    assert db.session.get(Cancion, song1.id).reproducciones_totales == 3
+
+
+def test_buffer_recupera_registros_huerfanos(tmp_path):
+    evento = {'usuario_id': 1, 'cancion_id': 7, 'fecha_reproduccion': '2024-05-01T10:00:00',
+              'duracion_reproducida': 30, 'completada': True}
+    (tmp_path / 'reproducciones.999999.log').write_text(json.dumps(evento) + '\n{"truncado')
+
+    guardados = []
+    buffer = PlaybackBuffer(guardados.extend, log_dir=str(tmp_path), flush_interval=3600)
+    buffer.add(2, 7)
+    assert buffer.pending() == 2
+
+    assert buffer.flush() == 2
+    assert {e['usuario_id'] for e in guardados} == {1, 2}
+    assert not (tmp_path / 'reproducciones.999999.log').exists()
+
+
+def test_buffer_recupera_registro_con_el_mismo_pid(tmp_path):
+    # Reinicio en un contenedor: el proceso nuevo obtiene el mismo pid que el anterior
+    evento = {'usuario_id': 1, 'cancion_id': 7, 'fecha_reproduccion': '2024-05-01T10:00:00',
+              'duracion_reproducida': 30, 'completada': True}
+    registros = tmp_path / 'logs'
+    registros.mkdir()
+    (registros / f'reproducciones.{os.getpid()}.log').write_text(json.dumps(evento) + '\n')
+    (registros / f'reproducciones.{os.getpid()}.log.flushing').write_text(json.dumps(evento) + '\n')
+
+    guardados = []
+    buffer = PlaybackBuffer(guardados.extend, log_dir=str(registros), flush_interval=3600)
+    buffer.add(2, 7)
+    assert buffer.flush() == 3
+    assert [e['usuario_id'] for e in guardados].count(1) == 2
+    assert os.listdir(registros) == [os.path.basename(buffer._log_path())]
+
+
+def test_api_reproduccion_acepta_lotes(client, usuario, canciones):
+    login(client, usuario.email, 'password123')
+    song1, song2 = canciones
+
+    resp = client.post('/api/reproduccion', json={'eventos': [
+        {'cancion_id': song1.id, 'duracion_reproducida': 120, 'completada': True},
+        {'cancion_id': song2.id, 'duracion_reproducida': 15},
+        {'cancion_id': 9999},
+        {'sin_cancion': True},
+    ]})
+    assert resp.status_code == 202
+    assert resp.get_json() == {'aceptados': 2, 'rechazados': 2}
+
+    assert playback_buffer.flush() == 2
+    completada = Reproduccion.query.filter_by(cancion_id=song1.id).one()
+    assert completada.completada and completada.duracion_reproducida == 120
+
+    assert client.post('/api/reproduccion', json=[]).status_code == 400
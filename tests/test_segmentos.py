@@ -0,0 +1,84 @@
+import os
+
+from app import app, db, Cancion
+from conftest import TAMANO_TRAMA, id3_bytes, mp3_bytes
+from frames import iter_mp3_frames
+from segments import build_segments_task, load_segments_index, segments_dir, segments_key
+from storage import blob_abspath, hash_file, store_blob
+
+
+def login(client, email, password):
+    return client.post('/login', data={'email': email, 'password': password}, follow_redirects=True)
+
+
+def guardar_mp3(store_dir, contenido, tmp_path):
+    origen = tmp_path / 'original.mp3'
+    origen.write_bytes(contenido)
+    archivo, _ = store_blob(str(origen), str(store_dir), hash_file(str(origen)), '.mp3')
+    return archivo
+
+
+def test_tramas_mp3_saltan_etiquetas_y_basura():
+    datos = id3_bytes() + b'\x00\xff\x12basura' + mp3_bytes(10) + b'TAG' + bytes(125)
+    tramas = list(iter_mp3_frames(datos))
+    assert len(tramas) == 10
+    assert tramas[0].offset == len(id3_bytes()) + len(b'\x00\xff\x12basura')
+    assert all(t.size == TAMANO_TRAMA and t.samples == 1152 and t.sample_rate == 44100 for t in tramas)
+
+
+def test_segmentar_mp3(tmp_path):
+    store = tmp_path / 'music'
+    archivo = guardar_mp3(store, id3_bytes() + mp3_bytes(), tmp_path)
+    payload = {'path': blob_abspath(str(store), archivo), 'store_dir': str(store),
+               'duration': 6, 'bitrate': 192, 'encoder': None}
+
+    resultado = build_segments_task(payload)
+    assert resultado['segmentos'] == 3
+    assert abs(resultado['duracion'] - 500 * 1152 / 44100) < 0.01
+
+    index = load_segments_index(str(store), segments_key(archivo))
+    assert [s['duracion'] >= 6 for s in index['segmentos']] == [True, True, False]
+    directorio = segments_dir(str(store), segments_key(archivo))
+    contenido = b''.join(open(os.path.join(directorio, f'{n:05d}.mp3'), 'rb').read() for n in range(3))
+    assert contenido == mp3_bytes()
+
+    # Otra canción con el mismo audio reutiliza los segmentos
+    assert build_segments_task(payload) == resultado
+
+
+def test_manifiesto_y_segmentos_inmutables(client, usuario, tmp_path):
+    login(client, usuario.email, 'password123')
+    music_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'music')
+    archivo = guardar_mp3(music_dir, mp3_bytes(), tmp_path)
+    cancion = Cancion(titulo='Largo', artista='Coro', archivo_audio=archivo, subido_por=usuario.id)
+    db.session.add(cancion)
+    db.session.commit()
+    assert client.get(f'/stream/{cancion.id}/manifest.m3u8').status_code == 404
+
+    resultado = build_segments_task({'path': blob_abspath(music_dir, archivo), 'store_dir': music_dir,
+                                     'duration': 6, 'bitrate': 192, 'encoder': None})
+    cancion.segmentos = resultado['segmentos']
+    db.session.commit()
+    assert client.get(f'/api/cancion/{cancion.id}').get_json()['manifiesto']
+
+    resp = client.get(f'/stream/{cancion.id}/manifest.m3u8')
+    assert resp.status_code == 200
+    lineas = resp.get_data(as_text=True).splitlines()
+    assert lineas[0] == '#EXTM3U' and lineas[-1] == '#EXT-X-ENDLIST'
+    segmentos = [linea for linea in lineas if not linea.startswith('#')]
+    assert len(segmentos) == 3
+    assert client.get(f'/stream/{cancion.id}/manifest.m3u8',
+                      headers={'If-None-Match': resp.headers['ETag']}).status_code == 304
+
+    resp = client.get(segmentos[0])
+    assert resp.status_code == 200
+    assert resp.mimetype == 'audio/mpeg'
+    assert 'immutable' in resp.headers['Cache-Control']
+    assert resp.data == mp3_bytes()[:len(resp.data)]
+    assert client.get(segmentos[0].replace('00000.mp3', 'index.json')).status_code == 404
+
+    # Sin referencias se eliminan el audio y sus segmentos
+    db.session.delete(cancion)
+    db.session.commit()
+    assert not os.path.exists(segments_dir(music_dir, segments_key(archivo)))
+    assert not os.path.exists(blob_abspath(music_dir, archivo))
@@ -22,3 +22,55 @@ def test_streaming_y_cambio_de_pistas(client, usuario, canciones):
     resp2 = client.get(f'/stream/{song2.id}')
     assert resp2.status_code == 200
     assert resp2.data == b'PLACEHOLDER_AUDIO_FILE'
+
+
+def test_streaming_rangos_y_condicionales(client, usuario, canciones):
+    login(client, usuario.email, 'password123')
+    song1, _ = canciones
+
+    resp = client.get(f'/stream/{song1.id}', headers={'Range': 'bytes=0-10'})
+    assert resp.status_code == 206
+    assert resp.data == b'PLACEHOLDER'
+    assert resp.headers['Content-Range'] == 'bytes 0-10/22'
+
+    resp = client.get(f'/stream/{song1.id}', headers={'Range': 'bytes=-10'})
+    assert resp.status_code == 206
+    assert resp.data == b'AUDIO_FILE'
+
+    resp = client.get(f'/stream/{song1.id}', headers={'Range': 'bytes=0-3,12-16'})
+    assert resp.status_code == 206
+    assert resp.mimetype == 'multipart/byteranges'
+    assert b'PLAC' in resp.data and b'AUDIO' in resp.data
+    assert int(resp.headers['Content-Length']) == len(resp.data)
+
+    resp = client.get(f'/stream/{song1.id}', headers={'Range': 'bytes=100-'})
+    assert resp.status_code == 416
+
+    etag = client.get(f'/stream/{song1.id}').headers['ETag']
+    resp = client.get(f'/stream/{song1.id}', headers={'If-None-Match': etag})
+    assert resp.status_code == 304
+
+    resp = client.get(f'/stream/{song1.id}', headers={'Range': 'bytes=0-3', 'If-Range': '"otro"'})
+    assert resp.status_code == 200
+    assert resp.data == b'PLACEHOLDER_AUDIO_FILE'
+
+    # If-Range con fecha: solo la fecha exacta conserva el rango
+    fecha = client.get(f'/stream/{song1.id}').headers['Last-Modified']
+    resp = client.get(f'/stream/{song1.id}', headers={'Range': 'bytes=0-3', 'If-Range': fecha})
+    assert resp.status_code == 206
+    resp = client.get(f'/stream/{song1.id}', headers={'Range': 'bytes=0-3',
+                                                      'If-Range': 'Fri, 01 Jan 2100 00:00:00 GMT'})
+    assert resp.status_code == 200
+
+
+def test_cache_de_streaming_se_invalida(client, usuario, canciones):
+    from app import db, stream_cache
+    login(client, usuario.email, 'password123')
+    song1, _ = canciones
+
+    assert client.get(f'/stream/{song1.id}').status_code == 200
+    assert song1.id in stream_cache
+
+    song1.activo = False
+    db.session.commit()
+    assert song1.id not in stream_cache
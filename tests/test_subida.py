@@ -0,0 +1,66 @@
+import io
+import os
+
+from PIL import Image
+
+from app import app, Cancion, TrabajoMedia
+from conftest import subir, wav_bytes
+
+
+def png_bytes(ancho=1600, alto=1200):
+    buffer = io.BytesIO()
+    Image.new('RGB', (ancho, alto), (200, 30, 30)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def archivos_parciales():
+    music_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'music')
+    return [f for f in os.listdir(music_dir) if f.endswith('.part')]
+
+
+def test_subida_en_una_pasada(client, docente):
+    resp = subir(client, wav_bytes())
+    assert resp.status_code == 302
+
+    cancion = Cancion.query.filter_by(titulo='Tema de prueba').one()
+    assert cancion.duracion == 2
+    ruta = os.path.join(app.config['UPLOAD_FOLDER'], 'music', cancion.archivo_audio)
+    assert os.path.getsize(ruta) == len(wav_bytes())
+    assert archivos_parciales() == []
+
+
+def test_subida_invalida_no_deja_archivos(client, docente):
+    resp = subir(client, b'esto no es audio' * 100)
+    assert resp.status_code == 200
+    assert 'no es un formato de audio' in resp.get_data(as_text=True)
+    assert Cancion.query.count() == 0
+    assert archivos_parciales() == []
+
+
+def test_portada_se_procesa_en_la_cola(client, docente):
+    resp = subir(client, wav_bytes(), portada=png_bytes())
+    assert resp.status_code == 302
+
+    # En pruebas la cola se procesa en línea tras el commit
+    cancion = Cancion.query.filter_by(titulo='Tema de prueba').one()
+    trabajo = TrabajoMedia.query.filter_by(tipo='portada').one()
+    assert trabajo.tipo == 'portada'
+    assert trabajo.estado == 'completado'
+    assert trabajo.intentos == 1
+    assert cancion.estado == 'listo'
+    assert cancion.cover_image
+
+    ruta = os.path.join(app.config['UPLOAD_FOLDER'], 'covers', cancion.cover_image)
+    with Image.open(ruta) as img:
+        assert img.width <= 800 and img.height <= 600
+
+    # Derivados por tamaño con URL inmutable y marcador borroso
+    assert cancion.cover_key
+    assert cancion.cover_placeholder.startswith('data:image/webp;base64,')
+    resp = client.get(f'/img/covers/{cancion.cover_key}-card.webp')
+    assert resp.status_code == 200
+    assert 'immutable' in resp.headers['Cache-Control']
+    with Image.open(io.BytesIO(resp.data)) as img:
+        assert img.format == 'WEBP' and max(img.size) == 480
+    assert client.get(f'/img/covers/{cancion.cover_key}-thumb.jpg').status_code == 200
+    assert f'{cancion.cover_key}-card.webp' in client.get('/biblioteca').get_data(as_text=True)
@@ -0,0 +1,136 @@
+import hashlib
+import os
+import threading
+import time
+
+from app import app, db, media_jobs, Cancion, Usuario, subidas
+from conftest import wav_bytes
+
+
+def iniciar(client, contenido, nombre='tema.wav', **extra):
+    resp = client.post('/api/subidas', json=dict(nombre=nombre, tamano=len(contenido), **extra))
+    assert resp.status_code == 201
+    return resp.get_json()['id']
+
+
+def enviar(client, upload_id, offset, bloque, checksum=None):
+    return client.put(f'/api/subidas/{upload_id}', data=bloque, headers={
+        'Content-Type': 'application/octet-stream',
+        'Upload-Offset': str(offset),
+        'X-Chunk-Sha256': checksum or hashlib.sha256(bloque).hexdigest(),
+    })
+
+
+def finalizar(client, upload_id):
+    return client.post(f'/api/subidas/{upload_id}/finalizar', data={
+        'titulo': 'Tema por bloques', 'artista': 'Coro', 'genero': '', 'materia': '',
+        'grado_objetivo': '', 'año': '2024',
+    })
+
+
+def test_subida_por_bloques_reanudable(client, docente):
+    contenido = wav_bytes(3)
+    mitad = len(contenido) // 2
+    upload_id = iniciar(client, contenido, sha256=hashlib.sha256(contenido).hexdigest())
+
+    assert enviar(client, upload_id, 0, contenido[:mitad]).get_json()['offset'] == mitad
+
+    # Bloque dañado en tránsito: se descarta y el offset no avanza
+    resp = enviar(client, upload_id, mitad, contenido[mitad:], checksum='0' * 64)
+    assert resp.status_code == 422
+    assert resp.headers['Upload-Offset'] == str(mitad)
+
+    # Un bloque repetido (offset antiguo) indica desde dónde seguir
+    resp = enviar(client, upload_id, 0, contenido[:mitad])
+    assert resp.status_code == 409
+    assert resp.get_json()['offset'] == mitad
+
+    # Finalizar antes de tiempo no es posible
+    assert finalizar(client, upload_id).status_code == 409
+
+    assert client.get(f'/api/subidas/{upload_id}').get_json() == {'offset': mitad, 'tamano': len(contenido)}
+    assert enviar(client, upload_id, mitad, contenido[mitad:]).status_code == 200
+
+    resp = finalizar(client, upload_id)
+    assert resp.status_code == 201
+    cancion = db.session.get(Cancion, resp.get_json()['id'])
+    assert cancion.titulo == 'Tema por bloques'
+    assert cancion.duracion == 3
+    ruta = os.path.join(app.config['UPLOAD_FOLDER'], 'music', cancion.archivo_audio)
+    assert os.path.getsize(ruta) == len(contenido)
+    assert not os.path.exists(os.path.join(subidas.base_dir, upload_id))
+
+
+def test_subida_de_otro_usuario_no_es_visible(client, docente):
+    contenido = wav_bytes(1)
+    upload_id = iniciar(client, contenido)
+    client.get('/logout')
+
+    otro = Usuario(email='otro@example.com', nombre='Otro', apellidos='Docente', rol='docente')
+    otro.set_password('password123')
+    db.session.add(otro)
+    db.session.commit()
+    client.post('/login', data={'email': otro.email, 'password': 'password123'})
+
+    assert client.get(f'/api/subidas/{upload_id}').status_code == 404
+    assert enviar(client, upload_id, 0, contenido).status_code == 404
+    subidas.discard(upload_id)
+
+
+def test_hash_completo_incorrecto(client, docente):
+    contenido = wav_bytes(1)
+    upload_id = iniciar(client, contenido, sha256='f' * 64)
+    enviar(client, upload_id, 0, contenido)
+
+    resp = finalizar(client, upload_id)
+    assert resp.status_code == 422
+    assert Cancion.query.count() == 0
+    assert not os.path.exists(os.path.join(subidas.base_dir, upload_id))
+
+
+def test_error_al_guardar_conserva_la_subida(client, docente, monkeypatch):
+    contenido = wav_bytes(1)
+    upload_id = iniciar(client, contenido)
+    enviar(client, upload_id, 0, contenido)
+
+    def fallar(*args, **kwargs):
+        raise RuntimeError('base de datos no disponible')
+
+    monkeypatch.setattr(media_jobs, 'enqueue', fallar)
+    assert finalizar(client, upload_id).status_code == 500
+    assert Cancion.query.count() == 0
+    assert client.get(f'/api/subidas/{upload_id}').get_json()['offset'] == len(contenido)
+
+    # Un error del servidor no obliga a volver a subir el archivo
+    monkeypatch.undo()
+    resp = finalizar(client, upload_id)
+    assert resp.status_code == 201
+    cancion = db.session.get(Cancion, resp.get_json()['id'])
+    ruta = os.path.join(app.config['UPLOAD_FOLDER'], 'music', cancion.archivo_audio)
+    assert os.path.getsize(ruta) == len(contenido)
+    assert not os.path.exists(os.path.join(subidas.base_dir, upload_id))
+
+
+def test_finalizar_dos_veces_crea_una_cancion(client, docente):
+    contenido = wav_bytes(1)
+    upload_id = iniciar(client, contenido)
+    enviar(client, upload_id, 0, contenido)
+
+    # El segundo finalizar espera al primero y ya no encuentra la subida
+    respuestas = []
+    with subidas.locked(upload_id):
+        segundo = threading.Thread(target=lambda: respuestas.append(finalizar(client, upload_id)))
+        segundo.start()
+        time.sleep(0.2)
+        assert segundo.is_alive()
+        subidas.discard(upload_id)
+    segundo.join(5)
+    assert respuestas[0].status_code == 404
+    assert Cancion.query.count() == 0
+
+
+def test_tipo_y_tamano_validados_al_iniciar(client, docente):
+    assert client.post('/api/subidas', json={'nombre': 'virus.exe', 'tamano': 10}).status_code == 400
+    resp = client.post('/api/subidas', json={'nombre': 'enorme.mp3',
+                                             'tamano': app.config['RESUMABLE_UPLOAD_MAX_SIZE'] + 1})
+    assert resp.status_code == 413
@@ -0,0 +1,154 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from app import db, media_jobs, TrabajoMedia
+
+
+def tarea_fallida(payload):
+    raise RuntimeError('fallo simulado')
+
+
+def tarea_ok(payload):
+    return {'doble': payload['n'] * 2}
+
+
+def tarea_que_muere(payload):
+    os._exit(1)  # Como un proceso hijo que el sistema mata por memoria
+
+
+def tarea_lenta(payload):
+    time.sleep(payload['segundos'])
+    return {'doble': 0}
+
+
+@pytest.fixture
+def cola(client):
+    resultados = []
+    fallos = []
+    media_jobs.register('prueba_ok', tarea_ok,
+                        on_success=lambda trabajo, resultado: resultados.append(resultado))
+    media_jobs.register('prueba_lenta', tarea_lenta)
+    media_jobs.register('prueba_muere', tarea_que_muere)
+    media_jobs.register('prueba_fallo', tarea_fallida,
+                        on_failure=lambda trabajo, error: fallos.append(str(error)))
+    retry_delay = media_jobs.retry_delay
+    media_jobs.retry_delay = 0
+    yield resultados, fallos
+    media_jobs.retry_delay = retry_delay
+    for tipo in ('prueba_ok', 'prueba_lenta', 'prueba_muere', 'prueba_fallo', 'prueba_fallo_callback'):
+        media_jobs._handlers.pop(tipo, None)
+
+
+def test_trabajo_completado(cola):
+    resultados, _ = cola
+    media_jobs.enqueue('prueba_ok', {'n': 21})
+    db.session.commit()
+
+    media_jobs.run_inline()
+
+    trabajo = TrabajoMedia.query.one()
+    assert trabajo.estado == 'completado'
+    assert resultados == [{'doble': 42}]
+    assert media_jobs.stats() == {'completado': {'prueba_ok': 1}}
+
+
+def test_trabajo_reintenta_y_marca_error(cola):
+    _, fallos = cola
+    media_jobs.enqueue('prueba_fallo', {})
+    db.session.commit()
+
+    media_jobs.run_inline()
+
+    trabajo = TrabajoMedia.query.one()
+    assert trabajo.estado == 'error'
+    assert trabajo.intentos == media_jobs.max_attempts
+    assert 'fallo simulado' in trabajo.error
+    assert fallos == ['fallo simulado']
+
+
+def test_error_en_on_failure_cierra_el_trabajo(cola):
+    def fallar(trabajo, error):
+        raise RuntimeError('callback roto')
+
+    media_jobs.register('prueba_fallo_callback', tarea_fallida, on_failure=fallar)
+    media_jobs.enqueue('prueba_fallo_callback', {})
+    db.session.commit()
+
+    media_jobs.run_inline()
+
+    trabajo = TrabajoMedia.query.one()
+    assert trabajo.estado == 'error'
+    assert trabajo.intentos == media_jobs.max_attempts
+
+
+def test_pool_roto_devuelve_los_trabajos(cola):
+    media_jobs.enqueue('prueba_muere', {})
+    db.session.commit()
+    executor = ProcessPoolExecutor(max_workers=1)
+    try:
+        with pytest.raises(BrokenProcessPool):
+            media_jobs.run_pending(executor)
+        muerto = TrabajoMedia.query.one()
+        assert muerto.estado == 'pendiente' and muerto.intentos == 1
+
+        # El pool roto ya no acepta trabajos: vuelven a la cola sin gastar intento
+        media_jobs.enqueue('prueba_ok', {'n': 1})
+        db.session.commit()
+        with pytest.raises(BrokenProcessPool):
+            media_jobs.run_pending(executor)
+        assert {(t.estado, t.intentos) for t in TrabajoMedia.query} == {('pendiente', 1), ('pendiente', 0)}
+    finally:
+        executor.shutdown()
+
+
+def test_claim_no_repite_trabajos(cola):
+    for n in range(3):
+        media_jobs.enqueue('prueba_ok', {'n': n})
+    db.session.commit()
+
+    primeros = media_jobs.claim(2)
+    resto = media_jobs.claim(10)
+    assert len(primeros) == 2 and len(resto) == 1
+    assert {t.id for t in primeros}.isdisjoint(t.id for t in resto)
+    assert all(t.estado == 'procesando' for t in primeros + resto)
+
+
+def test_trabajo_largo_no_se_reclama(cola, monkeypatch):
+    media_jobs.enqueue('prueba_lenta', {'segundos': 0.4})
+    db.session.commit()
+
+    # Sin latidos el trabajo llevaría más que visibility_timeout en 'procesando'
+    estados = []
+    latido = media_jobs._heartbeat
+
+    def latir_y_reclamar(trabajos):
+        latido(trabajos)
+        media_jobs._requeue_abandoned()
+        estados.append(TrabajoMedia.query.one().estado)
+
+    monkeypatch.setattr(media_jobs, 'visibility_timeout', 0.15)
+    monkeypatch.setattr(media_jobs, 'heartbeat_interval', 0.05)
+    monkeypatch.setattr(media_jobs, '_heartbeat', latir_y_reclamar)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        assert media_jobs.run_pending(executor) == 1
+
+    assert estados and set(estados) == {'procesando'}
+    trabajo = TrabajoMedia.query.one()
+    assert trabajo.estado == 'completado' and trabajo.intentos == 1
+
+
+def test_estado_de_cola_solo_admin(client, usuario):
+    client.post('/login', data={'email': usuario.email, 'password': 'password123'})
+    assert client.get('/api/trabajos/estado').status_code == 403
+
+    usuario.rol = 'admin'
+    db.session.commit()
+    client.get('/logout')
+    client.post('/login', data={'email': usuario.email, 'password': 'password123'})
+    resp = client.get('/api/trabajos/estado')
+    assert resp.status_code == 200
+    assert resp.get_json() == {}
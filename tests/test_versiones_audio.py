@@ -0,0 +1,104 @@
+import os
+import shutil
+
+import pytest
+
+from app import app, db, VersionAudio
+from storage import blob_abspath, hash_file, store_blob
+from conftest import wav_bytes
+from transcode import TranscodeError, build_renditions_task, choose_quality, needs_rendition
+
+CALIDADES = {
+    'high': {'bitrate': 320, 'format': 'mp3'},
+    'medium': {'bitrate': 192, 'format': 'mp3'},
+    'low': {'bitrate': 128, 'format': 'mp3'}
+}
+
+
+def login(client, email, password):
+    return client.post('/login', data={'email': email, 'password': password}, follow_redirects=True)
+
+
+def agregar_version(cancion, calidad, contenido, tmp_path):
+    origen = tmp_path / f'{calidad}.mp3'
+    origen.write_bytes(contenido)
+    music_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'music')
+    archivo, _ = store_blob(str(origen), music_dir, hash_file(str(origen)), '.mp3')
+    db.session.add(VersionAudio(cancion_id=cancion.id, calidad=calidad, archivo=archivo,
+                                formato='mp3', bitrate=CALIDADES[calidad]['bitrate'],
+                                tamano=len(contenido)))
+    db.session.commit()
+    return blob_abspath(music_dir, archivo)
+
+
+def test_prioridad_de_eleccion_de_calidad():
+    assert choose_quality(CALIDADES) is None
+    assert choose_quality(CALIDADES, default='medium') == 'medium'
+    assert choose_quality(CALIDADES, requested='low', preference='high') == 'low'
+    assert choose_quality(CALIDADES, requested='original', preference='low') is None
+    assert choose_quality(CALIDADES, requested='desconocida', preference='high') == 'high'
+    assert choose_quality(CALIDADES, preference='auto', save_data=True) == 'low'
+
+    # La mitad del ancho de banda medido queda para el audio
+    assert choose_quality(CALIDADES, throughput_kbps=1000) == 'high'
+    assert choose_quality(CALIDADES, throughput_kbps=400) == 'medium'
+    assert choose_quality(CALIDADES, throughput_kbps=100) == 'low'
+
+
+def test_versiones_solo_si_mejoran_el_original():
+    assert needs_rendition('.wav', None, CALIDADES['high'])
+    assert needs_rendition('.flac', 96, CALIDADES['low'])
+    assert needs_rendition('.mp3', 320, CALIDADES['medium'])
+    assert not needs_rendition('.mp3', 128, CALIDADES['medium'])
+    assert not needs_rendition('.ogg', 128, CALIDADES['low'])
+
+
+def test_stream_sirve_la_calidad_elegida(client, usuario, canciones, tmp_path):
+    login(client, usuario.email, 'password123')
+    song1, _ = canciones
+    assert client.get(f'/stream/{song1.id}').headers['X-Audio-Quality'] == 'original'
+
+    ruta = agregar_version(song1, 'low', b'VERSION_BAJA', tmp_path)
+
+    resp = client.get(f'/stream/{song1.id}?q=low')
+    assert resp.data == b'VERSION_BAJA'
+    assert resp.headers['X-Audio-Quality'] == 'low'
+
+    # Sin versión 'high' se sirve el original
+    resp = client.get(f'/stream/{song1.id}?q=high')
+    assert resp.data == b'PLACEHOLDER_AUDIO_FILE'
+
+    assert client.get(f'/stream/{song1.id}', headers={'Save-Data': 'on'}).data == b'VERSION_BAJA'
+    assert client.get(f'/stream/{song1.id}?bw=200').data == b'VERSION_BAJA'
+
+    # Preferencia guardada del usuario
+    assert client.post('/api/preferencias', json={'calidad_audio': 'muy-alta'}).status_code == 400
+    assert client.post('/api/preferencias', json={'calidad_audio': 'low'}).status_code == 200
+    assert client.get(f'/stream/{song1.id}').data == b'VERSION_BAJA'
+    meta = client.get(f'/api/cancion/{song1.id}').get_json()
+    assert meta['stream'].endswith('q=low')
+
+    # Al eliminar la canción su versión deja de tener referencias
+    db.session.delete(song1)
+    db.session.commit()
+    assert VersionAudio.query.count() == 0
+    assert not os.path.exists(ruta)
+
+
+def test_versiones_sin_codificador(tmp_path):
+    original = tmp_path / 'original.wav'
+    original.write_bytes(wav_bytes())
+    with pytest.raises(TranscodeError):
+        build_renditions_task({'path': str(original), 'store_dir': str(tmp_path),
+                               'calidades': CALIDADES, 'encoder': str(tmp_path / 'no-existe')})
+
+
+@pytest.mark.skipif(shutil.which('ffmpeg') is None, reason='ffmpeg no está instalado')
+def test_versiones_con_ffmpeg(tmp_path):
+    original = tmp_path / 'original.wav'
+    original.write_bytes(wav_bytes())
+    resultado = build_renditions_task({'path': str(original), 'store_dir': str(tmp_path),
+                                       'calidades': CALIDADES, 'encoder': shutil.which('ffmpeg')})
+    assert [v['calidad'] for v in resultado['versiones']] == ['high', 'medium', 'low']
+    for version in resultado['versiones']:
+        assert os.path.getsize(blob_abspath(str(tmp_path), version['archivo'])) == version['tamano']
@@ -0,0 +1,184 @@
+"""
+Versiones de audio por calidad para Spotify Picaflorino
+Transcodifica cada canción a los niveles de Config.AUDIO_QUALITY con un
+codificador local (ffmpeg) fuera de las peticiones, y elige el nivel que
+se sirve en /stream según el parámetro ?q=, la preferencia del usuario o
+el ancho de banda que anuncia el cliente
+"""
+
+import os
+import shutil
+import subprocess
+from mutagen import File as MutagenFile
+from storage import blob_abspath, hash_file, store_blob
+from seekindex import build_seek_index, seek_format, seek_index_path, write_seek_index
+
+# Formatos sin pérdida: siempre vale la pena generar versiones
+LOSSLESS_EXTENSIONS = ('.wav', '.flac')
+
+# Códec de ffmpeg para cada formato de salida
+ENCODER_CODECS = {
+    'mp3': 'libmp3lame',
+    'ogg': 'libvorbis',
+    'opus': 'libopus',
+    'm4a': 'aac',
+}
+
+# Contenedor de ffmpeg (-f) para cada formato de salida
+ENCODER_CONTAINERS = {
+    'mp3': 'mp3',
+    'ogg': 'ogg',
+    'opus': 'ogg',
+    'm4a': 'ipod',
+}
+
+TRANSCODE_TIMEOUT = 15 * 60
+
+
+class TranscodeError(Exception):
+    """El codificador no está disponible o falló al generar una versión"""
+
+
+def find_encoder(binary='ffmpeg'):
+    """Ruta del codificador local, o None si no está instalado"""
+    return shutil.which(binary) if binary else None
+
+
+def source_bitrate_kbps(path):
+    """Bitrate del archivo original en kbps (None si mutagen no lo conoce)"""
+    try:
+        audio = MutagenFile(path)
+    except Exception:
+        return None
+    bitrate = getattr(getattr(audio, 'info', None), 'bitrate', None)
+    return bitrate // 1000 if bitrate else None
+
+
+def needs_rendition(source_ext, source_kbps, tier):
+    """
+    Si una calidad aporta algo frente al original
+
+    Un original con pérdida de bitrate igual o menor que el nivel ya es
+    esa calidad: recodificarlo solo gastaría disco y empeoraría el sonido.
+    """
+    if source_ext.lower() in LOSSLESS_EXTENSIONS or not source_kbps:
+        return True
+    return source_kbps > tier['bitrate']
+
+
+def transcode_audio(encoder, src_path, dest_path, bitrate, fmt):
+    """
+    Codificar un archivo con ffmpeg
+
+    Args:
+        encoder: Ruta del ejecutable de ffmpeg
+        src_path: Archivo original
+        dest_path: Archivo de salida (se sobrescribe)
+        bitrate: Bitrate objetivo en kbps
+        fmt: Formato de salida ('mp3', 'ogg', 'opus' o 'm4a')
+    """
+    if fmt not in ENCODER_CODECS:
+        raise TranscodeError(f'Formato de salida no soportado: {fmt}')
+    command = [
+        encoder, '-nostdin', '-hide_banner', '-loglevel', 'error', '-y',
+        '-i', src_path,
+        '-map', '0:a:0', '-map_metadata', '0',
+        '-codec:a', ENCODER_CODECS[fmt], '-b:a', f'{bitrate}k',
+        '-f', ENCODER_CONTAINERS[fmt], dest_path,
+    ]
+    try:
+        result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                                timeout=TRANSCODE_TIMEOUT)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        raise TranscodeError(f'No se pudo ejecutar el codificador: {e}')
+    if result.returncode != 0:
+        error = result.stderr.decode('utf-8', 'replace').strip().splitlines()
+        raise TranscodeError(error[-1] if error else f'ffmpeg terminó con código {result.returncode}')
+
+
+def build_renditions_task(payload):
+    """
+    Generar las versiones de una canción (tarea de la cola de trabajos)
+
+    Args:
+        payload: dict con 'path' (original), 'store_dir' (uploads/music),
+            'calidades' (Config.AUDIO_QUALITY) y 'encoder' (ruta de ffmpeg)
+
+    Returns:
+        dict: {'versiones': [{'calidad', 'archivo', 'formato', 'bitrate', 'tamano'}],
+               'omitidas': [calidad, ...]} (cada versión con su índice de búsqueda)
+    """
+    src = payload['path']
+    if not os.path.isfile(src):
+        raise TranscodeError(f'No existe el archivo original {src}')
+    encoder = payload.get('encoder') or find_encoder()
+
+    _, ext = os.path.splitext(src)
+    source_kbps = source_bitrate_kbps(src)
+    versiones, omitidas = [], []
+    for calidad, tier in sorted(payload['calidades'].items(), key=lambda item: -item[1]['bitrate']):
+        if not needs_rendition(ext, source_kbps, tier):
+            omitidas.append(calidad)
+            continue
+        if not encoder:
+            raise TranscodeError('No hay un codificador de audio (ffmpeg) instalado')
+
+        # Temporal en el mismo disco que el almacén para moverlo sin copiar
+        fmt = tier['format']
+        tmp = os.path.join(payload['store_dir'], f'.version-{os.getpid()}-{calidad}.{fmt}')
+        try:
+            transcode_audio(encoder, src, tmp, tier['bitrate'], fmt)
+            tamano = os.path.getsize(tmp)
+            archivo, _ = store_blob(tmp, payload['store_dir'], hash_file(tmp), f'.{fmt}')
+        finally:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+        # Índice de búsqueda de la versión (?t= sobre la calidad elegida)
+        path = blob_abspath(payload['store_dir'], archivo)
+        if seek_format(path) is not None and not os.path.exists(seek_index_path(path)):
+            write_seek_index(path, build_seek_index(path))
+        versiones.append({'calidad': calidad, 'archivo': archivo, 'formato': fmt,
+                          'bitrate': tier['bitrate'], 'tamano': tamano})
+    return {'versiones': versiones, 'omitidas': omitidas}
+
+
+def choose_quality(tiers, requested=None, preference=None, throughput_kbps=None,
+                   save_data=False, default=None, headroom=0.5):
+    """
+    Elegir el nivel de calidad que se sirve
+
+    Orden de prioridad: ?q= explícito, preferencia guardada del usuario,
+    cabecera Save-Data, ancho de banda medido por el cliente y, por último,
+    el nivel por defecto de la configuración.
+
+    Args:
+        tiers: Config.AUDIO_QUALITY
+        requested: Valor de ?q= ('original', 'auto' o un nivel)
+        preference: Preferencia del usuario (None o 'auto' = automática)
+        throughput_kbps: Ancho de banda del cliente en kbps
+        save_data: El navegador pidió ahorrar datos
+        default: Nivel sin otra información (None = original)
+        headroom: Fracción del ancho de banda que puede usar el audio
+
+    Returns:
+        str | None: Nombre del nivel, o None para el archivo original
+    """
+    for choice in (requested, preference):
+        if choice == 'original':
+            return None
+        if choice in tiers:
+            return choice
+
+    por_bitrate = sorted(tiers, key=lambda nombre: tiers[nombre]['bitrate'])
+    if not por_bitrate:
+        return None
+    if save_data:
+        return por_bitrate[0]
+    if throughput_kbps:
+        disponible = throughput_kbps * headroom
+        elegida = por_bitrate[0]
+        for nombre in por_bitrate:
+            if tiers[nombre]['bitrate'] <= disponible:
+                elegida = nombre
+        return elegida
+    return default if default in tiers else None
@@ -3,19 +3,24 @@ Utilidades para el proyecto Spotify Picaflorino
 Funciones auxiliares para validación, archivos y procesamiento
 """
 
+import io
 import os
+import base64
+import shutil
+import hashlib
 import tempfile
 import logging
 from datetime import datetime
-from PIL import Image
+from PIL import Image, ImageOps
 from mutagen import File as MutagenFile
 from werkzeug.utils import secure_filename
+from storage import reserve_blob, blob_abspath, hash_file
 import uuid
 
 # Configuración de logging
 def setup_logging(app):
     """Configurar sistema de logging para la aplicación"""
-    if not app.debug:
+    if not app.debug and not app.testing:
         # Crear directorio de logs si no existe
         if not os.path.exists('logs'):
             os.makedirs('logs')
@@ -38,74 +43,14 @@ def setup_logging(app):
         app.logger.setLevel(logging.INFO)
         app.logger.info('Spotify Picaflorino iniciado')
 
-def validate_audio_file(file_stream, max_size_mb=50):
-    """
-    Validar que el archivo sea realmente audio y no exceda el tamaño máximo
-    
-    Args:
-        file_stream: Stream del archivo
-        max_size_mb: Tamaño máximo en MB
-        
-    Returns:
-        dict: {'valid': bool, 'error': str, 'metadata': dict}
-    """
-    try:
-        # Verificar tamaño del archivo
-        file_stream.seek(0, 2)  # Ir al final
-        file_size = file_stream.tell()
-        file_stream.seek(0)  # Volver al inicio
-        
-        if file_size > max_size_mb * 1024 * 1024:
-            return {
-                'valid': False, 
-                'error': f'El archivo excede el tamaño máximo de {max_size_mb}MB',
-                'metadata': {}
-            }
-        
-        # Crear archivo temporal para validación
-        temp_fd, temp_path = tempfile.mkstemp()
-        try:
-            # Copiar contenido al archivo temporal
-            with os.fdopen(temp_fd, 'wb') as temp_file:
-                file_stream.seek(0)
-                temp_file.write(file_stream.read())
-                file_stream.seek(0)
-            
-            # Validar con mutagen
-            audio = MutagenFile(temp_path)
-            
-            if audio is None:
-                return {
-                    'valid': False,
-                    'error': 'El archivo no es un formato de audio válido',
-                    'metadata': {}
-                }
-            
-            # Extraer metadata
-            metadata = {
-                'duration': int(audio.info.length) if hasattr(audio.info, 'length') else None,
-                'bitrate': getattr(audio.info, 'bitrate', None),
-                'sample_rate': getattr(audio.info, 'sample_rate', None),
-                'channels': getattr(audio.info, 'channels', None)
-            }
-            
-            return {
-                'valid': True,
-                'error': None,
-                'metadata': metadata
-            }
-            
-        finally:
-            # Limpiar archivo temporal
-            if os.path.exists(temp_path):
-                os.unlink(temp_path)
-                
-    except Exception as e:
-        return {
-            'valid': False,
-            'error': f'Error al validar archivo: {str(e)}',
-            'metadata': {}
-        }
+# Tamaño de bloque para copiar archivos subidos (memoria máxima por subida)
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# Derivados de imágenes: lado mayor en px de cada tamaño
+IMAGE_SIZES = {'thumb': 160, 'card': 480, 'full': 960}
+IMAGE_DERIVATIVES_DIR = 'd'  # Subdirectorio junto a los originales
+IMAGE_DERIVATIVES_VERSION = 'v1'  # Cambiarlo regenera todas las URLs
+PLACEHOLDER_SIZE = 16
 
 def validate_image_file(file_stream, max_size_mb=5):
     """
@@ -167,7 +112,8 @@ def validate_image_file(file_stream, max_size_mb=5):
             'metadata': {}
         }
 
-def compress_and_resize_image(image_path, max_width=800, max_height=600, quality=85):
+def compress_and_resize_image(image_path, max_width=800, max_height=600, quality=85,
+                              raise_errors=False):
     """
     Comprimir y redimensionar imagen manteniendo aspecto
     
@@ -176,6 +122,7 @@ def compress_and_resize_image(image_path, max_width=800, max_height=600, quality
         max_width: Ancho máximo
         max_height: Alto máximo
         quality: Calidad de compresión (1-100)
+        raise_errors: Lanzar ImageProcessingError en vez de solo registrar el error
     """
     try:
         with Image.open(image_path) as img:
@@ -199,6 +146,107 @@ def compress_and_resize_image(image_path, max_width=800, max_height=600, quality
             
     except Exception as e:
         logging.error(f"Error al comprimir imagen {image_path}: {str(e)}")
+        if raise_errors:
+            raise ImageProcessingError(str(e))
+
+def _flatten_to_rgb(img):
+    """Convertir a RGB componiendo la transparencia sobre fondo blanco"""
+    if img.mode in ('RGBA', 'LA', 'P'):
+        img = img.convert('RGBA')
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        background.paste(img, mask=img.split()[-1])
+        return background
+    return img.convert('RGB') if img.mode != 'RGB' else img
+
+def _fit_within(img, max_side):
+    """
+    Redimensionar para que el lado mayor sea max_side: primero reduce()
+    (promedio por bloques, muy rápido) hasta ~2x el tamaño final y luego
+    LANCZOS para la calidad
+    """
+    longest = max(img.size)
+    if longest <= max_side:
+        return img.copy()
+    scale = max_side / longest
+    target = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+    factor = longest // (max_side * 2)
+    if factor >= 2:
+        img = img.reduce(factor)
+    return img.resize(target, Image.Resampling.LANCZOS)
+
+def image_derivative_name(key, size, fmt):
+    """Nombre del archivo derivado (ej: 3fa9...-card.webp)"""
+    return f"{key}-{size}.{fmt}"
+
+def generate_image_derivatives(image_path, dest_dir, sizes=None, quality=82):
+    """
+    Generar las versiones de tamaño fijo de una imagen en WebP y JPEG
+    
+    Los nombres incluyen el hash del contenido original, por lo que pueden
+    servirse con caché inmutable: una imagen nueva siempre tiene otra URL.
+    
+    Args:
+        image_path: Ruta de la imagen original
+        dest_dir: Directorio de derivados (ej: uploads/covers/d)
+        sizes: {nombre: lado mayor en px} (por defecto IMAGE_SIZES)
+        quality: Calidad de compresión (1-100)
+        
+    Returns:
+        dict: {'key': str, 'placeholder': data URI del marcador borroso}
+    """
+    sizes = sizes or IMAGE_SIZES
+    digest = hashlib.sha256(IMAGE_DERIVATIVES_VERSION.encode())
+    with open(image_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    key = digest.hexdigest()[:24]
+    os.makedirs(dest_dir, exist_ok=True)
+    
+    try:
+        with Image.open(image_path) as img:
+            # Decodificar JPEG grandes directamente a escala reducida (1/2, 1/4, 1/8)
+            largest = max(sizes.values())
+            img.draft('RGB', (largest, largest))
+            img = _flatten_to_rgb(ImageOps.exif_transpose(img))
+    except Exception as e:
+        raise ImageProcessingError(f'No se pudo abrir la imagen: {str(e)}')
+    
+    # De mayor a menor: cada tamaño parte del anterior, que ya es más pequeño
+    source = img
+    for name, max_side in sorted(sizes.items(), key=lambda item: -item[1]):
+        source = _fit_within(source, max_side)
+        for fmt, options in (('webp', {'quality': quality, 'method': 4}),
+                             ('jpg', {'quality': quality, 'optimize': True, 'progressive': True})):
+            path = os.path.join(dest_dir, image_derivative_name(key, name, fmt))
+            if not os.path.exists(path):
+                tmp = f'{path}.{os.getpid()}.tmp'
+                source.save(tmp, 'WEBP' if fmt == 'webp' else 'JPEG', **options)
+                os.replace(tmp, path)
+    
+    # Marcador de unos cientos de bytes para pintar algo al instante
+    tiny = _fit_within(source, PLACEHOLDER_SIZE)
+    buffer = io.BytesIO()
+    tiny.save(buffer, 'WEBP', quality=40)
+    placeholder = 'data:image/webp;base64,' + base64.b64encode(buffer.getvalue()).decode('ascii')
+    return {'key': key, 'placeholder': placeholder}
+
+def process_image_task(payload):
+    """
+    Tarea de la cola de trabajos: derivados y compresión de una imagen subida
+    
+    Args:
+        payload: {'path': ruta de la imagen, 'filename': nombre del archivo,
+                  'compress': comprimir también el original (por defecto True)}
+        
+    Returns:
+        dict: {'filename', 'key', 'placeholder'}
+    """
+    derivatives = generate_image_derivatives(
+        payload['path'], os.path.join(os.path.dirname(payload['path']), IMAGE_DERIVATIVES_DIR)
+    )
+    if payload.get('compress', True):
+        compress_and_resize_image(payload['path'], raise_errors=True)
+    return dict(derivatives, filename=payload['filename'])
 
 def generate_unique_filename(original_filename, prefix=""):
     """
@@ -231,6 +279,137 @@ def generate_unique_filename(original_filename, prefix=""):
     
     return final_name
 
+def extract_audio_metadata(audio_file):
+    """
+    Extraer metadata de un objeto de mutagen ya abierto
+    
+    Args:
+        audio_file: Resultado de MutagenFile()
+        
+    Returns:
+        dict: Metadata del audio
+    """
+    return {
+        'duration': int(audio_file.info.length) if hasattr(audio_file.info, 'length') else None,
+        'bitrate': getattr(audio_file.info, 'bitrate', None),
+        'sample_rate': getattr(audio_file.info, 'sample_rate', None),
+        'channels': getattr(audio_file.info, 'channels', None),
+        'title': audio_file.get('TIT2', [None])[0] if 'TIT2' in audio_file else None,
+        'artist': audio_file.get('TPE1', [None])[0] if 'TPE1' in audio_file else None,
+        'album': audio_file.get('TALB', [None])[0] if 'TALB' in audio_file else None,
+    }
+
+def save_audio_upload(file_stream, dest_dir, original_filename, max_size_mb=50,
+                      chunk_size=UPLOAD_CHUNK_SIZE):
+    """
+    Guardar un audio subido en una sola pasada: copia por bloques a un
+    archivo temporal en el destino (calculando tamaño y hash), valida y
+    extrae metadata con mutagen una única vez y lo mueve al almacén por
+    contenido (ab/cd/<sha256>.ext), reutilizando el blob si ya existía
+    
+    Args:
+        file_stream: Stream del archivo subido
+        dest_dir: Directorio final (ej: uploads/music)
+        original_filename: Nombre original para conservar la extensión
+        max_size_mb: Tamaño máximo en MB
+        chunk_size: Bytes leídos por bloque
+        
+    Returns:
+        dict: {'valid': bool, 'error': str, 'filename': str, 'path': str,
+               'size': int, 'sha256': str, 'duplicate': bool, 'reserva': str,
+               'metadata': dict}
+    """
+    max_bytes = max_size_mb * 1024 * 1024
+    result = {'valid': False, 'error': None, 'filename': None, 'path': None,
+              'size': 0, 'sha256': None, 'duplicate': False, 'reserva': None, 'metadata': {}}
+    
+    os.makedirs(dest_dir, exist_ok=True)
+    _, ext = os.path.splitext(secure_filename(original_filename))
+    temp_fd, temp_path = tempfile.mkstemp(suffix=f'{ext}.part', dir=dest_dir)
+    try:
+        digest = hashlib.sha256()
+        size = 0
+        with os.fdopen(temp_fd, 'wb') as temp_file:
+            while True:
+                chunk = file_stream.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    result['error'] = f'El archivo excede el tamaño máximo de {max_size_mb}MB'
+                    return result
+                digest.update(chunk)
+                temp_file.write(chunk)
+        
+        result['size'] = size
+        result['sha256'] = digest.hexdigest()
+        stored = _store_audio(temp_path, dest_dir, original_filename, result)
+        temp_path = None
+        return stored
+    
+    except OSError as e:
+        result['error'] = f'Error al guardar archivo: {str(e)}'
+        return result
+    finally:
+        if temp_path and os.path.exists(temp_path):
+            os.unlink(temp_path)
+
+def save_audio_file(file_path, dest_dir, original_filename, expected_sha256=None):
+    """
+    Guardar un audio ya ensamblado en disco (subidas reanudables): verifica
+    el hash completo, valida con mutagen y lo enlaza (hardlink) en el almacén
+    por contenido sin volver a copiarlo
+    
+    Args:
+        file_path: Archivo completo (se conserva: el llamador lo descarta
+            cuando la canción quedó guardada o el archivo fue rechazado)
+        dest_dir: Directorio final (ej: uploads/music)
+        original_filename: Nombre original para conservar la extensión
+        expected_sha256: Hash anunciado por el cliente (opcional)
+        
+    Returns:
+        dict: Igual que save_audio_upload; 'valid' False es un rechazo definitivo
+        
+    Raises:
+        OSError: Error de disco al leer o guardar (se puede reintentar)
+    """
+    result = {'valid': False, 'error': None, 'filename': None, 'path': None,
+              'size': 0, 'sha256': None, 'duplicate': False, 'reserva': None, 'metadata': {}}
+    result['size'] = os.path.getsize(file_path)
+    result['sha256'] = hash_file(file_path)
+    if expected_sha256 and result['sha256'] != expected_sha256.lower():
+        result['error'] = 'El archivo recibido no coincide con el hash anunciado'
+        return result
+    return _store_audio(file_path, dest_dir, original_filename, result, mode='link')
+
+def _store_audio(temp_path, dest_dir, original_filename, result, mode='move'):
+    """Validar con mutagen y guardar en el almacén (con mode='move' el temporal se consume)"""
+    # Validar y extraer metadata en el mismo análisis
+    try:
+        audio = MutagenFile(temp_path)
+    except Exception as e:
+        audio = None
+        logging.error(f"Error al analizar audio subido {original_filename}: {str(e)}")
+    if audio is None:
+        result['error'] = 'El archivo no es un formato de audio válido'
+        if mode == 'move' and os.path.exists(temp_path):
+            os.unlink(temp_path)
+        return result
+    
+    # Guardar por contenido: si otro docente ya subió el mismo audio se reutiliza
+    _, ext = os.path.splitext(secure_filename(original_filename))
+    filename, created, reserva = reserve_blob(temp_path, dest_dir, result['sha256'], ext, mode=mode)
+    
+    result.update({
+        'valid': True,
+        'filename': filename,
+        'path': blob_abspath(dest_dir, filename),
+        'duplicate': not created,
+        'reserva': reserva,
+        'metadata': extract_audio_metadata(audio),
+    })
+    return result
+
 def get_audio_metadata_safe(file_path):
     """
     Obtener metadata de audio de forma segura
@@ -244,15 +423,7 @@ def get_audio_metadata_safe(file_path):
     try:
         audio_file = MutagenFile(file_path)
         if audio_file is not None:
-            return {
-                'duration': int(audio_file.info.length) if hasattr(audio_file.info, 'length') else None,
-                'bitrate': getattr(audio_file.info, 'bitrate', None),
-                'sample_rate': getattr(audio_file.info, 'sample_rate', None),
-                'channels': getattr(audio_file.info, 'channels', None),
-                'title': audio_file.get('TIT2', [None])[0] if 'TIT2' in audio_file else None,
-                'artist': audio_file.get('TPE1', [None])[0] if 'TPE1' in audio_file else None,
-                'album': audio_file.get('TALB', [None])[0] if 'TALB' in audio_file else None,
-            }
+            return extract_audio_metadata(audio_file)
     except Exception as e:
         logging.error(f"Error al obtener metadata de {file_path}: {str(e)}")
     
@@ -266,10 +437,13 @@ def get_audio_metadata_safe(file_path):
         'album': None
     }
 
-def create_audio_placeholder_files():
+def create_audio_placeholder_files(upload_folder=os.path.join('static', 'uploads')):
     """
     Crear archivos placeholder para las canciones de ejemplo
     Útil para desarrollo cuando no se tienen archivos reales
+    
+    Args:
+        upload_folder: Directorio de subidas (Config.UPLOAD_FOLDER)
     """
     placeholder_files = [
         'tablas_multiplicar.mp3',
@@ -282,7 +456,7 @@ def create_audio_placeholder_files():
         'ejercicios_deportes.mp3'
     ]
     
-    music_dir = os.path.join('static', 'uploads', 'music')
+    music_dir = os.path.join(upload_folder, 'music')
     os.makedirs(music_dir, exist_ok=True)
     
     placeholder_content = b"PLACEHOLDER_AUDIO_FILE"
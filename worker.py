@@ -0,0 +1,25 @@
+"""
+Worker de trabajos multimedia para Spotify Picaflorino
+I.E. 30012 Victor Alberto Gill Mallma
+
+Procesa la cola de trabajos (portadas, derivados de audio) en un pool de
+procesos, fuera de los workers web. Uso:
+
+    python worker.py [procesos]
+"""
+
+import os
+import sys
+
+# Agregar el directorio padre al path para importar los módulos
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import app, media_jobs
+
+if __name__ == '__main__':
+    concurrencia = int(sys.argv[1]) if len(sys.argv) > 1 else app.config['MEDIA_JOBS_CONCURRENCY']
+    print(f"🎵 Spotify Picaflorino - Worker de trabajos multimedia ({concurrencia} procesos)")
+    try:
+        media_jobs.run_forever(concurrency=concurrencia)
+    except KeyboardInterrupt:
+        print("👋 Worker detenido")
@@ -0,0 +1,215 @@
+"""
+Exportación ZIP en streaming para Spotify Picaflorino
+Arma un ZIP sin compresión (STORED) a partir de archivos en disco sin
+escribir temporales: la estructura completa (cabeceras, posiciones y
+CRC) se calcula antes de enviar un byte, así que el tamaño se conoce de
+antemano y cualquier rango del archivo se puede servir de nuevo para
+reanudar una descarga. El CRC de cada audio se guarda junto al blob
+(ab/cd/<sha>.crc) para no volver a leer el archivo en cada descarga
+"""
+
+import os
+import re
+import time
+import struct
+import zlib
+import hashlib
+from bisect import bisect_right
+from collections import namedtuple
+
+# Bloque de lectura de los archivos incluidos
+ZIP_CHUNK_SIZE = 64 * 1024
+
+CRC_SUFFIX = '.crc'
+
+# Límites del formato ZIP sin extensiones ZIP64
+ZIP32_MAX_SIZE = 0xFFFFFFFF
+ZIP32_MAX_ENTRIES = 0xFFFF
+
+# Archivo del ZIP: en disco (path) o en memoria (data); crc y tamaño ya calculados
+ZipMember = namedtuple('ZipMember', ['name', 'size', 'crc', 'mtime', 'path', 'data'])
+
+_LOCAL_HEADER = '<IHHHHHIIIHH'
+_CENTRAL_HEADER = '<IHHHHHHIIIHHHHHII'
+_END_RECORD = '<IHHHHIIH'
+_UTF8_NAMES = 0x0800
+_VERSION = 20  # 2.0: suficiente para STORED
+
+_UNSAFE_NAME_RE = re.compile(r'[\x00-\x1f\\/:*?"<>|]+')
+
+
+def safe_member_name(text, fallback='sin titulo'):
+    """Texto apto como nombre de archivo dentro del ZIP (conserva acentos)"""
+    cleaned = _UNSAFE_NAME_RE.sub('_', text or '').strip(' .')
+    return cleaned[:120] or fallback
+
+
+def file_crc32(path, chunk_size=ZIP_CHUNK_SIZE):
+    """CRC-32 de un archivo leído por bloques"""
+    crc = 0
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_size), b''):
+            crc = zlib.crc32(block, crc)
+    return crc
+
+
+def crc_path(audio_path):
+    """CRC junto al blob: ab/cd/<sha>.crc"""
+    return os.path.splitext(audio_path)[0] + CRC_SUFFIX
+
+
+def read_crc32(path):
+    """CRC guardado de un audio, o None si aún no se calculó"""
+    try:
+        with open(crc_path(path), encoding='ascii') as f:
+            return int(f.read().strip(), 16)
+    except (OSError, ValueError):
+        return None
+
+
+def write_crc32(path, crc):
+    """Guardar el CRC junto al blob (escritura atómica)"""
+    target = crc_path(path)
+    tmp = f'{target}.{os.getpid()}.tmp'
+    with open(tmp, 'w', encoding='ascii') as f:
+        f.write(f'{crc:08x}\n')
+    os.replace(tmp, target)
+    return target
+
+
+def stored_crc32(path):
+    """CRC de un audio: el guardado o, si falta (audios anteriores), calcularlo y guardarlo"""
+    crc = read_crc32(path)
+    if crc is None:
+        crc = file_crc32(path)
+        write_crc32(path, crc)
+    return crc
+
+
+def remove_crc32(path):
+    try:
+        os.unlink(crc_path(path))
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def build_crc_task(payload):
+    """
+    Calcular y guardar el CRC de un blob (tarea de la cola de trabajos)
+
+    Args:
+        payload: dict con 'path' (blob de audio)
+
+    Returns:
+        dict: {'crc': CRC-32 en hexadecimal}
+    """
+    crc = file_crc32(payload['path'])
+    write_crc32(payload['path'], crc)
+    return {'crc': f'{crc:08x}'}
+
+
+def file_member(name, path, size, mtime, crc):
+    return ZipMember(name, size, crc, mtime, path, None)
+
+
+def data_member(name, data, mtime):
+    return ZipMember(name, len(data), zlib.crc32(data), mtime, None, data)
+
+
+def dos_datetime(timestamp):
+    """Fecha y hora en formato MS-DOS (UTC, para que el ZIP no dependa del servidor)"""
+    t = time.gmtime(max(timestamp or 0, 315532800))  # El formato empieza en 1980
+    return ((t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2),
+            ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday)
+
+
+class ZipLayout:
+    """
+    Estructura de un ZIP STORED como lista de trozos (bytes o rangos de archivo)
+
+    Attributes:
+        size: Tamaño total del ZIP en bytes
+        etag: Hash del directorio central (cambia con nombres, tamaños o CRC)
+    """
+
+    def __init__(self, members):
+        if len(members) >= ZIP32_MAX_ENTRIES:
+            raise ValueError('Demasiados archivos para un ZIP')
+        self._starts = []
+        self._parts = []
+        central = []
+        offset = 0
+        for member in members:
+            if offset + member.size > ZIP32_MAX_SIZE:
+                raise ValueError('El ZIP supera los 4 GB')
+            name = member.name.encode('utf-8')
+            dos_time, dos_date = dos_datetime(member.mtime)
+            local = struct.pack(_LOCAL_HEADER, 0x04034b50, _VERSION, _UTF8_NAMES, 0,
+                                dos_time, dos_date, member.crc, member.size, member.size,
+                                len(name), 0) + name
+            central.append(struct.pack(_CENTRAL_HEADER, 0x02014b50, _VERSION, _VERSION,
+                                       _UTF8_NAMES, 0, dos_time, dos_date, member.crc,
+                                       member.size, member.size, len(name), 0, 0, 0, 0,
+                                       0o100644 << 16, offset) + name)
+            offset = self._add(offset, local)
+            offset = self._add(offset, member.data if member.data is not None else (member.path, member.size))
+
+        directory = b''.join(central)
+        end = struct.pack(_END_RECORD, 0x06054b50, 0, 0, len(members), len(members),
+                          len(directory), offset, 0)
+        if offset + len(directory) > ZIP32_MAX_SIZE:
+            raise ValueError('El ZIP supera los 4 GB')
+        offset = self._add(offset, directory + end)
+        self.size = offset
+        self.etag = hashlib.sha1(directory).hexdigest()
+
+    def _add(self, offset, part):
+        length = len(part) if isinstance(part, bytes) else part[1]
+        if length:
+            self._starts.append(offset)
+            self._parts.append(part)
+        return offset + length
+
+    def iter_range(self, start, end, chunk_size=ZIP_CHUNK_SIZE):
+        """
+        Generador de los bytes [start, end] (inclusivo) del ZIP
+
+        Lee los archivos por bloques de `chunk_size`: la memoria usada no
+        depende del tamaño de la playlist.
+        """
+        index = max(bisect_right(self._starts, start) - 1, 0)
+        position = start
+        while position <= end and index < len(self._parts):
+            part_start, part = self._starts[index], self._parts[index]
+            length = len(part) if isinstance(part, bytes) else part[1]
+            first = position - part_start
+            last = min(end - part_start, length - 1)
+            if isinstance(part, bytes):
+                yield part[first:last + 1]
+            else:
+                with open(part[0], 'rb') as f:
+                    f.seek(first)
+                    remaining = last - first + 1
+                    while remaining > 0:
+                        block = f.read(min(chunk_size, remaining))
+                        if not block:
+                            raise OSError(f'{part[0]} cambió durante la descarga')
+                        remaining -= len(block)
+                        yield block
+            position = part_start + last + 1
+            index += 1
+
+
+def build_m3u(tracks):
+    """
+    Lista M3U extendida para reproductores sin conexión
+
+    Args:
+        tracks: Iterable de (duración en segundos, título, archivo)
+    """
+    lines = ['#EXTM3U', '#EXTENC:UTF-8']
+    for duration, title, name in tracks:
+        lines.append(f'#EXTINF:{int(duration or -1)},{title}')
+        lines.append(name)
+    return '\n'.join(lines) + '\n'